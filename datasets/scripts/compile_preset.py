@@ -0,0 +1,37 @@
+import argparse
+import os
+
+from dice_datasets import CompiledPreset
+from rich.console import Console
+from rich.table import Table
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description="Compile an augmentation preset and report its expected densities")
+    parser.add_argument('--augmentation_preset', type=str, required=True,
+                        help='Selected augmentation preset')
+    return parser.parse_args()
+
+
+def get_preset_path(preset):
+    return os.path.join("presets", preset + ".json")
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    compiled = CompiledPreset.from_json(
+        get_preset_path(args.augmentation_preset))
+
+    table = Table(title=f"Preset {args.augmentation_preset}")
+    for column in ["label", "clusters", "merged_duplicates", "expected_density", "expected_onsets"]:
+        table.add_column(column)
+    for row in compiled.report():
+        table.add_row(*[str(value) for value in row.values()])
+
+    console = Console()
+    console.print(table)
+
+    polyphony = compiled.expected_polyphony()
+    console.print(f"Expected polyphony per step: mean {polyphony.mean():.2f}, "
+                  f"max {polyphony.max():.2f} (limit {compiled.max_polyphony})")
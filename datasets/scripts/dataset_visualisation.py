@@ -1,36 +1,68 @@
 import argparse
 import os
-import torch
 import matplotlib.pyplot as plt
+import numpy as np
 from matplotlib.widgets import Slider
-from dice_datasets import PatternDataset
-import pandas as pd
-import seaborn as sns
+from dice_datasets import DatasetStatistics, PackedPatternDataset, RandomPatternConfig, load_statistics
 
 
 def parse_args():
     parser = argparse.ArgumentParser(description="Process some inputs.")
     parser.add_argument('--dataset', type=str, required=True,
                         help='Selected pattern dataset')
-    args = parser.parse_args()
-    return args.dataset
+    parser.add_argument('--augmentation_preset', type=str, default=None,
+                        help='Preset holding the polyphony limits, defaults to the one the dataset was built with')
+    return parser.parse_args()
 
 
-def create_pattern_visualization_with_slider(dataset: PatternDataset):
-    ax_pattern = plt.axes([0.15, 0.15, 0.7, 0.8])
+def draw_statistics(statistics: DatasetStatistics, axes):
+    ax_density, ax_polyphony, ax_full, ax_cooccurrence = axes
+    num_sequences = len(statistics.labels)
+
+    ax_density.imshow(statistics.onset_density(), cmap="GnBu", aspect="auto")
+    ax_density.set_yticks(range(num_sequences), statistics.labels)
+    ax_density.set_title(f"Onset density ({statistics.count} patterns)")
+
+    ax_polyphony.bar(range(len(statistics.polyphony_histogram)),
+                     statistics.polyphony_histogram)
+    ax_polyphony.axvline(statistics.max_polyphony + 0.5, color="red")
+    ax_polyphony.set_title("Polyphony per step")
+
+    ax_full.bar(range(len(statistics.full_polyphony_histogram)),
+                statistics.full_polyphony_histogram)
+    ax_full.axvline(
+        statistics.max_num_events_with_full_polyphony + 0.5, color="red")
+    ax_full.set_title(
+        f"Full polyphony events, {statistics.over_full_polyphony_limit()} over the limit")
+
+    ax_cooccurrence.imshow(np.log1p(statistics.cooccurrence), cmap="GnBu")
+    ax_cooccurrence.set_xticks(
+        range(num_sequences), statistics.labels, rotation=90)
+    ax_cooccurrence.set_yticks(range(num_sequences), statistics.labels)
+    ax_cooccurrence.set_title("Label co-occurrence (log)")
+
+
+def create_pattern_visualization_with_slider(dataset: PackedPatternDataset, statistics: DatasetStatistics):
+    figure, axes = plt.subplots(2, 3, figsize=(16, 9))
+    draw_statistics(statistics, [axes[0, 0], axes[0, 1],
+                                 axes[1, 1], axes[0, 2]])
+    axes[1, 2].axis("off")
+
+    # Pattern tile, only its image data changes when the slider moves
+    ax_pattern = axes[1, 0]
+    image = ax_pattern.imshow(dataset.get_triggers(0), cmap="GnBu", vmin=0, vmax=1,
+                              aspect="auto")
+    ax_pattern.set_yticks(range(len(dataset.labels)), dataset.labels)
+    ax_pattern.set_title("Pattern 0")
 
     def update_visualization(index):
         index = int(index)
-        pattern = dataset.get_pattern(index)
-        df = pd.DataFrame(pattern.get_triggers())
-        df.index = pattern.get_labels()
-        sns.heatmap(df, cmap="GnBu", cbar=False, ax=ax_pattern)
-
-    # Initialize the first visualization
-    update_visualization(0)
+        image.set_data(dataset.get_triggers(index))
+        ax_pattern.set_title(f"Pattern {index}")
+        figure.canvas.draw_idle()
 
     # Add a slider for selecting patterns
-    ax_slider = plt.axes([0.2, 0.02, 0.65, 0.03],
+    ax_slider = plt.axes([0.2, 0.01, 0.65, 0.02],
                          facecolor='lightgoldenrodyellow')
     slider = Slider(ax_slider, 'Pattern', 0, len(
         dataset) - 1, valinit=0, valstep=1)
@@ -42,15 +74,24 @@ def create_pattern_visualization_with_slider(dataset: PatternDataset):
 
 
 if __name__ == "__main__":
-    dataset_name = parse_args()
+    args = parse_args()
+    dataset_name = args.dataset
 
     script_dir = os.path.dirname(os.path.abspath(__file__))
     workspace_folder = os.path.abspath(os.path.join(script_dir, "..", ".."))
 
-    dist_folder = os.path.join(workspace_folder, "dist", "datasets")
-    os.makedirs(dist_folder, exist_ok=True)
+    dist_folder = os.path.join(workspace_folder, "dist", dataset_name)
+
+    source_path = os.path.join(dist_folder, dataset_name)
+    dataset = PackedPatternDataset(source_path)
+
+    preset = args.augmentation_preset or dataset.metadata.get(
+        "augmentation_preset", "default")
+    config = RandomPatternConfig.from_json(
+        os.path.join(script_dir, "..", "presets", preset + ".json"))
 
-    source_path = os.path.join(dist_folder, dataset_name + ".pt")
-    dataset: PatternDataset = torch.load(source_path, weights_only=False)
+    # Computed in one pass on the first run, then read from <dataset>.stats.npz
+    statistics = load_statistics(
+        dataset, config.max_polyphony, config.max_num_events_with_full_polyphony)
 
-    create_pattern_visualization_with_slider(dataset)
+    create_pattern_visualization_with_slider(dataset, statistics)
@@ -1,10 +1,13 @@
 import argparse
+import json
+import numpy as np
 import os
-import torch
 
-from dice_datasets import PatternDataset, Pattern, RandomPatternConfig
-from concurrent.futures import ThreadPoolExecutor, as_completed
-from queue import Queue
+from dice_datasets import BatchPatternSampler, CompiledPreset, Pattern, PatternDeduplicator, PatternShard, \
+    SamplingStrategy, hash_packed, pack_triggers, pattern_generators, save_packed_dataset
+from dice_datasets.dedup import DEDUP_REPORT_SUFFIX, HASHES_SUFFIX
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from functools import partial
 from rich.progress import Progress, Live, BarColumn, TimeElapsedColumn, TaskProgressColumn
 
 
@@ -13,8 +16,11 @@ def parse_args():
     parser.add_argument('--id', type=str, required=True,
                         help='Selected folder containing patterns in JSON format')
 
-    parser.add_argument('--json', type=str, required=True,
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument('--json', type=str,
                         help='Selected folder containing patterns in JSON format')
+    source.add_argument('--shard', type=str,
+                        help='Selected shard file written by midi_to_json.py --shard')
 
     parser.add_argument('--augmentation_factor', type=str, required=True,
                         help='Increase size of the pattern dataset by a selected factor using random preset')
@@ -22,21 +28,121 @@ def parse_args():
     parser.add_argument('--augmentation_preset', type=str, required=True,
                         help='Selected augmentation preset')
 
-    args = parser.parse_args()
-    return args.json, int(args.augmentation_factor), args.augmentation_preset, args.id
+    parser.add_argument('--workers', type=int, default=None,
+                        help='Number of worker processes, defaults to CPU count (0 runs in-process)')
 
+    parser.add_argument('--chunk_size', type=int, default=64,
+                        help='Number of base patterns handled by each worker task')
 
-def create_dataset(json_folder_path, augmentation_factor, augmentation_preset_path):
-    patterns = Queue()
-    config = RandomPatternConfig.from_json(augmentation_preset_path)
+    parser.add_argument('--seed', type=int, default=0,
+                        help='Dataset seed, each pattern draws from a generator seeded by it and the pattern index')
 
-    json_files = [
-        f for f in os.listdir(json_folder_path) if f.endswith(".json")
-    ]
+    parser.add_argument('--sampling', type=str, default=SamplingStrategy.REJECTION.value,
+                        choices=[strategy.value for strategy in SamplingStrategy],
+                        help='Augmentation strategy: rejection stops a pattern at its first row breaking the '
+                             'polyphony limits, constrained only draws rows keeping the pattern valid')
+    parser.add_argument('--dedup', action='store_true',
+                        help='Report duplicate patterns per source file and save a content-hash index')
+
+    parser.add_argument('--max_copies', type=int, default=None,
+                        help='Keep at most this many copies of each distinct pattern (implies --dedup)')
+
+    parser.add_argument('--planes', type=str, nargs='*', default=[],
+                        choices=["velocity", "duration", "swing"],
+                        help='Extra planes stored next to the triggers for multi-channel training')
+
+    return parser.parse_args()
+
+
+# Plane values given to the triggers added by augmentation
+AUGMENTED_PLANE_VALUES = {"velocity": 100, "duration": 1, "swing": 0.0}
+
+
+_worker_sampler: BatchPatternSampler = None
+
+
+def init_worker(augmentation_preset_path, sampling=SamplingStrategy.REJECTION.value):
+    # Compiled preset tables are loaded from their cache once per worker process
+    global _worker_sampler
+    _worker_sampler = BatchPatternSampler(
+        CompiledPreset.from_json(augmentation_preset_path), SamplingStrategy(sampling))
+
+
+def augment_chunk(bases, augmentation_factor, seed=0, start=0):
+    """
+    Returns each base pattern followed by its augmented copies as a compact uint8 array
+    [n * (1 + augmentation_factor), sequences, steps]. start is the index of the first
+    base in the dataset, copies are seeded from their own index in the output.
+    """
+    if not augmentation_factor:
+        return bases
+
+    n, num_sequences, num_steps = bases.shape
+    copies_per_base = 1 + augmentation_factor
+    indices = [(start + i) * copies_per_base + 1 + j
+               for i in range(n) for j in range(augmentation_factor)]
+    copies = _worker_sampler.fill_empty_sequences(
+        np.repeat(bases, augmentation_factor, axis=0), pattern_generators(seed, indices))
+    copies = copies.reshape(n, augmentation_factor, num_sequences, num_steps)
+    return np.concatenate([bases[:, None], copies], axis=1).reshape(-1, num_sequences, num_steps)
+
+
+def read_planes(dict_obj, labels, plane_names):
+    # {plane: [sequences, steps]} arrays of a JSON pattern written by midi_to_json.py
+    return {name: np.array([dict_obj[name][label] for label in labels])
+            for name in plane_names}
+
+
+def load_chunk(json_folder_path, file_names, augmentation_factor, seed=0, start=0, plane_names=()):
+    """
+    Parses each JSON file once and augments it, returning the patterns with the labels
+    of each file and the requested planes of the base patterns.
+    """
+    dict_objs = []
+    for file_name in file_names:
+        with open(os.path.join(json_folder_path, file_name), 'r') as file:
+            dict_objs.append(json.load(file))
+
+    patterns = [Pattern.from_dictionary(dict_obj) for dict_obj in dict_objs]
+    labels = [pattern.get_labels() for pattern in patterns]
+    bases = np.stack([pattern.get_trigger_array() for pattern in patterns])
+    planes = [read_planes(dict_obj, file_labels, plane_names)
+              for dict_obj, file_labels in zip(dict_objs, labels)]
+    base_planes = {name: np.stack([p[name] for p in planes])
+                   for name in plane_names}
+
+    return augment_chunk(bases, augmentation_factor, seed, start), labels, bases, base_planes
+
+
+def expand_planes(base_triggers, base_planes, triggers, augmentation_factor):
+    """
+    Repeats the planes of each base pattern over its augmented copies, the triggers
+    added by augmentation get AUGMENTED_PLANE_VALUES.
+    """
+    copies_per_base = 1 + (augmentation_factor or 0)
+    added = (triggers > 0) & ~(np.repeat(base_triggers, copies_per_base, axis=0) > 0)
 
-    total = len(json_files)
-    if augmentation_factor is not None:
-        total = total * augmentation_factor
+    planes = {}
+    for name, plane in base_planes.items():
+        plane = np.repeat(plane, copies_per_base, axis=0)
+        plane[added] = AUGMENTED_PLANE_VALUES[name]
+        planes[name] = plane
+    return planes
+
+
+def chunked(items, chunk_size):
+    # (index of the first item, items) pairs
+    return [(i, items[i:i + chunk_size]) for i in range(0, len(items), chunk_size)]
+
+
+def run_tasks(task, chunks, augmentation_factor, augmentation_preset_path, workers=None, seed=0,
+              sampling=SamplingStrategy.REJECTION.value):
+    """
+    Runs task(chunk, augmentation_factor, seed, start) for every chunk on a process pool
+    and returns the results in chunk order. Results only depend on the seed and chunk
+    positions, not on the number of workers.
+    """
+    copies_per_base = 1 + (augmentation_factor or 0)
 
     progress = Progress(
         "[progress.description]{task.description}",
@@ -45,38 +151,103 @@ def create_dataset(json_folder_path, augmentation_factor, augmentation_preset_pa
         TimeElapsedColumn(),
     )
 
+    results = [None] * len(chunks)
     with Live(progress, refresh_per_second=10):
         task_id = progress.add_task(
-            "[cyan]Generating Patterns...", total=total)
+            "[cyan]Generating Patterns...", total=sum(len(chunk) for _, chunk in chunks) * copies_per_base)
+
+        if workers == 0:
+            # Run in-process, useful for debugging and profiling
+            init_worker(augmentation_preset_path, sampling)
+            for i, (start, chunk) in enumerate(chunks):
+                results[i] = task(chunk, augmentation_factor, seed, start)
+                progress.update(task_id, advance=len(chunk) * copies_per_base)
+        else:
+            with ProcessPoolExecutor(workers, initializer=init_worker,
+                                     initargs=(augmentation_preset_path, sampling)) as executor:
+                futures = {
+                    executor.submit(task, chunk, augmentation_factor, seed, start): i
+                    for i, (start, chunk) in enumerate(chunks)
+                }
+                for future in as_completed(futures):
+                    i = futures[future]
+                    results[i] = future.result()
+                    progress.update(
+                        task_id, advance=len(chunks[i][1]) * copies_per_base)
+
+    return results
+
+
+def create_dataset(json_folder_path, augmentation_factor, augmentation_preset_path, workers=None, chunk_size=64,
+                   plane_names=(), seed=0, sampling=SamplingStrategy.REJECTION.value):
+    json_files = sorted(
+        f for f in os.listdir(json_folder_path) if f.endswith(".json")
+    )
+    task = partial(load_chunk, json_folder_path, plane_names=plane_names)
+    results = run_tasks(task, chunked(json_files, chunk_size),
+                        augmentation_factor, augmentation_preset_path, workers, seed, sampling)
 
-        def load_pattern(file_name):
-            path = os.path.join(json_folder_path, file_name)
-            pattern = Pattern.from_json(path)
-            progress.update(task_id, advance=1)
-            return pattern
+    labels = results[0][1][0] if results else []
+    if any(file_labels != labels for _, chunk_labels, _, _ in results for file_labels in chunk_labels):
+        raise ValueError("All JSON patterns must share the same labels")
 
-        def load_and_modify_pattern(file_name):
-            path = os.path.join(json_folder_path, file_name)
-            pattern = Pattern.from_json(path)
-            pattern.fill_empty_sequences_with_random(config)
-            progress.update(task_id, advance=1)
-            return pattern
+    if not results:
+        empty = np.zeros((0, len(labels), 16), dtype=np.uint8)
+        return empty, labels, np.zeros(0, dtype=np.uint32), json_files, \
+            {name: empty for name in plane_names}
 
-        with ThreadPoolExecutor(10) as executor:
-            futures = []
-            for filename in json_files:
-                futures.append(executor.submit(load_pattern, f"{filename}"))
+    triggers = np.concatenate([chunk_triggers for chunk_triggers, _, _, _ in results])
+    sources = np.repeat(np.arange(len(json_files), dtype=np.uint32),
+                        1 + (augmentation_factor or 0))
+    planes = expand_planes(
+        np.concatenate([bases for _, _, bases, _ in results]),
+        {name: np.concatenate([base_planes[name] for _, _, _, base_planes in results])
+         for name in plane_names},
+        triggers, augmentation_factor)
 
-                if augmentation_factor is not None:
-                    for _ in range(augmentation_factor):
-                        futures.append(executor.submit(
-                            load_and_modify_pattern, f"{filename}"))
+    return triggers, labels, sources, json_files, planes
 
-        for future in as_completed(futures):
-            pattern = future.result()
-            patterns.put(pattern)
 
-    return PatternDataset(list(patterns.queue))
+def create_dataset_from_shard(shard_path, augmentation_factor, augmentation_preset_path, workers=None, chunk_size=64,
+                              plane_names=(), seed=0, sampling=SamplingStrategy.REJECTION.value):
+    shard = PatternShard.load(shard_path)
+    chunks = chunked(shard.triggers, chunk_size)
+    results = run_tasks(augment_chunk, chunks, augmentation_factor,
+                        augmentation_preset_path, workers, seed, sampling)
+
+    triggers = np.concatenate(results) if results \
+        else np.zeros((0, len(shard.labels), 16), dtype=np.uint8)
+    bar_sources, files = shard.get_sources()
+    sources = np.repeat(bar_sources, 1 + (augmentation_factor or 0))
+    planes = expand_planes(
+        shard.triggers, {name: getattr(shard, name) for name in plane_names},
+        triggers, augmentation_factor)
+
+    return triggers, shard.labels, sources, files, planes
+
+
+def base_mask(num_patterns, augmentation_factor):
+    # Each base pattern is followed by its augmented copies
+    copies_per_base = 1 + (augmentation_factor or 0)
+    return np.arange(num_patterns) % copies_per_base == 0
+
+
+def deduplicate(triggers, sources, planes, bases, max_copies=None, chunk_size=1 << 16):
+    """
+    Streams the dataset through a PatternDeduplicator in chunks, dropping the copies
+    beyond max_copies. Returns the kept patterns, sources, planes and base mask with the
+    deduplicator.
+    """
+    deduplicator = PatternDeduplicator(max_copies)
+    keep = np.concatenate([
+        deduplicator.update(pack_triggers(triggers[i:i + chunk_size]), sources[i:i + chunk_size])
+        for i in range(0, len(triggers), chunk_size)
+    ]) if len(triggers) else np.zeros(0, dtype=bool)
+
+    if keep.all():
+        return triggers, sources, planes, bases, deduplicator
+    return triggers[keep], sources[keep], {name: plane[keep] for name, plane in planes.items()}, \
+        bases[keep], deduplicator
 
 
 def get_preset_path(preset):
@@ -93,10 +264,44 @@ def get_dist_path(id):
 
 
 if __name__ == "__main__":
-    json_folder, factor, preset, id = parse_args()
-    dataset = create_dataset(json_folder, factor, get_preset_path(preset))
+    args = parse_args()
+    id = args.id
+
+    # Compiles the preset once, workers then read the cached tables
+    CompiledPreset.from_json(get_preset_path(args.augmentation_preset))
+
+    build = create_dataset_from_shard if args.shard else create_dataset
+    triggers, labels, sources, files, planes = build(
+        args.shard or args.json,
+        int(args.augmentation_factor),
+        get_preset_path(args.augmentation_preset),
+        workers=args.workers,
+        chunk_size=args.chunk_size,
+        plane_names=args.planes,
+        seed=args.seed,
+        sampling=args.sampling)
 
     os.makedirs(get_dist_path(id), exist_ok=True)
-    destination_path = os.path.join(get_dist_path(id), id + ".pt")
+    destination_path = os.path.join(get_dist_path(id), id)
+
+    bases = base_mask(len(triggers), int(args.augmentation_factor))
+    if args.dedup or args.max_copies:
+        triggers, sources, planes, bases, deduplicator = deduplicate(
+            triggers, sources, planes, bases, args.max_copies)
+        report = deduplicator.report(files)
+        with open(destination_path + DEDUP_REPORT_SUFFIX, "w") as file:
+            json.dump(report, file, indent=2)
+        np.save(destination_path + HASHES_SUFFIX,
+                hash_packed(pack_triggers(triggers)))
+        print(f"{report['duplicates']}/{report['patterns']} duplicate patterns "
+              f"({report['duplicate_ratio']:.1%}), {report['unique']} unique, {report['kept']} kept")
 
-    torch.save(dataset, destination_path)
+    save_packed_dataset(
+        destination_path, triggers, labels, sources=sources, files=files, planes=planes, bases=bases,
+        metadata={
+            "augmentation_preset": args.augmentation_preset,
+            "augmentation_factor": int(args.augmentation_factor),
+            "seed": args.seed,
+            "sampling": args.sampling,
+            "max_copies": args.max_copies,
+        })
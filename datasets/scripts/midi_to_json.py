@@ -1,6 +1,11 @@
+import hashlib
 import os
 import json
 import mido
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import nullcontext
+from dice_datasets import PatternShard, PatternShardBuffer
 from mido import MidiFile
 
 
@@ -10,13 +15,25 @@ LABELS = ["SAMPLE4", "SAMPLE3", "SAMPLE2", "SAMPLE1", "CB", "CY", "OH", "CH", "H
 MIDI_NOTES = [51, 49, 48, 47, 45, 44, 46, 42, 50,
               43, 41, 39, 37, 38, 40, 36]
 
+# Kept without a .json suffix so that dataset generation does not pick it up
+MANIFEST_FILE = ".manifest"
 
-def create_empty_matrix(length=128):
+
+# Row of each MIDI note in the matrices, -1 for notes outside the drum map
+NOTE_TO_ROW = np.full(128, -1, dtype=np.int16)
+NOTE_TO_ROW[MIDI_NOTES] = np.arange(len(MIDI_NOTES))
+
+NUM_STEPS = 128
+STEPS_PER_BAR = 16
+
+
+def create_empty_matrix(length=NUM_STEPS):
+    shape = (len(LABELS), length)
     return (
-        {label: [0] * length for label in LABELS},
-        {label: [0] * length for label in LABELS},
-        {label: [0] * length for label in LABELS},
-        {label: [0.0] * length for label in LABELS},
+        np.zeros(shape, dtype=np.uint8),
+        np.zeros(shape, dtype=np.uint8),
+        np.zeros(shape, dtype=np.uint8),
+        np.zeros(shape, dtype=np.float64),
     )
 
 
@@ -27,14 +44,16 @@ def extract_genre(filename):
     return "unknown"
 
 
-def is_section_nonzero(pattern, start, end):
-    for label in LABELS:
-        if any(pattern[label][start:end]):
-            return True
-    return False
+def split_bars(matrix):
+    # [labels, 128] -> [bars, labels, 16] view
+    return matrix.reshape(len(LABELS), -1, STEPS_PER_BAR).transpose(1, 0, 2)
 
 
 def parse_midi_to_full_matrix(filepath):
+    """
+    Parses a MIDI file into [labels, 128] trigger, velocity, duration and swing matrices.
+    Note events are collected into arrays, then quantized with vectorized operations.
+    """
     midi = MidiFile(filepath)
     bpm = 120
     ticks_per_beat = midi.ticks_per_beat
@@ -47,7 +66,7 @@ def parse_midi_to_full_matrix(filepath):
 
     ticks_per_sixteenth = ticks_per_beat // 4
 
-    notes = []
+    notes, starts, ends, velocities = [], [], [], []
     for track in midi.tracks:
         abs_time = 0
         ongoing_notes = {}
@@ -57,108 +76,251 @@ def parse_midi_to_full_matrix(filepath):
                 ongoing_notes[msg.note] = (abs_time, msg.velocity)
             elif (msg.type == 'note_off' or (msg.type == 'note_on' and msg.velocity == 0)) and msg.note in ongoing_notes:
                 start_time, velocity = ongoing_notes.pop(msg.note)
-                notes.append({
-                    "note": msg.note,
-                    "start": start_time,
-                    "end": abs_time,
-                    "velocity": velocity
-                })
-
-    # Matrices
-    pattern, velocity_mat, duration_mat, swing_mat = create_empty_matrix(128)
-
-    for note in notes:
-        if note["note"] not in MIDI_NOTES:
-            continue
-
-        label = LABELS[MIDI_NOTES.index(note["note"])]
-
-        # Evaluate pre-quantization values
-        raw_start = note["start"]
-        raw_end = note["end"]
-        velocity = note["velocity"]
-
-        # Compute swing from ideal step before quantization
-        step_float = raw_start / ticks_per_sixteenth
-        quantized_step = int(step_float)
-        if not (0 <= quantized_step < 128):
-            continue  # skip if out of range
-
-        ideal_tick = quantized_step * ticks_per_sixteenth
-        swing_offset = (raw_start - ideal_tick) / ticks_per_sixteenth
-        swing_offset = round(swing_offset, 4)
-
-        # Quantize start and duration
-        quantized_end_step = int(raw_end / ticks_per_sixteenth)
-        quantized_duration = quantized_end_step - quantized_step
-        quantized_duration = max(1, min(quantized_duration, 15))  # Clamp
-
-        # Save into matrices
-        pattern[label][quantized_step] = 1
-        velocity_mat[label][quantized_step] = velocity
-        duration_mat[label][quantized_step] = quantized_duration
-        swing_mat[label][quantized_step] = swing_offset
+                notes.append(msg.note)
+                starts.append(start_time)
+                ends.append(abs_time)
+                velocities.append(velocity)
+
+    notes = np.array(notes, dtype=np.int64)
+    starts = np.array(starts, dtype=np.int64)
+    ends = np.array(ends, dtype=np.int64)
+    velocities = np.array(velocities, dtype=np.uint8)
+
+    # Quantize start and compute swing from ideal step before quantization
+    rows = NOTE_TO_ROW[notes]
+    steps = starts // ticks_per_sixteenth
+    keep = (rows >= 0) & (steps < NUM_STEPS)
+
+    rows, steps = rows[keep], steps[keep]
+    swing_offsets = np.round(
+        (starts[keep] - steps * ticks_per_sixteenth) / ticks_per_sixteenth, 4)
+    durations = np.clip(ends[keep] // ticks_per_sixteenth - steps, 1, 15)
+
+    # Matrices, later notes on the same cell overwrite earlier ones
+    pattern, velocity_mat, duration_mat, swing_mat = create_empty_matrix()
+    pattern[rows, steps] = 1
+    velocity_mat[rows, steps] = velocities[keep]
+    duration_mat[rows, steps] = durations
+    swing_mat[rows, steps] = swing_offsets
 
     return pattern, velocity_mat, duration_mat, swing_mat, bpm
 
 
-def export_sliced_bars(filepath, output_dir):
+def extract_sliced_bars(filepath):
+    """
+    Parses a MIDI file and returns the non-empty 16-step bars as JSON-ready dictionaries.
+    """
     filename = os.path.basename(filepath)
     genre = extract_genre(filename)
 
     pattern, velocity, duration, swing, bpm = parse_midi_to_full_matrix(
         filepath)
+    planes = [split_bars(matrix)
+              for matrix in (pattern, velocity, duration, swing)]
 
-    for bar_index in range(8):
-        start = bar_index * 16
-        end = start + 16
+    bars = []
+    for bar_index in np.flatnonzero(planes[0].any(axis=(1, 2))):
+        sliced_pattern, sliced_velocity, sliced_duration, sliced_swing = [
+            dict(zip(LABELS, plane[bar_index].tolist())) for plane in planes]
 
-        if not is_section_nonzero(pattern, start, end):
-            continue
-
-        sliced_pattern = {label: pattern[label][start:end] for label in LABELS}
-        sliced_velocity = {
-            label: velocity[label][start:end] for label in LABELS}
-        sliced_duration = {
-            label: duration[label][start:end] for label in LABELS}
-        sliced_swing = {label: swing[label][start:end] for label in LABELS}
-
-        output_data = {
+        bars.append({
             "file": filename,
-            "bar_index": bar_index,
+            "bar_index": int(bar_index),
             "bpm": bpm,
             "genre": genre,
             "triggers": sliced_pattern,
             "velocity": sliced_velocity,
             "duration": sliced_duration,
             "swing": sliced_swing
-        }
+        })
 
-        out_name = f"{genre}_{os.path.splitext(filename)[0]}_bar{bar_index}.json"
-        out_path = os.path.join(output_dir, out_name)
-        print(f"Exporting: {out_path}")
-        with open(out_path, "w") as f:
-            json.dump(output_data, f, indent=2)
+    return bars
 
 
-def process_directory(root_dir, output_dir):
-    os.makedirs(output_dir, exist_ok=True)
+def try_extract_sliced_bars(filepath):
+    """
+    Like extract_sliced_bars, but returns (bars, None) or (None, error) so that one unreadable
+    file does not stop a whole run.
+    """
+    try:
+        return extract_sliced_bars(filepath), None
+    except Exception as e:
+        return None, f"{type(e).__name__}: {e}"
+
+
+def extract_bar_shard(filepath):
+    """
+    Parses a MIDI file straight into a PatternShard holding its non-empty 16-step bars.
+    """
+    filename = os.path.basename(filepath)
+    genre = extract_genre(filename)
+
+    pattern, velocity, duration, swing, bpm = parse_midi_to_full_matrix(
+        filepath)
+
+    bars = np.flatnonzero(split_bars(pattern).any(axis=(1, 2)))
+
+    return PatternShard(
+        labels=LABELS,
+        triggers=split_bars(pattern)[bars],
+        velocity=split_bars(velocity)[bars],
+        duration=split_bars(duration)[bars],
+        swing=split_bars(swing)[bars].astype(np.float32),
+        filename=np.array([filename] * len(bars)),
+        bar_index=bars.astype(np.int16),
+        bpm=np.full(len(bars), bpm, dtype=np.int16),
+        genre=np.array([genre] * len(bars)),
+    )
+
+
+def process_directory_to_shard(root_dir, shard_path, workers=None):
+    """
+    Streams a MIDI tree into a single columnar shard file, without per-bar JSON files.
+    Per-file shards are copied into growing column buffers as they arrive.
+    """
+    paths = find_midi_files(root_dir)
+    buffer = PatternShardBuffer(LABELS)
+
+    with ProcessPoolExecutor(workers) if workers != 0 else nullcontext() as executor:
+        if executor is None:
+            shards = map(extract_bar_shard, paths)
+        else:
+            shards = executor.map(extract_bar_shard, paths, chunksize=16)
+
+        for shard in shards:
+            buffer.append(shard)
+
+    buffer.to_shard().save(shard_path)
+    return len(buffer)
+
+
+def file_digest(filepath):
+    digest = hashlib.sha1()
+    with open(filepath, "rb") as f:
+        for block in iter(lambda: f.read(1 << 16), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def load_manifest(output_dir):
+    path = os.path.join(output_dir, MANIFEST_FILE)
+    if not os.path.exists(path):
+        return {"next_id": 0, "files": {}}
+    with open(path, "r") as f:
+        return json.load(f)
+
+
+def save_manifest(output_dir, manifest):
+    # Write then rename, so an interrupted run never leaves a truncated manifest
+    path = os.path.join(output_dir, MANIFEST_FILE)
+    with open(path + ".tmp", "w") as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(path + ".tmp", path)
+
+
+def find_midi_files(root_dir):
+    midi_files = []
     for root, _, files in os.walk(root_dir):
         for file in files:
             if file.lower().endswith('.mid'):
-                midi_path = os.path.join(root, file)
-                export_sliced_bars(midi_path, output_dir)
+                midi_files.append(os.path.join(root, file))
+    return sorted(midi_files)
+
+
+def find_changed_files(root_dir, manifest):
+    """
+    Returns the MIDI files that are new or changed since the manifest was written, with their
+    stat and hash. Files whose size and mtime are unchanged are not read at all.
+    """
+    changed = []
+    for midi_path in find_midi_files(root_dir):
+        key = os.path.relpath(midi_path, root_dir)
+        stat = os.stat(midi_path)
+        entry = manifest["files"].get(key)
+
+        if entry and entry["size"] == stat.st_size and entry["mtime_ns"] == stat.st_mtime_ns:
+            continue
 
+        digest = file_digest(midi_path)
+        if entry and entry["sha1"] == digest:
+            # Touched but identical, only refresh the stat
+            entry.update(size=stat.st_size, mtime_ns=stat.st_mtime_ns)
+            continue
 
-def rename_json_files_sequentially(output_dir):
-    files = [f for f in os.listdir(output_dir) if f.endswith(".json")]
-    files.sort()
+        changed.append((key, midi_path, stat, digest))
+    return changed
 
-    for i, file in enumerate(files):
-        old_path = os.path.join(output_dir, file)
-        new_name = f"DICE_{i:04d}.json"
-        new_path = os.path.join(output_dir, new_name)
-        os.rename(old_path, new_path)
+
+def remove_outputs(output_dir, names):
+    for name in names:
+        path = os.path.join(output_dir, name)
+        if os.path.exists(path):
+            os.remove(path)
+
+
+def process_directory(root_dir, output_dir, workers=None):
+    """
+    Incrementally converts a MIDI tree into per-bar JSON files. A manifest keyed by MIDI path
+    records size, mtime, hash and output names, so re-runs only parse new or changed files,
+    and each file keeps its DICE_XXXX output IDs across runs. Files that fail to parse are
+    logged and recorded with their error, and are retried once they change.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    manifest = load_manifest(output_dir)
+
+    # Forget files removed from the tree, their IDs are not reused
+    present = {os.path.relpath(path, root_dir)
+               for path in find_midi_files(root_dir)}
+    for key in [key for key in manifest["files"] if key not in present]:
+        remove_outputs(output_dir, manifest["files"].pop(key)["outputs"])
+
+    changed = find_changed_files(root_dir, manifest)
+    paths = [midi_path for _, midi_path, _, _ in changed]
+
+    with ProcessPoolExecutor(workers) if workers != 0 else nullcontext() as executor:
+        if executor is None:
+            results = map(try_extract_sliced_bars, paths)
+        else:
+            results = executor.map(try_extract_sliced_bars, paths, chunksize=16)
+
+        for (key, midi_path, stat, digest), (bars, error) in zip(changed, results):
+            entry = manifest["files"].get(key, {"outputs": []})
+            old_outputs = entry["outputs"]
+
+            if error is not None:
+                # Recorded with its stat and hash, so it is skipped until the file changes
+                remove_outputs(output_dir, old_outputs)
+                manifest["files"][key] = {
+                    "size": stat.st_size,
+                    "mtime_ns": stat.st_mtime_ns,
+                    "sha1": digest,
+                    "outputs": [],
+                    "error": error,
+                }
+                print(f"Failed to parse {midi_path}: {error}")
+                continue
+
+            # Reuse previous IDs first, then allocate new ones
+            outputs = old_outputs[:len(bars)]
+            while len(outputs) < len(bars):
+                outputs.append(f"DICE_{manifest['next_id']:04d}.json")
+                manifest["next_id"] += 1
+            remove_outputs(output_dir, old_outputs[len(bars):])
+
+            for name, bar in zip(outputs, bars):
+                with open(os.path.join(output_dir, name), "w") as f:
+                    json.dump(bar, f)
+
+            manifest["files"][key] = {
+                "size": stat.st_size,
+                "mtime_ns": stat.st_mtime_ns,
+                "sha1": digest,
+                "outputs": outputs,
+            }
+            print(f"Exported {len(bars)} bars from {midi_path}")
+
+    save_manifest(output_dir, manifest)
+    return len(changed)
 
 
 if __name__ == "__main__":
@@ -169,9 +331,18 @@ if __name__ == "__main__":
     parser.add_argument("directory", help="Directory containing MIDI files")
     parser.add_argument("-o", "--output", default="json",
                         help="Output directory for JSON files")
+    parser.add_argument("-w", "--workers", type=int, default=None,
+                        help="Number of worker processes, defaults to CPU count (0 runs in-process)")
+    parser.add_argument("-s", "--shard", default=None,
+                        help="Write all bars into a single packed shard file instead of JSON files")
     args = parser.parse_args()
 
-    process_directory(args.directory, args.output)
-    rename_json_files_sequentially(args.output)
-
-    print(f"Finished processing. Output in: {args.output}")
+    if args.shard:
+        bars = process_directory_to_shard(
+            args.directory, args.shard, args.workers)
+        print(f"Finished processing {bars} bars. Output in: {args.shard}")
+    else:
+        processed = process_directory(
+            args.directory, args.output, args.workers)
+        print(
+            f"Finished processing {processed} new or changed files. Output in: {args.output}")
@@ -1,6 +1,18 @@
 from .dataset import PatternDataset
+from .dedup import PatternDeduplicator, hash_packed
+from .device import select_device
+from .packed import TRIGGERS_CHANNEL, PackedPatternDataset, collate_patterns, pack_triggers, save_packed_dataset, unpack_triggers
 from .pattern import Pattern, RandomPatternConfig
+from .preset import CompiledPreset
+from .sampler import BatchPatternSampler, SamplingStrategy, pattern_generators
 from .sequence import RandomSequenceConfig, WeightedCluster, Sequence
+from .shard import PatternShard, PatternShardBuffer
+from .statistics import DatasetStatistics, compute_statistics, load_statistics
+from .streaming import StreamingPatternDataset
 
-__all__ = ["PatternDataset", "Pattern", "RandomPatternConfig",
-           "RandomSequenceConfig", "WeightedCluster", "Sequence"]
+__all__ = ["PatternDataset", "PackedPatternDataset", "TRIGGERS_CHANNEL", "collate_patterns", "pack_triggers",
+           "save_packed_dataset", "unpack_triggers", "Pattern", "RandomPatternConfig", "BatchPatternSampler",
+           "SamplingStrategy", "pattern_generators", "RandomSequenceConfig", "WeightedCluster", "Sequence", "select_device",
+           "PatternShard", "PatternShardBuffer", "StreamingPatternDataset", "PatternDeduplicator", "hash_packed",
+           "DatasetStatistics", "compute_statistics", "load_statistics",
+           "CompiledPreset"]
@@ -0,0 +1,42 @@
+import os
+import torch
+import warnings
+
+from typing import Optional
+
+
+DEVICE_ENV = "DICE_DEVICE"
+
+
+def is_device_available(device: torch.device) -> bool:
+    match device.type:
+        case "cpu":
+            return True
+        case "cuda":
+            return torch.cuda.is_available() and (device.index or 0) < torch.cuda.device_count()
+        case "mps":
+            return torch.backends.mps.is_available()
+    return False
+
+
+def select_device(preference: Optional[str] = None) -> torch.device:
+    """
+    Resolves the device used for training and inference. The preference comes from the
+    argument, then the DICE_DEVICE environment variable, and defaults to CPU. "auto" picks
+    CUDA, then MPS, then CPU. Unavailable devices fall back to CPU with a warning.
+    """
+    preference = preference or os.environ.get(DEVICE_ENV) or "cpu"
+
+    if preference == "auto":
+        if torch.cuda.is_available():
+            return torch.device("cuda")
+        if torch.backends.mps.is_available():
+            return torch.device("mps")
+        return torch.device("cpu")
+
+    device = torch.device(preference)
+    if not is_device_available(device):
+        warnings.warn(f"Device '{preference}' is not available, using CPU")
+        return torch.device("cpu")
+
+    return device
@@ -0,0 +1,223 @@
+import json
+import os
+import numpy as np
+import torch
+
+from .pattern import Pattern
+from torch.utils.data import Dataset, default_collate
+from typing import List, Optional
+
+
+PACKED_FORMAT = "dice-packed"
+PACKED_VERSION = 1
+
+PATTERNS_SUFFIX = ".patterns.npy"
+SOURCES_SUFFIX = ".sources.npy"
+PLANES_SUFFIX = ".planes.npy"
+BASES_SUFFIX = ".bases.npy"
+INDEX_SUFFIX = ".index.json"
+
+TRIGGERS_CHANNEL = "triggers"
+# Largest value of each optional plane, planes are stored as uint8 fractions of it
+PLANE_MAXIMUM = {"velocity": 127, "duration": 15, "swing": 1.0}
+
+
+def pack_triggers(triggers: np.ndarray) -> np.ndarray:
+    """
+    Packs [n, sequences, 16] trigger arrays into [n, sequences] uint16 row bitmasks,
+    bit j holding step j.
+    """
+    triggers = np.asarray(triggers) > 0
+    if triggers.shape[-1] != 16:
+        raise ValueError(
+            f"Packed format expects 16 steps per row, got {triggers.shape[-1]}")
+    return np.packbits(triggers, axis=-1, bitorder='little').view('<u2')[..., 0]
+
+
+def unpack_triggers(packed: np.ndarray) -> np.ndarray:
+    packed = np.ascontiguousarray(packed, dtype='<u2')
+    bits = np.unpackbits(packed.view(np.uint8).reshape(*packed.shape, 2),
+                         axis=-1, bitorder='little')
+    return bits
+
+
+def decode_packed_tensor(packed: np.ndarray) -> torch.Tensor:
+    # Decodes uint16 row bitmasks straight into a float tensor [..., sequences, 16]
+    rows = torch.from_numpy(np.asarray(packed, dtype=np.int32))
+    steps = torch.arange(16, dtype=torch.int32)
+    return ((rows.unsqueeze(-1) >> steps) & 1).float()
+
+
+def quantize_planes(planes: dict) -> np.ndarray:
+    # Stacks {name: [n, sequences, 16]} planes into one uint8 [n, planes, sequences, 16] array
+    return np.stack([
+        np.round(np.clip(np.asarray(values, dtype=np.float32) / PLANE_MAXIMUM[name], 0, 1) * 255)
+        for name, values in planes.items()
+    ], axis=1).astype(np.uint8)
+
+
+def decode_channels_tensor(packed: np.ndarray, planes: Optional[np.ndarray], channels: List[int]) -> torch.Tensor:
+    """
+    Decodes the selected channels into one contiguous float tensor [..., channels, sequences, 16].
+    Channel 0 is the trigger bitmask, channel i > 0 the stored plane i - 1 scaled to [0, 1].
+    """
+    result = torch.empty((*packed.shape[:-1], len(channels), packed.shape[-1], 16))
+    for i, channel in enumerate(channels):
+        if channel == 0:
+            result[..., i, :, :] = decode_packed_tensor(packed)
+        else:
+            plane = torch.from_numpy(np.array(planes[..., channel - 1, :, :]))
+            torch.div(plane, 255, out=result[..., i, :, :])
+    return result
+
+
+def collate_patterns(batch):
+    # Batches decoded by __getitems__ are already stacked
+    if isinstance(batch, torch.Tensor):
+        return batch
+    return default_collate(batch)
+
+
+def save_packed_dataset(path_prefix: str, triggers: np.ndarray, labels: List[str],
+                        sources: Optional[np.ndarray] = None, files: Optional[List[str]] = None,
+                        metadata: Optional[dict] = None, planes: Optional[dict] = None,
+                        bases: Optional[np.ndarray] = None):
+    """
+    Writes a packed dataset as three files sharing the same prefix: the uint16 row
+    bitmasks (32 bytes per 16x16 pattern), the source file index of every pattern and
+    a JSON side index with labels and metadata. Optional velocity, duration and swing
+    planes are quantized to uint8 into a fourth file, and the optional boolean mask of
+    un-augmented base patterns is stored as their indices.
+    """
+    packed = pack_triggers(triggers)
+    if sources is None:
+        sources = np.zeros(len(packed), dtype=np.uint32)
+
+    np.save(path_prefix + PATTERNS_SUFFIX, packed)
+    np.save(path_prefix + SOURCES_SUFFIX,
+            np.asarray(sources, dtype=np.uint32))
+    if planes:
+        np.save(path_prefix + PLANES_SUFFIX, quantize_planes(planes))
+    if bases is not None:
+        np.save(path_prefix + BASES_SUFFIX, np.flatnonzero(bases).astype(np.uint32))
+
+    index = {
+        "format": PACKED_FORMAT,
+        "version": PACKED_VERSION,
+        "count": int(packed.shape[0]),
+        "num_sequences": int(packed.shape[1]),
+        "num_steps": 16,
+        "labels": list(labels),
+        "files": list(files or []),
+        "planes": list(planes or []),
+        "bases": bases is not None,
+        "metadata": metadata or {},
+    }
+    with open(path_prefix + INDEX_SUFFIX, "w") as file:
+        json.dump(index, file)
+
+
+class PackedPatternDataset(Dataset):
+    """
+    Memory-mapped view over a dataset written by save_packed_dataset. Batches are
+    decoded from the row bitmasks directly into float tensors.
+
+    Without channels, samples are [sequences, 16] trigger tensors. With a list of
+    channels, e.g. ["triggers", "velocity"], samples are [channels, sequences, 16].
+    """
+
+    def __init__(self, path_prefix: str, channels: Optional[List[str]] = None):
+        with open(path_prefix + INDEX_SUFFIX, 'r') as file:
+            self.index = json.load(file)
+
+        if self.index.get("format") != PACKED_FORMAT:
+            raise ValueError(f"{path_prefix} is not a packed DICE dataset")
+
+        self.path_prefix = path_prefix
+        self.labels = self.index["labels"]
+        self.files = self.index["files"]
+        self.metadata = self.index["metadata"]
+        self.packed = np.load(path_prefix + PATTERNS_SUFFIX, mmap_mode='r')
+        self.sources = np.load(path_prefix + SOURCES_SUFFIX, mmap_mode='r')
+        self.planes = self._load_planes()
+        self.tensor: Optional[torch.Tensor] = None
+
+        self.channels = channels
+        available = [TRIGGERS_CHANNEL] + self.index.get("planes", [])
+        for channel in channels or []:
+            if channel not in available:
+                raise ValueError(
+                    f"Channel '{channel}' not in {path_prefix}, available: {available}")
+        self.channel_indices = [available.index(c) for c in channels or []]
+
+    def _load_planes(self):
+        if not self.index.get("planes"):
+            return None
+        return np.load(self.path_prefix + PLANES_SUFFIX, mmap_mode='r')
+
+    def __getstate__(self):
+        # Workers reopen the memory maps instead of receiving a pickled copy of the data
+        state = self.__dict__.copy()
+        state["packed"] = None
+        state["sources"] = None
+        state["planes"] = None
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.packed = np.load(self.path_prefix + PATTERNS_SUFFIX, mmap_mode='r')
+        self.sources = np.load(self.path_prefix + SOURCES_SUFFIX, mmap_mode='r')
+        self.planes = self._load_planes()
+
+    @staticmethod
+    def exists(path_prefix: str):
+        return os.path.exists(path_prefix + INDEX_SUFFIX)
+
+    def __len__(self):
+        return self.packed.shape[0]
+
+    def __getitem__(self, idx: int):
+        if self.tensor is not None:
+            return self.tensor[idx]
+        return self._decode(idx)
+
+    def __getitems__(self, indices: List[int]):
+        if self.tensor is not None:
+            return self.tensor[torch.as_tensor(indices, device=self.tensor.device)]
+        return self._decode(np.asarray(indices))
+
+    def to(self, device: torch.device):
+        """
+        Decodes the whole dataset once into a contiguous float tensor on the device,
+        so that batches become plain slices without host transfers.
+        """
+        self.tensor = self._decode(slice(None)).to(device).contiguous()
+        return self
+
+    def _decode(self, indices) -> torch.Tensor:
+        if self.channels is None:
+            return decode_packed_tensor(self.packed[indices])
+        planes = self.planes[indices] if self.planes is not None else None
+        return decode_channels_tensor(self.packed[indices], planes, self.channel_indices)
+
+    def get_base_indices(self) -> np.ndarray:
+        """
+        Indices of the un-augmented base patterns. Datasets written before these were
+        recorded are assumed to hold each base followed by its augmented copies.
+        """
+        if self.index.get("bases"):
+            return np.load(self.path_prefix + BASES_SUFFIX).astype(np.int64)
+
+        factor = self.metadata.get("augmentation_factor")
+        if factor is None:
+            return np.arange(len(self))
+        if self.metadata.get("max_copies"):
+            raise ValueError(f"{self.path_prefix} was deduplicated without recording its base patterns, "
+                             "generate it again")
+        return np.arange(0, len(self), 1 + factor)
+
+    def get_triggers(self, indices) -> np.ndarray:
+        return unpack_triggers(self.packed[indices])
+
+    def get_pattern(self, idx: int):
+        return Pattern.from_array(self.get_triggers(idx), self.labels)
@@ -1,11 +1,24 @@
 import json
+import numpy as np
 import torch
 
 from .sequence import RandomSequenceConfig, Sequence, Cluster
 from dataclasses import dataclass
 from random import shuffle
 from torch import Tensor
-from typing import List
+from typing import List, Optional
+
+
+def valid_polyphony(polyphony: np.ndarray, max_polyphony: int, max_num_events_with_full_polyphony: int) -> np.ndarray:
+    """
+    Checks per-step polyphony counts [..., steps] against the limits, returning a mask [...].
+    """
+    # 1. No timestep should exceed max polyphony
+    within_limit = np.all(polyphony <= max_polyphony, axis=-1)
+
+    # 2. Limit number of times full polyphony is reached
+    full_polyphony_events = np.sum(polyphony == max_polyphony, axis=-1)
+    return within_limit & (full_polyphony_events <= max_num_events_with_full_polyphony)
 
 
 @dataclass
@@ -47,38 +60,50 @@ class Pattern:
     def get_labels(self):
         return [sequence.label for sequence in self.sequences]
 
+    def get_trigger_array(self) -> np.ndarray:
+        # Returns the triggers of pattern into a [sequences, steps] uint8 array
+        return np.stack([sequence.get_trigger_array() for sequence in self.sequences])
+
     def get_trigger_tensor(self):
         # Returns the triggers of sequence into a 2D tensor
-        tensors = [sequence.get_trigger_tensor()
-                   for sequence in self.sequences]
-        return torch.stack(tensors, dim=0)
+        return torch.from_numpy(self.get_trigger_array()).float()
+
+    def get_polyphony(self) -> np.ndarray:
+        # Number of triggers on each step, read from the cached sequence rows
+        return np.sum([sequence.get_trigger_array() for sequence in self.sequences], axis=0, dtype=np.int32)
 
     def valid_polyphony_requirements(self, max_polyphony: int, max_num_events_with_full_polyphony: int):
-        return Pattern.tensor_valid_polyphony_requirements(
-            self.get_trigger_tensor(),
+        return bool(valid_polyphony(
+            self.get_polyphony(),
             max_polyphony=max_polyphony,
             max_num_events_with_full_polyphony=max_num_events_with_full_polyphony
-        )
+        ))
 
-    def fill_empty_sequences_with_random(self, config: RandomPatternConfig) -> None:
-        if not self.valid_polyphony_requirements(
-                config.max_polyphony, config.max_num_events_with_full_polyphony):
+    def fill_empty_sequences_with_random(self, config: RandomPatternConfig,
+                                         rng: Optional[np.random.Generator] = None) -> None:
+        # Draws come from rng when given, otherwise from the global random module
+        polyphony = self.get_polyphony()
+        if not valid_polyphony(polyphony, config.max_polyphony, config.max_num_events_with_full_polyphony):
             return
 
         indexed_sequences = list(enumerate(self.sequences))
-        shuffle(indexed_sequences)
+        if rng is None:
+            shuffle(indexed_sequences)
+        else:
+            indexed_sequences = [indexed_sequences[i]
+                                 for i in rng.permutation(len(indexed_sequences))]
         for i, sequence in indexed_sequences:
             if sequence.is_empty():
                 # Replace with another random sequence
-                empty_seq = sequence
                 new_seq = Sequence.create_random(
-                    config.random_sequence_configs[i])
-                self.sequences[i] = new_seq
-                # revert empty sequence if modifications exceed validation limits
-                if not self.valid_polyphony_requirements(
-                        config.max_polyphony, config.max_num_events_with_full_polyphony):
-                    self.sequences[i] = empty_seq
+                    config.random_sequence_configs[i], rng)
+                new_polyphony = polyphony + new_seq.get_trigger_array()
+                # keep empty sequence if modifications exceed validation limits
+                if not valid_polyphony(new_polyphony, config.max_polyphony,
+                                       config.max_num_events_with_full_polyphony):
                     return
+                self.sequences[i] = new_seq
+                polyphony = new_polyphony
 
     @staticmethod
     def tensor_valid_polyphony_requirements(pattern_tensor: Tensor, max_polyphony: int, max_num_events_with_full_polyphony: int):
@@ -95,6 +120,37 @@ class Pattern:
 
         return True
 
+    @staticmethod
+    def tensor_valid_polyphony_mask(pattern_tensor: Tensor, max_polyphony: int, max_num_events_with_full_polyphony: int) -> Tensor:
+        """
+        Batched counterpart of tensor_valid_polyphony_requirements. Takes patterns shaped
+        [..., sequences, steps] and returns a boolean mask over the leading dimensions,
+        computed on the tensor's device without synchronizing with the host.
+        """
+        polyphony = torch.sum(pattern_tensor, dim=-2)
+
+        # 1. No timestep should exceed max polyphony
+        within_limit = torch.all(polyphony <= max_polyphony, dim=-1)
+
+        # 2. Limit number of times full polyphony is reached
+        full_polyphony_events = torch.sum(polyphony == max_polyphony, dim=-1)
+        return within_limit & (full_polyphony_events <= max_num_events_with_full_polyphony)
+
+    @staticmethod
+    def create_random(config: RandomPatternConfig, rng: Optional[np.random.Generator] = None) -> 'Pattern':
+        sequences = [Sequence.create_random(seq_config, rng)
+                     for seq_config in config.random_sequence_configs]
+        return Pattern(sequences)
+
+    @staticmethod
+    def from_array(triggers, labels: List[str]):
+        # Builds a pattern from a [sequences, steps] array, one Cluster per row
+        sequences = [
+            Sequence(label=label, clusters=[Cluster(triggers=[int(t) for t in row])])
+            for label, row in zip(labels, triggers)
+        ]
+        return Pattern(sequences)
+
     @staticmethod
     def from_dictionary(dict_obj: dict):
         pattern_dict = dict_obj["triggers"]
@@ -0,0 +1,199 @@
+import hashlib
+import numpy as np
+import os
+
+from .pattern import RandomPatternConfig
+from dataclasses import dataclass
+from typing import List
+
+
+COMPILED_SUFFIX = ".compiled.npz"
+# Part of the cache key, bumped whenever compilation changes so stale caches are rebuilt
+COMPILED_VERSION = b"2"
+
+
+@dataclass
+class CompiledPreset:
+    """
+    Array form of a RandomPatternConfig, rows in the same order as its sequence configs.
+    Duplicate clusters of a label are merged and their weights summed, then each label
+    gets a padded cluster table and normalized cumulative weights for inverse transform
+    sampling with a single comparison against every cluster.
+    """
+    labels: List[str]
+    max_polyphony: int
+    max_num_events_with_full_polyphony: int
+    length_in_clusters: int
+    cluster_tables: np.ndarray  # [sequences, clusters, cluster_size] uint8, zero padded
+    weights: np.ndarray         # [sequences, clusters] merged weights, zero padded
+    cum_weights: np.ndarray     # [sequences, clusters] normalized, inf padded
+    merged_clusters: np.ndarray  # [sequences] duplicate clusters merged per label
+    source_hash: str = ""
+
+    @property
+    def num_sequences(self) -> int:
+        return self.cluster_tables.shape[0]
+
+    @property
+    def cluster_size(self) -> int:
+        return self.cluster_tables.shape[2]
+
+    @property
+    def num_steps(self) -> int:
+        return self.length_in_clusters * self.cluster_size
+
+    @staticmethod
+    def compile(config: RandomPatternConfig, source_hash: str = "") -> 'CompiledPreset':
+        seq_configs = config.random_sequence_configs
+        if not seq_configs:
+            raise ValueError("Preset needs at least one sequence config")
+        length_in_clusters = seq_configs[0].length_in_clusters
+        cluster_size = len(seq_configs[0].weighted_clusters[0].triggers)
+
+        tables, weights, merged = [], [], []
+        for seq in seq_configs:
+            if seq.length_in_clusters != length_in_clusters:
+                raise ValueError(
+                    f"Sequence '{seq.label}' has {seq.length_in_clusters} clusters, "
+                    f"expected {length_in_clusters}")
+            if any(len(cluster.triggers) != cluster_size for cluster in seq.weighted_clusters):
+                raise ValueError(
+                    f"Sequence '{seq.label}' clusters must have {cluster_size} triggers")
+            if any(cluster.weight < 0 for cluster in seq.weighted_clusters):
+                raise ValueError(
+                    f"Sequence '{seq.label}' has a negative weight")
+
+            # Merge identical clusters, keeping their first position
+            merged_weights = {}
+            for cluster in seq.weighted_clusters:
+                key = tuple(int(t > 0) for t in cluster.triggers)
+                merged_weights[key] = merged_weights.get(key, 0) + cluster.weight
+
+            if sum(merged_weights.values()) <= 0:
+                raise ValueError(
+                    f"Sequence '{seq.label}' needs at least one positive weight")
+
+            tables.append(list(merged_weights))
+            weights.append(list(merged_weights.values()))
+            merged.append(len(seq.weighted_clusters) - len(merged_weights))
+
+        max_clusters = max(len(table) for table in tables)
+        cluster_tables = np.zeros(
+            (len(seq_configs), max_clusters, cluster_size), dtype=np.uint8)
+        padded_weights = np.zeros(
+            (len(seq_configs), max_clusters), dtype=np.float64)
+        # Padding never gets selected
+        cum_weights = np.full(
+            (len(seq_configs), max_clusters), np.inf, dtype=np.float64)
+
+        for i, (table, row_weights) in enumerate(zip(tables, weights)):
+            cluster_tables[i, :len(table)] = table
+            padded_weights[i, :len(row_weights)] = row_weights
+            cum_weights[i, :len(row_weights)] = np.cumsum(
+                row_weights) / np.sum(row_weights)
+            # The float sum may end below 1.0, the last positive weight catches every draw
+            last = np.flatnonzero(row_weights)[-1]
+            cum_weights[i, last:len(row_weights)] = 1.0
+
+        return CompiledPreset(
+            labels=[seq.label for seq in seq_configs],
+            max_polyphony=config.max_polyphony,
+            max_num_events_with_full_polyphony=config.max_num_events_with_full_polyphony,
+            length_in_clusters=length_in_clusters,
+            cluster_tables=cluster_tables,
+            weights=padded_weights,
+            cum_weights=cum_weights,
+            merged_clusters=np.array(merged, dtype=np.int64),
+            source_hash=source_hash,
+        )
+
+    def choose(self, u: np.ndarray) -> np.ndarray:
+        """
+        Maps uniforms [n, sequences, length_in_clusters] to patterns [n, sequences, steps],
+        with the rule of random.choices: first cumulative weight strictly above u.
+        """
+        cluster_idx = (u[..., None] >= self.cum_weights[None, :, None, :]).sum(-1)
+        rows = np.arange(self.num_sequences)[None, :, None]
+        chosen = self.cluster_tables[rows, cluster_idx]
+        return chosen.reshape(u.shape[0], self.num_sequences, self.num_steps)
+
+    def onset_probabilities(self) -> np.ndarray:
+        # Probability of an onset on each [sequence, step] of a random pattern
+        probabilities = self.weights / self.weights.sum(axis=1, keepdims=True)
+        per_position = np.einsum('sk,skc->sc', probabilities, self.cluster_tables)
+        return np.tile(per_position, (1, self.length_in_clusters))
+
+    def expected_density(self) -> np.ndarray:
+        # Expected fraction of steps with an onset, per label
+        return self.onset_probabilities().mean(axis=1)
+
+    def expected_polyphony(self) -> np.ndarray:
+        # Expected number of simultaneous onsets on each step of a random pattern
+        return self.onset_probabilities().sum(axis=0)
+
+    def report(self) -> List[dict]:
+        density = self.expected_density()
+        return [
+            {
+                "label": label,
+                "clusters": int((self.weights[i] > 0).sum()),
+                "merged_duplicates": int(self.merged_clusters[i]),
+                "expected_density": round(float(density[i]), 4),
+                "expected_onsets": round(float(density[i]) * self.num_steps, 2),
+            }
+            for i, label in enumerate(self.labels)
+        ]
+
+    def save(self, path: str):
+        with open(path, "wb") as f:
+            np.savez(f, labels=np.array(self.labels),
+                     limits=np.array([self.max_polyphony, self.max_num_events_with_full_polyphony,
+                                      self.length_in_clusters]),
+                     cluster_tables=self.cluster_tables,
+                     weights=self.weights,
+                     cum_weights=self.cum_weights,
+                     merged_clusters=self.merged_clusters,
+                     source_hash=np.array(self.source_hash))
+
+    @staticmethod
+    def load(path: str) -> 'CompiledPreset':
+        with np.load(path, allow_pickle=False) as data:
+            max_polyphony, max_full, length_in_clusters = data["limits"].tolist()
+            return CompiledPreset(
+                labels=data["labels"].tolist(),
+                max_polyphony=max_polyphony,
+                max_num_events_with_full_polyphony=max_full,
+                length_in_clusters=length_in_clusters,
+                cluster_tables=data["cluster_tables"],
+                weights=data["weights"],
+                cum_weights=data["cum_weights"],
+                merged_clusters=data["merged_clusters"],
+                source_hash=str(data["source_hash"]),
+            )
+
+    @staticmethod
+    def from_json(path: str) -> 'CompiledPreset':
+        """
+        Returns the compiled form of a preset JSON, cached next to it as
+        <preset>.compiled.npz and compiled again whenever the JSON content changes.
+        """
+        with open(path, "rb") as file:
+            source_hash = hashlib.sha1(COMPILED_VERSION + file.read()).hexdigest()
+
+        cache_path = os.path.splitext(path)[0] + COMPILED_SUFFIX
+        if os.path.exists(cache_path):
+            compiled = CompiledPreset.load(cache_path)
+            if compiled.source_hash == source_hash:
+                return compiled
+
+        compiled = CompiledPreset.compile(
+            RandomPatternConfig.from_json(path), source_hash)
+        try:
+            # Written under a process-specific name first, workers may compile concurrently
+            temporary_path = f"{cache_path}.{os.getpid()}.tmp"
+            compiled.save(temporary_path)
+            os.replace(temporary_path, cache_path)
+        except OSError:
+            # Read-only preset folders still get the compiled tables
+            pass
+        return compiled
@@ -0,0 +1,233 @@
+import numpy as np
+
+from enum import Enum
+from .pattern import Pattern, RandomPatternConfig, valid_polyphony
+from .preset import CompiledPreset
+from typing import List, Optional, Union
+
+
+RandomState = Union[np.random.Generator, List[np.random.Generator], None]
+
+
+class SamplingStrategy(Enum):
+    # Draw rows freely, stop a pattern at its first row breaking the polyphony limits
+    REJECTION = "rejection"
+    # Draw each row conditioned on the remaining polyphony budget, never rejected
+    CONSTRAINED = "constrained"
+
+
+def pattern_generators(seed: int, indices) -> List[np.random.Generator]:
+    """
+    Returns one generator per pattern index, seeded from the dataset seed and the index,
+    so that a pattern draws the same values whichever batch, worker or process augments it.
+    """
+    return [np.random.default_rng([seed, int(index)]) for index in indices]
+
+
+class BatchPatternSampler:
+    """
+    Vectorized counterpart of Pattern.fill_empty_sequences_with_random. Sampling tables
+    come from the compiled preset, then a whole batch of base patterns is augmented with
+    array operations instead of one random.choices call per sequence.
+    """
+
+    def __init__(self, config: Union[RandomPatternConfig, CompiledPreset],
+                 strategy: SamplingStrategy = SamplingStrategy.REJECTION):
+        # Compiled presets carry the polyphony limits as well
+        self.config = config if isinstance(config, CompiledPreset) \
+            else CompiledPreset.compile(config)
+
+        self.num_sequences = self.config.num_sequences
+        self.length_in_clusters = self.config.length_in_clusters
+        self.cluster_size = self.config.cluster_size
+        self.num_steps = self.config.num_steps
+        self.cluster_tables = self.config.cluster_tables
+        self.cum_weights = self.config.cum_weights
+        self.strategy = SamplingStrategy(strategy)
+        self.probabilities = self.config.weights / \
+            self.config.weights.sum(axis=1, keepdims=True)
+
+        if self.strategy == SamplingStrategy.CONSTRAINED:
+            if self.cluster_size > 16:
+                raise ValueError(
+                    "Constrained sampling supports clusters of up to 16 steps")
+            # Clusters as step bitmasks, with a popcount lookup table over them
+            self.cluster_masks = self._step_masks(self.cluster_tables > 0)
+            self.popcount = np.array([bin(mask).count("1") for mask in range(1 << self.cluster_size)])
+
+    def sample_sequences(self, n: int, rng: Optional[np.random.Generator] = None) -> np.ndarray:
+        """
+        Draws n random patterns from the sequence configs, shape [n, sequences, steps].
+        """
+        rng = rng if rng is not None else np.random.default_rng()
+        u = rng.random((n, self.num_sequences, self.length_in_clusters))
+        return self._choose(u)
+
+    def _choose(self, u: np.ndarray) -> np.ndarray:
+        return self.config.choose(u)
+
+    def valid_polyphony_mask(self, patterns: np.ndarray) -> np.ndarray:
+        """
+        Returns a boolean mask of shape [n] telling which patterns respect the config limits.
+        """
+        polyphony = patterns.sum(axis=1, dtype=np.int32)
+        return _valid_polyphony(polyphony, self.config)
+
+    def _uniforms(self, n: int, rng: RandomState):
+        # Cluster and order draws [n, sequences, clusters] and [n, sequences]
+        cluster_shape = (self.num_sequences, self.length_in_clusters)
+        if rng is None or isinstance(rng, np.random.Generator):
+            rng = rng if rng is not None else np.random.default_rng()
+            return rng.random((n, *cluster_shape)), rng.random((n, self.num_sequences))
+
+        if len(rng) != n:
+            raise ValueError(f"Expected {n} generators, got {len(rng)}")
+        # One draw per pattern from its own generator
+        size = self.num_sequences * self.length_in_clusters
+        u = np.stack([g.random(size + self.num_sequences) for g in rng]) \
+            if n else np.zeros((0, size + self.num_sequences))
+        return u[:, :size].reshape(n, *cluster_shape), u[:, size:]
+
+    def fill_empty_sequences(self, patterns: np.ndarray, rng: RandomState = None) -> np.ndarray:
+        """
+        Augments a batch of base patterns [n, sequences, steps] in one vectorized pass.
+        Empty sequences are replaced in a random order per pattern. With the rejection
+        strategy each pattern stops at its first replacement exceeding the polyphony
+        limits, as in the scalar version. With the constrained strategy every replacement
+        is drawn among the rows that keep the pattern valid.
+
+        rng is either one generator for the whole batch or one generator per pattern
+        (see pattern_generators), the latter making every pattern independent of its batch.
+        """
+        patterns = (np.asarray(patterns) > 0).astype(np.uint8)
+        n = patterns.shape[0]
+
+        cluster_u, order_u = self._uniforms(n, rng)
+        order = np.argsort(order_u, axis=1)
+
+        polyphony = patterns.sum(axis=1, dtype=np.int32)
+        active = _valid_polyphony(polyphony, self.config)
+
+        if self.strategy == SamplingStrategy.CONSTRAINED:
+            return self._fill_constrained(patterns, polyphony, active, cluster_u, order)
+
+        candidates = self._choose(cluster_u)
+        batch = np.arange(n)
+
+        for k in range(self.num_sequences):
+            rows = order[:, k]
+            empty = ~patterns[batch, rows].any(axis=1)
+            filling = active & empty
+
+            candidate_rows = candidates[batch, rows]
+            new_polyphony = polyphony + candidate_rows
+            accepted = filling & _valid_polyphony(new_polyphony, self.config)
+
+            # Patterns whose replacement fails are reverted and stop here
+            active &= ~(filling & ~accepted)
+
+            patterns[batch[accepted], rows[accepted]] = candidate_rows[accepted]
+            polyphony[accepted] = new_polyphony[accepted]
+
+        return patterns
+
+    def _fill_constrained(self, patterns, polyphony, active, cluster_u, order):
+        """
+        Fills the empty rows of the valid patterns one row at a time. A row is a sequence
+        of clusters, and the polyphony limits decompose over them: each cluster must keep
+        its steps within max_polyphony, and the full polyphony events of all clusters add
+        up. A backward dynamic program over cluster positions, with the number of full
+        polyphony events as state, gives the probability mass of valid completions, from
+        which the clusters are sampled forward with the same uniforms as the rejection
+        strategy. Rows without any valid completion stay empty.
+        """
+        n = patterns.shape[0]
+        batch = np.arange(n)
+        limit = self.config.max_num_events_with_full_polyphony
+        blocks = (n, self.length_in_clusters, self.cluster_size)
+
+        for k in range(self.num_sequences):
+            rows = order[:, k]
+            filling = active & ~patterns[batch, rows].any(axis=1)
+            if not filling.any():
+                continue
+
+            idx = batch[filling]
+            row_idx = rows[filling]
+            tables = self.cluster_tables[row_idx]   # [m, clusters, cluster_size]
+            weights = self.probabilities[row_idx]   # [m, clusters]
+
+            # Steps of each position at the limit, or one below it, as cluster bitmasks [m, positions]
+            current = polyphony[idx].reshape(-1, *blocks[1:])
+            at_limit = self._step_masks(current >= self.config.max_polyphony)
+            below_limit = self._step_masks(current == self.config.max_polyphony - 1)
+
+            # Clusters may not add onsets to steps at the limit, and each full step is an event
+            clusters = self.cluster_masks[row_idx][:, None, :]
+            allowed = ((clusters & at_limit[:, :, None]) == 0) & (weights > 0)[:, None, :]
+            events = self.popcount[clusters & below_limit[:, :, None]] \
+                + self.popcount[at_limit][:, :, None]
+
+            # Weight of each cluster choice, zero when it breaks max_polyphony [m, positions, clusters]
+            m = len(idx)
+            choice_weights = np.where(allowed, weights[:, None, :], 0.0)
+            members = np.arange(m)[:, None]
+
+            # shifted[:, l, v, e]: probability of a valid completion after position l when e
+            # events are used and v more are added, zero past the budget
+            shifted = np.zeros((m, self.length_in_clusters, self.cluster_size + 1, limit + 1))
+            next_mass = np.ones((m, limit + 1 + self.cluster_size + 1))
+            next_mass[:, limit + 1:] = 0.0
+            for l in reversed(range(self.length_in_clusters)):
+                for v in range(self.cluster_size + 1):
+                    shifted[:, l, v] = next_mass[:, v:v + limit + 1]
+                # Weights summed per number of added events, then one contraction over them
+                event_weights = np.bincount(
+                    (members * (self.cluster_size + 1) + events[:, l]).ravel(),
+                    weights=choice_weights[:, l].ravel(),
+                    minlength=m * (self.cluster_size + 1)).reshape(m, -1)
+                mass = np.einsum('mv,mve->me', event_weights, shifted[:, l])
+                next_mass[:, :limit + 1] = mass
+
+            # Rows without any valid completion stay empty and are left out of the forward pass
+            fillable = next_mass[:, 0] > 0
+            if not fillable.any():
+                continue
+            idx, row_idx, tables = idx[fillable], row_idx[fillable], tables[fillable]
+            shifted, choice_weights, events = shifted[fillable], choice_weights[fillable], events[fillable]
+            m = len(idx)
+            members = np.arange(m)
+
+            # Sample forward, conditioned on reaching the end within the budget
+            used_events = np.zeros(m, dtype=np.int64)
+            row = np.zeros((m, self.length_in_clusters, self.cluster_size), dtype=np.uint8)
+            for l in range(self.length_in_clusters):
+                completions = shifted[members, l, :, used_events]
+                choice_mass = choice_weights[:, l] * \
+                    np.take_along_axis(completions, events[:, l], axis=1)
+                cum_mass = np.cumsum(choice_mass, axis=1)
+                u = cluster_u[idx, row_idx, l] * cum_mass[:, -1]
+                choice = np.minimum((u[:, None] >= cum_mass).sum(-1), tables.shape[1] - 1)
+                row[:, l] = tables[members, choice]
+                used_events += events[members, l, choice]
+
+            row = row.reshape(m, self.num_steps)
+            patterns[idx, row_idx] = row
+            polyphony[idx] += row
+
+        return patterns
+
+    def _step_masks(self, steps: np.ndarray) -> np.ndarray:
+        # [..., cluster_size] booleans to integer bitmasks, bit c holding step c
+        return (steps.astype(np.int64) << np.arange(self.cluster_size)).sum(-1)
+
+    def augment(self, patterns: List[Pattern], rng: RandomState = None) -> List[Pattern]:
+        triggers = np.stack([pattern.get_trigger_array()
+                            for pattern in patterns])
+        augmented = self.fill_empty_sequences(triggers, rng)
+        return [Pattern.from_array(array, pattern.get_labels())
+                for array, pattern in zip(augmented, patterns)]
+
+
+def _valid_polyphony(polyphony: np.ndarray, config: Union[RandomPatternConfig, CompiledPreset]) -> np.ndarray:
+    return valid_polyphony(polyphony, config.max_polyphony, config.max_num_events_with_full_polyphony)
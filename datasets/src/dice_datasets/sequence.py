@@ -1,13 +1,11 @@
+import numpy as np
 import random
 import torch
 
 from dataclasses import dataclass
-from itertools import chain
-from typing import List
-
-
-# Enable MacOSX GPU Acceleration
-device = torch.device('mps')
+from functools import cached_property
+from itertools import accumulate, chain
+from typing import List, Optional
 
 
 @dataclass
@@ -30,6 +28,11 @@ class RandomSequenceConfig:
     weighted_clusters: List['WeightedCluster']
     length_in_clusters: int = 4
 
+    @cached_property
+    def cum_weights(self) -> List[float]:
+        # Computed once per config instead of on every random.choices call
+        return list(accumulate(cluster.weight for cluster in self.weighted_clusters))
+
     @staticmethod
     def from_dictionary(dict: dict):
         weighted_clusters = [
@@ -48,32 +51,61 @@ class Sequence:
         self.label = label
         self.clusters = clusters
 
+    @property
+    def clusters(self) -> List[Cluster]:
+        return self._clusters
+
+    @clusters.setter
+    def clusters(self, clusters: List[Cluster]):
+        # Assigning clusters invalidates the cached triggers, mutate by reassignment
+        self._clusters = clusters
+        self._trigger_array = None
+        self._trigger_mask = None
+
+    def get_trigger_array(self) -> np.ndarray:
+        # Returns the cached triggers as a uint8 row of 0 and 1, not to be modified in place
+        if self._trigger_array is None:
+            triggers = list(
+                chain(*[cluster.triggers for cluster in self._clusters]))
+            self._trigger_array = (np.array(triggers) > 0).astype(np.uint8)
+        return self._trigger_array
+
+    def get_trigger_mask(self) -> int:
+        # Returns the cached triggers as an integer bitmask, bit j holding step j
+        if self._trigger_mask is None:
+            array = self.get_trigger_array()
+            self._trigger_mask = sum(
+                1 << int(step) for step in np.flatnonzero(array))
+        return self._trigger_mask
+
     def get_triggers(self):
         # Returns the triggers of sequence into one list
-        triggers = list(
-            chain(*[cluster.triggers for cluster in self.clusters]))
-        return triggers
+        return self.get_trigger_array().tolist()
 
     def get_trigger_tensor(self):
-        triggers = self.get_triggers()
-        tensor = torch.tensor(triggers, device=device,
-                              dtype=torch.float32).view(-1)
-        return (tensor > 0).float()  # ensures values are 0 or 1
+        return torch.from_numpy(self.get_trigger_array()).float()
 
     def is_empty(self):
-        # Returns True if all elements in the tensor are zero
-        return torch.all(self.get_trigger_tensor() == 0).item()
+        return self.get_trigger_mask() == 0
 
     @staticmethod
-    def create_random(config: RandomSequenceConfig) -> 'Sequence':
+    def create_random(config: RandomSequenceConfig, rng: Optional[np.random.Generator] = None) -> 'Sequence':
         """
         Generates a Sequence from a RandomSequenceMap. It selects clusters based on their
         weighted probability, then creates the sequence by flattening the triggers of selected clusters.
+        Draws come from rng when given, otherwise from the global random module.
         """
-        weights = [cluster.weight for cluster in config.weighted_clusters]
+        cum_weights = config.cum_weights
 
         # Choose clusters based on weighted probabilities
-        chosen_clusters = random.choices(
-            config.weighted_clusters, weights=weights, k=config.length_in_clusters)
+        if rng is None:
+            chosen_clusters = random.choices(
+                config.weighted_clusters, cum_weights=cum_weights, k=config.length_in_clusters)
+        else:
+            # Same rule as random.choices: first cumulative weight strictly above u
+            indices = np.searchsorted(
+                cum_weights, rng.random(config.length_in_clusters) * cum_weights[-1], side='right')
+            indices = np.minimum(indices, len(cum_weights) - 1)
+            chosen_clusters = [config.weighted_clusters[i] for i in indices]
 
         return Sequence(config.label, chosen_clusters)
@@ -0,0 +1,113 @@
+import numpy as np
+
+from dataclasses import dataclass
+from typing import List
+
+
+PLANES = ["triggers", "velocity", "duration", "swing"]
+METADATA = ["filename", "bar_index", "bpm", "genre"]
+
+
+@dataclass
+class PatternShard:
+    """
+    Columnar store of 16x16 bars extracted from MIDI files. Each plane is a [n, sequences,
+    steps] array and the metadata columns hold one value per bar.
+    """
+    labels: List[str]
+    triggers: np.ndarray
+    velocity: np.ndarray
+    duration: np.ndarray
+    swing: np.ndarray
+    filename: np.ndarray
+    bar_index: np.ndarray
+    bpm: np.ndarray
+    genre: np.ndarray
+
+    def __len__(self):
+        return self.triggers.shape[0]
+
+    def save(self, path: str):
+        # Uncompressed, so that every column can be read back without decoding the others
+        with open(path, "wb") as f:
+            np.savez(f, labels=np.array(self.labels),
+                     **{name: getattr(self, name) for name in PLANES + METADATA})
+
+    def get_sources(self):
+        # Index of the source MIDI file of every bar, with the list of unique files
+        files, sources = np.unique(self.filename, return_inverse=True)
+        return sources.astype(np.uint32), files.tolist()
+
+    @staticmethod
+    def empty(labels: List[str], num_steps: int = 16):
+        shape = (0, len(labels), num_steps)
+        return PatternShard(
+            labels=list(labels),
+            triggers=np.zeros(shape, dtype=np.uint8),
+            velocity=np.zeros(shape, dtype=np.uint8),
+            duration=np.zeros(shape, dtype=np.uint8),
+            swing=np.zeros(shape, dtype=np.float32),
+            filename=np.zeros(0, dtype=str),
+            bar_index=np.zeros(0, dtype=np.int16),
+            bpm=np.zeros(0, dtype=np.int16),
+            genre=np.zeros(0, dtype=str),
+        )
+
+    @staticmethod
+    def concatenate(shards: List['PatternShard']):
+        if not shards:
+            raise ValueError("Nothing to concatenate")
+        if any(shard.labels != shards[0].labels for shard in shards):
+            raise ValueError("All shards must share the same labels")
+
+        return PatternShard(
+            labels=shards[0].labels,
+            **{name: np.concatenate([getattr(shard, name) for shard in shards])
+               for name in PLANES + METADATA})
+
+    @staticmethod
+    def load(path: str):
+        with np.load(path, allow_pickle=False) as data:
+            return PatternShard(
+                labels=data["labels"].tolist(),
+                **{name: data[name] for name in PLANES + METADATA})
+
+
+class PatternShardBuffer:
+    """
+    Builds a PatternShard from shards appended one at a time, copying each into column
+    buffers that double in capacity when full, so the parts need not be held until a
+    final concatenation. String columns are widened when a longer value arrives.
+    """
+
+    def __init__(self, labels: List[str], num_steps: int = 16, capacity: int = 1024):
+        empty = PatternShard.empty(labels, num_steps)
+        self.labels = empty.labels
+        self.size = 0
+        self.columns = {
+            name: np.zeros((capacity,) + getattr(empty, name).shape[1:], dtype=getattr(empty, name).dtype)
+            for name in PLANES + METADATA}
+
+    def __len__(self):
+        return self.size
+
+    def append(self, shard: PatternShard):
+        if shard.labels != self.labels:
+            raise ValueError("All shards must share the same labels")
+
+        end = self.size + len(shard)
+        for name, buffer in self.columns.items():
+            values = getattr(shard, name)
+            dtype = np.promote_types(buffer.dtype, values.dtype) if buffer.dtype.kind == 'U' else buffer.dtype
+            if end > len(buffer) or dtype != buffer.dtype:
+                grown = np.zeros((max(end, 2 * len(buffer)),) + buffer.shape[1:], dtype=dtype)
+                grown[:self.size] = buffer[:self.size]
+                buffer = self.columns[name] = grown
+            buffer[self.size:end] = values
+        self.size = end
+
+    def to_shard(self) -> PatternShard:
+        # Views of the buffers, valid until the next append
+        return PatternShard(
+            labels=self.labels,
+            **{name: buffer[:self.size] for name, buffer in self.columns.items()})
@@ -0,0 +1,132 @@
+import numpy as np
+import os
+
+from .packed import PATTERNS_SUFFIX, PackedPatternDataset, unpack_triggers
+from dataclasses import dataclass, field
+from typing import List
+
+
+STATS_SUFFIX = ".stats.npz"
+
+
+@dataclass
+class DatasetStatistics:
+    """
+    Aggregate statistics of a packed dataset, gathered in one pass over its patterns.
+
+    onset_counts [sequences, steps]: patterns with an onset on each cell
+    polyphony_histogram [sequences + 1]: steps with k simultaneous onsets
+    full_polyphony_histogram [steps + 1]: patterns with k steps at max_polyphony
+    cooccurrence [sequences, sequences]: steps where both labels have an onset
+    source_signature: size and modification time of the patterns file they come from
+    """
+    labels: List[str]
+    count: int
+    max_polyphony: int
+    max_num_events_with_full_polyphony: int
+    onset_counts: np.ndarray
+    polyphony_histogram: np.ndarray
+    full_polyphony_histogram: np.ndarray
+    cooccurrence: np.ndarray
+    source_signature: List[int] = field(default_factory=list)
+
+    def onset_density(self) -> np.ndarray:
+        return self.onset_counts / max(self.count, 1)
+
+    def over_full_polyphony_limit(self) -> int:
+        # Patterns reaching max_polyphony on more steps than allowed
+        return int(self.full_polyphony_histogram[self.max_num_events_with_full_polyphony + 1:].sum())
+
+    def save(self, path: str):
+        with open(path, "wb") as f:
+            np.savez(f, labels=np.array(self.labels),
+                     limits=np.array([self.count, self.max_polyphony,
+                                      self.max_num_events_with_full_polyphony]),
+                     source_signature=np.array(self.source_signature, dtype=np.int64),
+                     onset_counts=self.onset_counts,
+                     polyphony_histogram=self.polyphony_histogram,
+                     full_polyphony_histogram=self.full_polyphony_histogram,
+                     cooccurrence=self.cooccurrence)
+
+    @staticmethod
+    def load(path: str):
+        with np.load(path, allow_pickle=False) as data:
+            count, max_polyphony, max_full = data["limits"].tolist()
+            return DatasetStatistics(
+                labels=data["labels"].tolist(),
+                count=count,
+                max_polyphony=max_polyphony,
+                max_num_events_with_full_polyphony=max_full,
+                onset_counts=data["onset_counts"],
+                polyphony_histogram=data["polyphony_histogram"],
+                full_polyphony_histogram=data["full_polyphony_histogram"],
+                cooccurrence=data["cooccurrence"],
+                source_signature=data["source_signature"].tolist(),
+            )
+
+
+def compute_statistics(dataset: PackedPatternDataset, max_polyphony: int, max_num_events_with_full_polyphony: int,
+                       chunk_size: int = 1 << 16) -> DatasetStatistics:
+    """
+    Streams the packed patterns in chunks and accumulates every statistic with array
+    operations, so memory stays bounded by the chunk size.
+    """
+    num_sequences = dataset.index["num_sequences"]
+    num_steps = dataset.index["num_steps"]
+
+    onset_counts = np.zeros((num_sequences, num_steps), dtype=np.int64)
+    polyphony_histogram = np.zeros(num_sequences + 1, dtype=np.int64)
+    full_polyphony_histogram = np.zeros(num_steps + 1, dtype=np.int64)
+    cooccurrence = np.zeros((num_sequences, num_sequences), dtype=np.int64)
+
+    for start in range(0, len(dataset), chunk_size):
+        triggers = unpack_triggers(dataset.packed[start:start + chunk_size])
+
+        onset_counts += triggers.sum(axis=0, dtype=np.int64)
+
+        polyphony = triggers.sum(axis=1, dtype=np.int64)
+        polyphony_histogram += np.bincount(polyphony.ravel(),
+                                           minlength=num_sequences + 1)
+        full_events = (polyphony == max_polyphony).sum(axis=1)
+        full_polyphony_histogram += np.bincount(full_events,
+                                                minlength=num_steps + 1)
+
+        # One row per step, float32 counts stay exact below 2^24 steps per chunk
+        steps = triggers.transpose(0, 2, 1).reshape(-1, num_sequences)
+        steps = steps.astype(np.float32)
+        cooccurrence += (steps.T @ steps).astype(np.int64)
+
+    return DatasetStatistics(
+        labels=dataset.labels,
+        count=len(dataset),
+        max_polyphony=max_polyphony,
+        max_num_events_with_full_polyphony=max_num_events_with_full_polyphony,
+        onset_counts=onset_counts,
+        polyphony_histogram=polyphony_histogram,
+        full_polyphony_histogram=full_polyphony_histogram,
+        cooccurrence=cooccurrence,
+    )
+
+
+def load_statistics(dataset: PackedPatternDataset, max_polyphony: int, max_num_events_with_full_polyphony: int,
+                    chunk_size: int = 1 << 16) -> DatasetStatistics:
+    """
+    Returns the statistics cached at <prefix>.stats.npz, computing them again when the
+    patterns file or the polyphony limits changed since they were saved.
+    """
+    cache_path = dataset.path_prefix + STATS_SUFFIX
+    stat = os.stat(dataset.path_prefix + PATTERNS_SUFFIX)
+    signature = [stat.st_size, stat.st_mtime_ns]
+
+    if os.path.exists(cache_path):
+        statistics = DatasetStatistics.load(cache_path)
+        if statistics.source_signature == signature \
+                and statistics.max_polyphony == max_polyphony \
+                and statistics.max_num_events_with_full_polyphony == max_num_events_with_full_polyphony:
+            return statistics
+
+    statistics = compute_statistics(
+        dataset, max_polyphony, max_num_events_with_full_polyphony, chunk_size)
+    statistics.source_signature = signature
+    statistics.save(cache_path)
+    return statistics
@@ -0,0 +1,89 @@
+import hashlib
+import multiprocessing
+import os
+import numpy as np
+
+from .packed import decode_packed_tensor, pack_triggers
+from .pattern import RandomPatternConfig
+from .sampler import BatchPatternSampler
+from torch.utils.data import IterableDataset, get_worker_info
+from typing import Optional
+
+
+class StreamingPatternDataset(IterableDataset):
+    """
+    Streams augmented batches drawn from a base corpus, so that memory stays constant
+    whatever the amount of augmentation. Each epoch yields num_batches float tensors
+    [batch_size, sequences, steps]; use it with DataLoader(batch_size=None).
+
+    Batch k of an epoch is generated from its own seed (seed, epoch, k) and batches are
+    dealt round-robin to the DataLoader workers, so the stream is the same for any
+    number of workers. With a cache_dir, generated batches are stored as packed shards
+    and read back by later epochs or runs using the same corpus, config and seed.
+
+    The epoch lives in shared memory, so DataLoader workers see set_epoch whether or not
+    they are persistent. Call it before iterating the loader for the epoch.
+    """
+
+    def __init__(self, bases: np.ndarray, config: RandomPatternConfig, num_batches: int, batch_size: int,
+                 seed: int = 0, cache_dir: Optional[str] = None):
+        self.bases = (np.asarray(bases) > 0).astype(np.uint8)
+        self.config = config
+        self.num_batches = num_batches
+        self.batch_size = batch_size
+        self.seed = seed
+        self.cache_dir = cache_dir
+        self._epoch = multiprocessing.RawValue('q', 0)
+        self.sampler = BatchPatternSampler(config)
+
+        if cache_dir is not None:
+            os.makedirs(cache_dir, exist_ok=True)
+            self.key = self.cache_key()
+
+    def __len__(self):
+        return self.num_batches
+
+    @property
+    def epoch(self) -> int:
+        return self._epoch.value
+
+    def set_epoch(self, epoch: int):
+        # Called before each epoch, so that every epoch draws new augmentations
+        self._epoch.value = epoch
+
+    def cache_key(self) -> str:
+        digest = hashlib.sha1()
+        for array in (self.bases, self.sampler.cluster_tables, self.sampler.cum_weights):
+            digest.update(np.ascontiguousarray(array).tobytes())
+        digest.update(repr((self.config.max_polyphony, self.config.max_num_events_with_full_polyphony,
+                            self.batch_size, self.seed)).encode("utf-8"))
+        return digest.hexdigest()[:12]
+
+    def generate_batch(self, index: int) -> np.ndarray:
+        # Picks batch_size random bases and augments them in one vectorized pass
+        rng = np.random.default_rng([self.seed, self.epoch, index])
+        bases = self.bases[rng.integers(0, len(self.bases), self.batch_size)]
+        return pack_triggers(self.sampler.fill_empty_sequences(bases, rng))
+
+    def load_batch(self, index: int) -> np.ndarray:
+        if self.cache_dir is None:
+            return self.generate_batch(index)
+
+        path = os.path.join(
+            self.cache_dir, f"{self.key}-{self.epoch:04d}-{index:06d}.npy")
+        if os.path.exists(path):
+            return np.load(path)
+
+        packed = self.generate_batch(index)
+        # Written next to the final name first, so readers never see a partial shard
+        with open(path + ".tmp", "wb") as file:
+            np.save(file, packed)
+        os.replace(path + ".tmp", path)
+        return packed
+
+    def __iter__(self):
+        worker = get_worker_info()
+        worker_id, num_workers = (worker.id, worker.num_workers) if worker else (0, 1)
+
+        for index in range(worker_id, self.num_batches, num_workers):
+            yield decode_packed_tensor(self.load_batch(index))
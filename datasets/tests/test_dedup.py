@@ -0,0 +1,58 @@
+import numpy as np
+import pytest
+
+from dice_datasets import PatternDeduplicator, hash_packed, pack_triggers
+
+
+@pytest.fixture
+def packed():
+    rng = np.random.default_rng(0)
+    distinct = pack_triggers(rng.random((4, 16, 16)) > 0.5)
+    # Pattern 0 three times, pattern 1 twice, patterns 2 and 3 once
+    return distinct[[0, 1, 0, 2, 0, 1, 3]]
+
+
+def test_hash_packed_identifies_content(packed):
+    hashes = hash_packed(packed)
+
+    assert hashes.dtype == np.uint64
+    assert hashes[0] == hashes[2] == hashes[4]
+    assert len(np.unique(hashes)) == 4
+
+
+def test_deduplicator_counts_duplicates_per_source(packed):
+    deduplicator = PatternDeduplicator()
+    keep = deduplicator.update(packed, np.array([0, 0, 0, 1, 1, 1, 1]))
+    report = deduplicator.report(["a", "b"])
+
+    assert keep.all()
+    assert report["patterns"] == 7
+    assert report["unique"] == 4
+    assert report["duplicates"] == 3
+    assert [source["duplicates"] for source in report["sources"]] == [1, 2]
+    assert report["sources"][1]["file"] == "b"
+    assert 0 < report["hash_collision_probability"] < 1e-15
+
+
+def test_deduplicator_caps_copies_across_chunks(packed):
+    sources = np.zeros(len(packed), dtype=np.uint32)
+    whole = PatternDeduplicator(max_copies=2).update(packed, sources)
+
+    streamed = PatternDeduplicator(max_copies=2)
+    chunks = np.concatenate([streamed.update(packed[i:i + 3], sources[i:i + 3])
+                             for i in range(0, len(packed), 3)])
+
+    assert whole.tolist() == [True, True, True, True, False, True, True]
+    assert np.array_equal(whole, chunks)
+    assert streamed.report()["kept"] == 6
+
+
+def test_deduplicator_keeps_sorted_distinct_hashes(packed):
+    deduplicator = PatternDeduplicator()
+    for i in range(len(packed)):
+        deduplicator.update(packed[i:i + 1], np.zeros(1))
+
+    hashes = hash_packed(packed)
+    assert np.array_equal(deduplicator.hashes, np.unique(hashes))
+    positions = np.searchsorted(deduplicator.hashes, hashes[[0, 1, 3]])
+    assert deduplicator.counts[positions].tolist() == [3, 2, 1]
@@ -0,0 +1,20 @@
+import pytest
+import torch
+
+from dice_datasets import select_device
+
+
+def test_select_device_defaults_to_cpu(monkeypatch):
+    monkeypatch.delenv("DICE_DEVICE", raising=False)
+    assert select_device() == torch.device("cpu")
+
+
+def test_select_device_from_environment(monkeypatch):
+    monkeypatch.setenv("DICE_DEVICE", "cpu")
+    assert select_device() == torch.device("cpu")
+
+
+def test_select_device_falls_back_to_cpu(monkeypatch):
+    monkeypatch.setattr(torch.cuda, "is_available", lambda: False)
+    with pytest.warns(UserWarning):
+        assert select_device("cuda") == torch.device("cpu")
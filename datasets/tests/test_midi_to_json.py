@@ -0,0 +1,67 @@
+import importlib.util
+import json
+import mido
+import os
+import pytest
+
+from dice_datasets import PatternShard
+
+
+@pytest.fixture(scope="module")
+def midi_to_json():
+    path = os.path.join(os.path.dirname(__file__), "..", "scripts", "midi_to_json.py")
+    spec = importlib.util.spec_from_file_location("midi_to_json", path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def write_midi(path, notes):
+    midi = mido.MidiFile()
+    track = mido.MidiTrack()
+    midi.tracks.append(track)
+    for note in notes:
+        track.append(mido.Message("note_on", note=note, velocity=100, time=0))
+        track.append(mido.Message("note_off", note=note, velocity=0, time=120))
+    midi.save(str(path))
+
+
+def test_truncated_midi_is_recorded_and_skipped(tmp_path, midi_to_json):
+    midi_dir, output_dir = tmp_path / "midi", tmp_path / "json"
+    midi_dir.mkdir()
+    write_midi(midi_dir / "a rock.mid", [36, 38])
+    write_midi(midi_dir / "b rock.mid", [36])
+    data = (midi_dir / "b rock.mid").read_bytes()
+    (midi_dir / "b rock.mid").write_bytes(data[:20])
+
+    assert midi_to_json.process_directory(str(midi_dir), str(output_dir), workers=0) == 2
+
+    manifest = json.loads((output_dir / midi_to_json.MANIFEST_FILE).read_text())
+    assert manifest["files"]["a rock.mid"]["outputs"] == ["DICE_0000.json"]
+    assert manifest["files"]["b rock.mid"]["outputs"] == []
+    assert "error" in manifest["files"]["b rock.mid"]
+    assert (output_dir / "DICE_0000.json").exists()
+
+    # Unchanged failures are not retried, repaired files are parsed again
+    assert midi_to_json.process_directory(str(midi_dir), str(output_dir), workers=0) == 0
+    write_midi(midi_dir / "b rock.mid", [36])
+    assert midi_to_json.process_directory(str(midi_dir), str(output_dir), workers=0) == 1
+
+    manifest = json.loads((output_dir / midi_to_json.MANIFEST_FILE).read_text())
+    assert manifest["files"]["b rock.mid"]["outputs"] == ["DICE_0001.json"]
+    assert "error" not in manifest["files"]["b rock.mid"]
+
+
+def test_directory_to_shard(tmp_path, midi_to_json):
+    midi_dir = tmp_path / "midi"
+    midi_dir.mkdir()
+    write_midi(midi_dir / "a rock 01.mid", [36, 38])
+    write_midi(midi_dir / "b funk 01.mid", [42])
+
+    shard_path = str(tmp_path / "bars.npz")
+    assert midi_to_json.process_directory_to_shard(str(midi_dir), shard_path, workers=0) == 2
+
+    shard = PatternShard.load(shard_path)
+    assert shard.filename.tolist() == ["a rock 01.mid", "b funk 01.mid"]
+    assert shard.genre.tolist() == ["rock", "funk"]
+    assert shard.triggers.sum() == 3
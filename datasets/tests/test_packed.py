@@ -0,0 +1,133 @@
+import numpy as np
+import pickle
+import pytest
+import torch
+
+from dice_datasets import PackedPatternDataset, collate_patterns, pack_triggers, save_packed_dataset, unpack_triggers
+from torch.utils.data import DataLoader
+
+
+@pytest.fixture
+def random_triggers():
+    rng = np.random.default_rng(0)
+    return (rng.random((10, 16, 16)) > 0.7).astype(np.uint8)
+
+
+@pytest.fixture
+def labels():
+    return [f"L{i}" for i in range(16)]
+
+
+def test_pack_uses_one_bit_per_step():
+    triggers = np.zeros((1, 16, 16), dtype=np.uint8)
+    triggers[0, 0, 0] = 1
+    triggers[0, 1, 15] = 1
+
+    packed = pack_triggers(triggers)
+
+    assert packed.dtype == np.dtype('<u2')
+    assert packed.shape == (1, 16)
+    assert packed[0, 0] == 1
+    assert packed[0, 1] == 1 << 15
+
+
+def test_pack_round_trip(random_triggers):
+    assert np.array_equal(unpack_triggers(
+        pack_triggers(random_triggers)), random_triggers)
+
+
+def test_packed_dataset_round_trip(tmp_path, random_triggers, labels):
+    prefix = str(tmp_path / "test")
+    save_packed_dataset(prefix, random_triggers, labels,
+                        sources=np.arange(10), files=["a.json"], metadata={"augmentation_factor": 3})
+
+    assert PackedPatternDataset.exists(prefix)
+    dataset = PackedPatternDataset(prefix)
+
+    assert len(dataset) == 10
+    assert dataset.labels == labels
+    assert dataset.metadata == {"augmentation_factor": 3}
+    assert torch.equal(dataset[3], torch.from_numpy(random_triggers[3]).float())
+    assert dataset.get_pattern(3).get_triggers() == random_triggers[3].tolist()
+
+
+def test_packed_dataset_base_indices(tmp_path, random_triggers, labels):
+    prefix = str(tmp_path / "test")
+    bases = np.zeros(10, dtype=bool)
+    bases[[0, 3, 7]] = True
+    save_packed_dataset(prefix, random_triggers, labels, bases=bases,
+                        metadata={"augmentation_factor": 2, "max_copies": 1})
+    assert PackedPatternDataset(prefix).get_base_indices().tolist() == [0, 3, 7]
+
+    # Without a recorded mask, each base is followed by its copies
+    save_packed_dataset(prefix, random_triggers, labels, metadata={"augmentation_factor": 2})
+    assert PackedPatternDataset(prefix).get_base_indices().tolist() == [0, 3, 6, 9]
+
+    save_packed_dataset(prefix, random_triggers, labels, metadata={"augmentation_factor": 2, "max_copies": 1})
+    with pytest.raises(ValueError):
+        PackedPatternDataset(prefix).get_base_indices()
+
+
+def test_packed_dataset_batches(tmp_path, random_triggers, labels):
+    prefix = str(tmp_path / "test")
+    save_packed_dataset(prefix, random_triggers, labels)
+    loader = DataLoader(PackedPatternDataset(prefix), batch_size=4,
+                        collate_fn=collate_patterns)
+
+    batch = next(iter(loader))
+
+    assert batch.shape == (4, 16, 16)
+    assert batch.dtype == torch.float32
+    assert torch.equal(batch, torch.from_numpy(random_triggers[:4]).float())
+
+
+def test_packed_dataset_preloaded_on_device(tmp_path, random_triggers, labels):
+    prefix = str(tmp_path / "test")
+    save_packed_dataset(prefix, random_triggers, labels)
+    dataset = PackedPatternDataset(prefix).to(torch.device("cpu"))
+
+    assert dataset.tensor.shape == (10, 16, 16)
+    assert dataset.tensor.is_contiguous()
+    assert torch.equal(dataset.__getitems__([2, 5]),
+                       torch.from_numpy(random_triggers[[2, 5]]).float())
+
+
+def test_packed_dataset_pickles_without_data(tmp_path, random_triggers, labels):
+    prefix = str(tmp_path / "test")
+    save_packed_dataset(prefix, random_triggers, labels)
+    dataset = PackedPatternDataset(prefix)
+
+    restored = pickle.loads(pickle.dumps(dataset))
+
+    assert len(pickle.dumps(dataset)) < random_triggers.nbytes
+    assert torch.equal(restored[4], dataset[4])
+
+
+def test_packed_dataset_channels(tmp_path, random_triggers, labels):
+    prefix = str(tmp_path / "test")
+    velocity = random_triggers * 127
+    duration = random_triggers * 15
+    save_packed_dataset(prefix, random_triggers, labels,
+                        planes={"velocity": velocity, "duration": duration})
+    dataset = PackedPatternDataset(
+        prefix, channels=["triggers", "duration", "velocity"])
+
+    sample = dataset[3]
+    batch = dataset.__getitems__([3, 4])
+    expected = torch.from_numpy(random_triggers[3]).float()
+
+    assert sample.shape == (3, 16, 16)
+    assert batch.shape == (2, 3, 16, 16)
+    assert batch.is_contiguous()
+    assert torch.equal(batch[0], sample)
+    for channel in range(3):
+        assert torch.equal(sample[channel], expected)
+    assert torch.equal(dataset.to(torch.device("cpu"))[3], sample)
+
+
+def test_packed_dataset_rejects_missing_channel(tmp_path, random_triggers, labels):
+    prefix = str(tmp_path / "test")
+    save_packed_dataset(prefix, random_triggers, labels)
+
+    with pytest.raises(ValueError):
+        PackedPatternDataset(prefix, channels=["triggers", "velocity"])
@@ -1,4 +1,5 @@
 import pytest
+import torch
 
 from dice_datasets import Pattern, RandomPatternConfig, RandomSequenceConfig, WeightedCluster
 
@@ -68,3 +69,16 @@ def test_augmentation_using_random_config_settings(simple_pattern_dict, ones_and
     assert pattern.valid_polyphony_requirements(
         ones_and_zeros_random_pattern_config.max_polyphony,
         ones_and_zeros_random_pattern_config.max_num_events_with_full_polyphony) == True
+
+
+def test_tensor_valid_polyphony_mask(ones_and_zeros_random_pattern_config):
+    config = ones_and_zeros_random_pattern_config
+    batch = torch.zeros(3, 1, 4, 16)
+    batch[1, 0, :2] = 1  # full polyphony on every step
+    batch[2, 0, :3, 0] = 1  # polyphony above the limit
+
+    mask = Pattern.tensor_valid_polyphony_mask(
+        batch, config.max_polyphony, config.max_num_events_with_full_polyphony)
+
+    assert mask.shape == (3, 1)
+    assert mask.squeeze(1).tolist() == [True, False, False]
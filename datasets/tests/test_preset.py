@@ -0,0 +1,93 @@
+import json
+import numpy as np
+import pytest
+
+from dice_datasets import CompiledPreset, RandomPatternConfig, RandomSequenceConfig, WeightedCluster
+
+
+@pytest.fixture
+def preset_dict():
+    return {
+        "max_polyphony": 2,
+        "max_num_events_with_full_polyphony": 2,
+        "random_sequence_configs": [
+            {
+                "label": "SD",
+                "length_in_clusters": 4,
+                "weighted_clusters": [
+                    {"triggers": [0, 0, 0, 1], "weight": 1},
+                    {"triggers": [1, 0, 0, 0], "weight": 2},
+                    {"triggers": [0, 0, 0, 1], "weight": 1},
+                ]
+            },
+            {
+                "label": "BD",
+                "length_in_clusters": 4,
+                "weighted_clusters": [
+                    {"triggers": [1, 1, 1, 1], "weight": 1},
+                ]
+            }
+        ]
+    }
+
+
+def test_compile_merges_duplicate_clusters(preset_dict):
+    compiled = CompiledPreset.compile(
+        RandomPatternConfig.from_dictionary(preset_dict))
+
+    # JSON order is reversed, as in RandomPatternConfig
+    assert compiled.labels == ["BD", "SD"]
+    assert compiled.merged_clusters.tolist() == [0, 1]
+    assert compiled.weights[1].tolist() == [2, 2]
+    assert compiled.cum_weights[1].tolist() == [0.5, 1.0]
+    assert compiled.cluster_tables[1, 0].tolist() == [0, 0, 0, 1]
+    assert compiled.expected_density().tolist() == [1.0, 0.25]
+    assert compiled.expected_polyphony().tolist() == [1.5, 1.0, 1.0, 1.5] * 4
+
+
+def test_compile_rejects_invalid_presets():
+    sequence = RandomSequenceConfig(
+        label="seq", length_in_clusters=4,
+        weighted_clusters=[WeightedCluster(triggers=[1, 0, 0, 0], weight=0)])
+    config = RandomPatternConfig(
+        max_polyphony=1, max_num_events_with_full_polyphony=1, random_sequence_configs=[sequence])
+
+    with pytest.raises(ValueError):
+        CompiledPreset.compile(config)
+
+
+def test_compiled_preset_cached_next_to_json(tmp_path, preset_dict):
+    path = tmp_path / "preset.json"
+    path.write_text(json.dumps(preset_dict))
+
+    compiled = CompiledPreset.from_json(str(path))
+    cache_path = tmp_path / "preset.compiled.npz"
+    assert cache_path.exists()
+
+    cached = CompiledPreset.from_json(str(path))
+    assert cached.labels == compiled.labels
+    assert np.array_equal(cached.cum_weights, compiled.cum_weights)
+
+    # Editing the JSON compiles it again
+    preset_dict["max_polyphony"] = 3
+    path.write_text(json.dumps(preset_dict))
+    assert CompiledPreset.from_json(str(path)).max_polyphony == 3
+
+
+def test_choose_never_picks_padding_when_weights_sum_inexactly():
+    sequences = [
+        RandomSequenceConfig(label="wide", length_in_clusters=1, weighted_clusters=[
+            WeightedCluster(triggers=[i // 8 % 2, i // 4 % 2, i // 2 % 2, i % 2], weight=0.1)
+            for i in range(1, 11)]),
+        RandomSequenceConfig(label="short", length_in_clusters=1, weighted_clusters=[
+            WeightedCluster(triggers=[1, 0, 0, 0], weight=0.1),
+            WeightedCluster(triggers=[0, 1, 0, 0], weight=0.2)]),
+    ]
+    compiled = CompiledPreset.compile(RandomPatternConfig(
+        max_polyphony=2, max_num_events_with_full_polyphony=2, random_sequence_configs=sequences))
+
+    # Largest uniform below 1.0, at or above the float sum of [0.1] * 10
+    patterns = compiled.choose(np.full((1, 2, 1), np.nextafter(1.0, 0.0)))
+
+    assert patterns[0, 0].tolist() == [1, 0, 1, 0]
+    assert patterns[0, 1].tolist() == [0, 1, 0, 0]
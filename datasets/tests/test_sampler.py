@@ -0,0 +1,163 @@
+import numpy as np
+import pytest
+
+from dice_datasets import BatchPatternSampler, Pattern, RandomPatternConfig, RandomSequenceConfig, SamplingStrategy, \
+    WeightedCluster, pattern_generators
+
+
+@pytest.fixture
+def ones_and_zeros_random_pattern_config():
+    ones_and_zeros = RandomSequenceConfig(
+        label="ones_and_zeros",
+        length_in_clusters=4,
+        weighted_clusters=[
+            WeightedCluster(
+                triggers=[1, 1, 1, 1],
+                weight=1
+            ),
+            WeightedCluster(
+                triggers=[0, 0, 0, 0],
+                weight=1
+            )
+        ]
+    )
+
+    return RandomPatternConfig(
+        max_polyphony=2,
+        max_num_events_with_full_polyphony=2,
+        random_sequence_configs=[
+            ones_and_zeros, ones_and_zeros, ones_and_zeros, ones_and_zeros
+        ]
+    )
+
+
+@pytest.fixture
+def ones_random_pattern_config():
+    ones = RandomSequenceConfig(
+        label="ones",
+        length_in_clusters=4,
+        weighted_clusters=[
+            WeightedCluster(triggers=[1, 1, 1, 1], weight=1),
+            WeightedCluster(triggers=[0, 0, 0, 0], weight=0)
+        ]
+    )
+
+    return RandomPatternConfig(
+        max_polyphony=4,
+        max_num_events_with_full_polyphony=16,
+        random_sequence_configs=[ones, ones, ones, ones]
+    )
+
+
+def test_sample_sequences_respects_weights(ones_random_pattern_config):
+    sampler = BatchPatternSampler(ones_random_pattern_config)
+    samples = sampler.sample_sequences(8, np.random.default_rng(0))
+
+    assert samples.shape == (8, 4, 16)
+    assert np.all(samples == 1)
+
+
+def test_fill_empty_sequences_keeps_polyphony_requirements(ones_and_zeros_random_pattern_config):
+    sampler = BatchPatternSampler(ones_and_zeros_random_pattern_config)
+    base = np.zeros((64, 4, 16), dtype=np.uint8)
+    base[:, 0, ::4] = 1
+
+    augmented = sampler.fill_empty_sequences(base, np.random.default_rng(0))
+
+    assert augmented.shape == base.shape
+    assert np.all(augmented[:, 0] == base[:, 0])
+    assert np.all(sampler.valid_polyphony_mask(augmented))
+    assert augmented.sum() > base.sum()
+
+
+def test_fill_empty_sequences_skips_invalid_patterns(ones_and_zeros_random_pattern_config):
+    sampler = BatchPatternSampler(ones_and_zeros_random_pattern_config)
+    base = np.zeros((4, 4, 16), dtype=np.uint8)
+    base[:, :3] = 1
+
+    augmented = sampler.fill_empty_sequences(base, np.random.default_rng(0))
+
+    assert np.array_equal(augmented, base)
+
+
+def test_augment_patterns(ones_and_zeros_random_pattern_config):
+    sampler = BatchPatternSampler(ones_and_zeros_random_pattern_config)
+    pattern = Pattern.from_array(np.zeros((4, 16)), ["A", "B", "C", "D"])
+
+    augmented = sampler.augment([pattern] * 3, np.random.default_rng(0))
+
+    assert len(augmented) == 3
+    assert all(result.get_labels() == ["A", "B", "C", "D"]
+               for result in augmented)
+
+    triggers = np.array([result.get_triggers() for result in augmented])
+    assert np.all(sampler.valid_polyphony_mask(triggers))
+
+
+def test_per_pattern_generators_do_not_depend_on_batching(ones_and_zeros_random_pattern_config):
+    sampler = BatchPatternSampler(ones_and_zeros_random_pattern_config)
+    base = np.zeros((10, 4, 16), dtype=np.uint8)
+    base[:, 0, ::4] = 1
+
+    whole = sampler.fill_empty_sequences(base, pattern_generators(7, range(10)))
+    split = np.concatenate([
+        sampler.fill_empty_sequences(base[:3], pattern_generators(7, range(3))),
+        sampler.fill_empty_sequences(base[3:], pattern_generators(7, range(3, 10))),
+    ])
+
+    assert np.array_equal(whole, split)
+    assert not np.array_equal(
+        whole, sampler.fill_empty_sequences(base, pattern_generators(8, range(10))))
+
+
+def test_constrained_sampling_fills_every_empty_row(ones_and_zeros_random_pattern_config):
+    sampler = BatchPatternSampler(ones_and_zeros_random_pattern_config, SamplingStrategy.CONSTRAINED)
+    base = np.zeros((64, 4, 16), dtype=np.uint8)
+    base[:, 0, ::4] = 1
+
+    augmented = sampler.fill_empty_sequences(base, pattern_generators(0, range(64)))
+
+    assert np.all(augmented[:, 0] == base[:, 0])
+    assert np.all(sampler.valid_polyphony_mask(augmented))
+    # Zero clusters always complete a row, so no row is left empty after a rejection
+    rejection = BatchPatternSampler(ones_and_zeros_random_pattern_config)
+    assert augmented.sum() > rejection.fill_empty_sequences(base, pattern_generators(0, range(64))).sum()
+
+
+def test_constrained_sampling_is_conditioned_on_validity(ones_and_zeros_random_pattern_config):
+    config = ones_and_zeros_random_pattern_config
+    config.random_sequence_configs = config.random_sequence_configs[:2]
+    config.max_num_events_with_full_polyphony = 4
+    sampler = BatchPatternSampler(config, SamplingStrategy.CONSTRAINED)
+    base = np.zeros((4000, 2, 16), dtype=np.uint8)
+    base[:, 0, :8] = 1
+
+    augmented = sampler.fill_empty_sequences(base, np.random.default_rng(0))
+    clusters = augmented[:, 1, ::4]
+
+    # At most one of the two overlapping clusters, each of the three valid choices equally likely
+    assert np.all(clusters[:, 0] + clusters[:, 1] <= 1)
+    assert clusters[:, 0].mean() == pytest.approx(1 / 3, abs=0.03)
+    assert clusters[:, 2].mean() == pytest.approx(1 / 2, abs=0.03)
+
+
+def test_constrained_sampling_leaves_unfillable_rows_empty():
+    # Without a zero cluster, rows next to a full row cannot stay within the limits
+    sequence = RandomSequenceConfig(
+        label="dense", length_in_clusters=4,
+        weighted_clusters=[WeightedCluster(triggers=[1, 1, 1, 1], weight=1),
+                           WeightedCluster(triggers=[1, 0, 1, 0], weight=1)])
+    config = RandomPatternConfig(
+        max_polyphony=2, max_num_events_with_full_polyphony=2,
+        random_sequence_configs=[sequence] * 4)
+    sampler = BatchPatternSampler(config, SamplingStrategy.CONSTRAINED)
+    base = np.zeros((8, 4, 16), dtype=np.uint8)
+    base[:4, 0] = 1
+
+    augmented = sampler.fill_empty_sequences(base, np.random.default_rng(0))
+
+    assert np.all(sampler.valid_polyphony_mask(augmented))
+    assert np.array_equal(augmented[:4, 0], base[:4, 0])
+    # Full base rows leave every other row empty, empty bases get one row at most
+    assert np.all(augmented[:4, 1:] == 0)
+    assert np.all((augmented[4:].any(axis=2)).sum(axis=1) == 1)
@@ -1,3 +1,4 @@
+import numpy as np
 import pytest
 
 from dice_datasets import WeightedCluster, RandomSequenceConfig, Sequence
@@ -82,3 +83,30 @@ def test_random_generation_with_zeros_and_ones(cluster_zeros, cluster_ones):
 
     assert triggers_sum <= 16
     assert triggers_sum >= 0
+
+
+def test_trigger_cache_invalidated_on_cluster_change(cluster_zeros, cluster_ones):
+    sequence = Sequence("test", [cluster_zeros] * 4)
+
+    assert sequence.is_empty()
+    assert sequence.get_trigger_mask() == 0
+
+    sequence.clusters = [cluster_zeros, cluster_ones, cluster_zeros, cluster_zeros]
+
+    assert not sequence.is_empty()
+    assert sequence.get_trigger_mask() == 0b11110000
+    assert sequence.get_triggers() == [0] * 4 + [1] * 4 + [0] * 8
+    assert sequence.get_trigger_tensor().sum().item() == 4
+
+
+def test_random_generation_with_generator_is_reproducible(cluster_zeros, cluster_ones):
+    config = RandomSequenceConfig(
+        label="test",
+        weighted_clusters=[cluster_zeros, cluster_ones],
+        length_in_clusters=16
+    )
+
+    first = Sequence.create_random(config, np.random.default_rng(3))
+    second = Sequence.create_random(config, np.random.default_rng(3))
+
+    assert first.get_triggers() == second.get_triggers()
@@ -0,0 +1,79 @@
+import numpy as np
+import pytest
+
+from dice_datasets import PatternShard, PatternShardBuffer
+
+
+@pytest.fixture
+def labels():
+    return [f"L{i}" for i in range(16)]
+
+
+def make_shard(labels, filename, bars):
+    rng = np.random.default_rng(len(filename))
+    triggers = (rng.random((bars, 16, 16)) > 0.8).astype(np.uint8)
+    return PatternShard(
+        labels=labels,
+        triggers=triggers,
+        velocity=triggers * 100,
+        duration=triggers,
+        swing=rng.random((bars, 16, 16), dtype=np.float32) * triggers,
+        filename=np.array([filename] * bars),
+        bar_index=np.arange(bars, dtype=np.int16),
+        bpm=np.full(bars, 120, dtype=np.int16),
+        genre=np.array(["rock"] * bars),
+    )
+
+
+def test_shard_round_trip(tmp_path, labels):
+    shard = make_shard(labels, "a.mid", 3)
+    path = str(tmp_path / "bars.npz")
+
+    shard.save(path)
+    loaded = PatternShard.load(path)
+
+    assert len(loaded) == 3
+    assert loaded.labels == labels
+    assert np.array_equal(loaded.triggers, shard.triggers)
+    assert np.array_equal(loaded.swing, shard.swing)
+    assert loaded.filename.tolist() == ["a.mid"] * 3
+    assert loaded.bar_index.tolist() == [0, 1, 2]
+
+
+def test_shard_concatenate_and_sources(labels):
+    shard = PatternShard.concatenate([
+        PatternShard.empty(labels),
+        make_shard(labels, "b.mid", 2),
+        make_shard(labels, "a_long_name.mid", 1),
+    ])
+
+    sources, files = shard.get_sources()
+
+    assert len(shard) == 3
+    assert files == ["a_long_name.mid", "b.mid"]
+    assert sources.tolist() == [1, 1, 0]
+
+
+def test_shard_concatenate_rejects_different_labels(labels):
+    with pytest.raises(ValueError):
+        PatternShard.concatenate([
+            make_shard(labels, "a.mid", 1),
+            make_shard(labels[::-1], "b.mid", 1),
+        ])
+
+
+def test_shard_buffer_matches_concatenate(labels):
+    parts = [make_shard(labels, "b.mid", 2), make_shard(labels, "a_long_name.mid", 3),
+             PatternShard.empty(labels), make_shard(labels, "c.mid", 1)]
+    buffer = PatternShardBuffer(labels, capacity=1)
+    for part in parts:
+        buffer.append(part)
+
+    shard, expected = buffer.to_shard(), PatternShard.concatenate(parts)
+
+    assert len(buffer) == 6
+    for name in ["triggers", "velocity", "duration", "swing", "bar_index", "bpm", "genre"]:
+        assert np.array_equal(getattr(shard, name), getattr(expected, name))
+    assert shard.filename.tolist() == ["b.mid"] * 2 + ["a_long_name.mid"] * 3 + ["c.mid"]
+    with pytest.raises(ValueError):
+        buffer.append(make_shard(labels[::-1], "d.mid", 1))
@@ -0,0 +1,46 @@
+import numpy as np
+import os
+import pytest
+
+from dice_datasets import PackedPatternDataset, compute_statistics, load_statistics, save_packed_dataset
+
+
+@pytest.fixture
+def dataset(tmp_path):
+    triggers = np.zeros((3, 4, 16), dtype=np.uint8)
+    triggers[0, :2, 0] = 1     # polyphony 2 on step 0
+    triggers[1, :3, :2] = 1    # polyphony 3 on steps 0 and 1
+    triggers[2, 3, ::4] = 1
+    prefix = str(tmp_path / "test")
+    save_packed_dataset(prefix, triggers, ["A", "B", "C", "D"])
+    return PackedPatternDataset(prefix)
+
+
+def test_statistics_single_pass(dataset):
+    statistics = compute_statistics(dataset, max_polyphony=3,
+                                    max_num_events_with_full_polyphony=1, chunk_size=2)
+
+    assert statistics.count == 3
+    assert statistics.onset_counts[0, 0] == 2
+    assert statistics.onset_density()[3, 4] == pytest.approx(1 / 3)
+    assert statistics.polyphony_histogram.tolist()[:4] == [41, 4, 1, 2]
+    assert statistics.full_polyphony_histogram[:3].tolist() == [2, 0, 1]
+    assert statistics.over_full_polyphony_limit() == 1
+    assert statistics.cooccurrence[0, 1] == 3
+    assert statistics.cooccurrence[0, 3] == 0
+    assert np.array_equal(statistics.cooccurrence.diagonal(),
+                          statistics.onset_counts.sum(axis=1))
+
+
+def test_statistics_are_cached(dataset):
+    first = load_statistics(dataset, 3, 1)
+    cache_path = dataset.path_prefix + ".stats.npz"
+    assert os.path.exists(cache_path)
+
+    mtime = os.stat(cache_path).st_mtime_ns
+    cached = load_statistics(dataset, 3, 1)
+    assert os.stat(cache_path).st_mtime_ns == mtime
+    assert np.array_equal(cached.cooccurrence, first.cooccurrence)
+
+    # Other limits invalidate the cache
+    assert load_statistics(dataset, 2, 1).max_polyphony == 2
@@ -0,0 +1,88 @@
+import numpy as np
+import os
+import pytest
+import torch
+
+from dice_datasets import RandomPatternConfig, RandomSequenceConfig, StreamingPatternDataset, WeightedCluster
+from torch.utils.data import DataLoader
+
+
+@pytest.fixture
+def config():
+    sequence = RandomSequenceConfig(
+        label="seq",
+        length_in_clusters=4,
+        weighted_clusters=[
+            WeightedCluster(triggers=[1, 0, 0, 0], weight=1),
+            WeightedCluster(triggers=[0, 0, 1, 0], weight=1),
+        ]
+    )
+    return RandomPatternConfig(
+        max_polyphony=16,
+        max_num_events_with_full_polyphony=16,
+        random_sequence_configs=[sequence] * 16
+    )
+
+
+@pytest.fixture
+def bases():
+    bases = np.zeros((6, 16, 16), dtype=np.uint8)
+    bases[:, 0, ::4] = 1
+    return bases
+
+
+def collect(loader):
+    return torch.cat(list(loader))
+
+
+def test_stream_shapes(config, bases):
+    stream = StreamingPatternDataset(bases, config, num_batches=3, batch_size=5)
+    batches = list(stream)
+
+    assert len(stream) == 3
+    assert [batch.shape for batch in batches] == [(5, 16, 16)] * 3
+    # Base row is kept, empty rows are filled
+    assert all(torch.equal(batch[:, 0], torch.from_numpy(bases[:5, 0]).float())
+               for batch in batches)
+    assert all(batch[:, 1:].any(dim=-1).all() for batch in batches)
+
+
+def test_stream_is_independent_of_workers(config, bases):
+    stream = StreamingPatternDataset(bases, config, num_batches=5, batch_size=4, seed=3)
+
+    in_process = collect(DataLoader(stream, batch_size=None))
+    two_workers = collect(DataLoader(stream, batch_size=None, num_workers=2))
+
+    assert torch.equal(in_process, two_workers)
+
+
+def test_stream_epochs_draw_new_patterns(config, bases):
+    stream = StreamingPatternDataset(bases, config, num_batches=2, batch_size=8)
+    first = collect(stream)
+    stream.set_epoch(1)
+
+    assert not torch.equal(first, collect(stream))
+
+
+def test_stream_epochs_reach_persistent_workers(config, bases):
+    stream = StreamingPatternDataset(bases, config, num_batches=2, batch_size=8)
+    loader = DataLoader(stream, batch_size=None, num_workers=2, persistent_workers=True)
+    first = collect(loader)
+    stream.set_epoch(1)
+    second = collect(loader)
+
+    assert torch.equal(first, collect(StreamingPatternDataset(bases, config, num_batches=2, batch_size=8)))
+    assert torch.equal(second, collect(stream))
+
+
+def test_stream_cache_is_reused(tmp_path, config, bases):
+    stream = StreamingPatternDataset(bases, config, num_batches=2, batch_size=4,
+                                     cache_dir=str(tmp_path))
+    first = collect(stream)
+
+    assert len(os.listdir(tmp_path)) == 2
+
+    cached = StreamingPatternDataset(bases, config, num_batches=2, batch_size=4,
+                                     cache_dir=str(tmp_path))
+    cached.generate_batch = None  # any cache miss would fail
+    assert torch.equal(first, collect(cached))
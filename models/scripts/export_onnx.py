@@ -10,7 +10,7 @@ from onnxsim import simplify
 from rich.text import Text
 from rich.console import Console
 
-from dice_models.architectures import ConvAutoencoder, AttentionUNet, DiceArchitecture
+from dice_models import FusedDiceTransform, exportDiceModel, loadDiceRun
 
 console = Console()
 
@@ -19,8 +19,13 @@ def parse_args():
     parser = argparse.ArgumentParser(description="Load a DICE model")
     parser.add_argument('--id', type=str, required=True,
                         help='Model identifier')
-    parser.add_argument('--architecture', type=str,
-                        required=True, help='Model architecture')
+    parser.add_argument('--architecture', type=str, default=None,
+                        help='Model architecture, checked against the run JSON')
+    parser.add_argument('--dynamic_batch', action='store_true',
+                        help='Export with a dynamic batch axis, saved as <id>.batch.onnx')
+    parser.add_argument('--fused', action='store_true',
+                        help='Bake flip, noise and threshold into the graph, saved as <id>.fused.onnx '
+                             '(<id>.batch.fused.onnx with --dynamic_batch)')
     return parser.parse_args()
 
 
@@ -40,40 +45,39 @@ def simplify_onnx(model_onnx):
     return model_simp
 
 
-def inference_onnx(model_onnx, input_tensor):
+def inference_onnx(model_onnx, *input_tensors):
     session = ort.InferenceSession(model_onnx)
-    input_name = session.get_inputs()[0].name
-    outputs = session.run(None, {input_name: input_tensor})[0]
+    input_names = [model_input.name for model_input in session.get_inputs()]
+    outputs = session.run(None, dict(zip(input_names, input_tensors)))[0]
+    if outputs.dtype == np.uint8:
+        # Fused graphs are already thresholded
+        return outputs
     outputs[outputs >= 0.5] = 1
     outputs[outputs < 0.5] = 0
     return outputs
 
 
-def inference_torch(model_tocrh, input_tensor):
+def inference_torch(model_tocrh, *input_tensors):
     model_tocrh.eval()
     with torch.no_grad():
-        outputs = model_tocrh(input_tensor)
+        outputs = model_tocrh(*input_tensors)
+        if outputs.dtype == torch.uint8:
+            return outputs
         outputs[outputs >= 0.5] = 1
         outputs[outputs < 0.5] = 0
     return outputs
 
 
-def loadDiceModel(model_torch_path, architecture: DiceArchitecture):
-    state_dict = torch.load(model_torch_path, weights_only=False)
-    match DiceArchitecture(architecture):
-        case DiceArchitecture.CONVOLUTIONAL_AUTO_ENCODER:
-            model = ConvAutoencoder()
-        case DiceArchitecture.ATTENTION_UNET:
-            model = AttentionUNet(num_channels=1)
-    model.load_state_dict(state_dict)
-    return model
-
-
 def get_workspace_path():
     return os.path.abspath(
         os.path.join(os.path.dirname(__file__), "..", ".."))
 
 
+def get_export_suffix(dynamic_batch, fused):
+    # The app keeps loading <id>.onnx, other exports get their own file
+    return (".batch" if dynamic_batch else "") + (".fused" if fused else "") + ".onnx"
+
+
 def get_dist_path(id):
     return os.path.join(get_workspace_path(), "dist", id)
 
@@ -81,32 +85,31 @@ def get_dist_path(id):
 if __name__ == "__main__":
     console.print("[bold cyan]DICE Model Conversion - ONNX")
     args = parse_args()
-    dummy_input = torch.randn(1, 1, 16, 16)
-
-    model_torch_path = os.path.join(
-        get_dist_path(args.id), args.id + ".pth")
-    model_onnx_path = os.path.join(
-        get_dist_path(args.id), args.id + ".onnx")
-
-    model_torch = loadDiceModel(model_torch_path, args.architecture)
-    model_torch.eval()
-
-    torch.onnx.export(
-        model_torch,
-        dummy_input,
-        model_onnx_path,
-        export_params=True,
-        opset_version=11,
-        do_constant_folding=True,
-        input_names=['input'],
-        output_names=['output']
-    )
+    run_path = os.path.join(get_dist_path(args.id), args.id)
+    model_onnx_path = run_path + get_export_suffix(args.dynamic_batch, args.fused)
+
+    # Architecture and channels come from the run JSON written by train_model.py
+    model_torch, run = loadDiceRun(run_path)
+    if args.architecture and args.architecture != run["architecture"]:
+        raise ValueError(
+            f"Model {args.id} was trained as {run['architecture']}, not {args.architecture}")
+
+    exportDiceModel(model_torch, model_onnx_path, len(run["channels"]),
+                    dynamic_batch=args.dynamic_batch, fused=args.fused)
     model_onnx = onnx.load(model_onnx_path)
     model_onnx = simplify_onnx(model_onnx)
 
+    # Check a larger batch when the batch axis is dynamic
+    batch_size = 3 if args.dynamic_batch else 1
+    dummy_inputs = [torch.randn(batch_size, len(run["channels"]), 16, 16)]
+    if args.fused:
+        model_torch = FusedDiceTransform(model_torch)
+        dummy_inputs += [torch.rand(batch_size, len(run["channels"]), 16, 16) * 2 - 1,
+                         torch.full((batch_size,), 0.2), torch.full((batch_size,), 0.5)]
+
     # Perform inference on both PyTorch and ONNX models
-    outputs_torch = inference_torch(model_torch, dummy_input)
-    outputs_onnx = inference_onnx(model_onnx_path, dummy_input.numpy())
+    outputs_torch = inference_torch(model_torch, *dummy_inputs)
+    outputs_onnx = inference_onnx(model_onnx_path, *[tensor.numpy() for tensor in dummy_inputs])
 
     # Verify outputs are identical
     assert np.array_equal(outputs_torch.numpy(),
@@ -0,0 +1,158 @@
+import argparse
+import json
+import numpy as np
+import onnx
+import onnxruntime as ort
+import os
+import time
+import torch
+
+from dice_datasets import PackedPatternDataset
+from dice_models import BatchNoiseInjector, exportDiceModel, loadDiceRun, pruneDiceModel
+from dice_models.serving import runSession
+from onnx.external_data_helper import uses_external_data
+from onnxruntime.quantization import CalibrationDataReader, QuantFormat, QuantType, quantize_dynamic, \
+    quantize_static
+from rich.console import Console
+from rich.table import Table
+from rich.text import Text
+
+console = Console()
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Quantize an exported DICE model to int8")
+    parser.add_argument('--id', type=str, required=True,
+                        help='Model identifier')
+    parser.add_argument('--mode', type=str, default='static', choices=['dynamic', 'static'],
+                        help='Dynamic quantizes weights only, static also calibrates activations')
+    parser.add_argument('--calibration_samples', type=int, default=256,
+                        help='Training patterns used to calibrate activation ranges')
+    parser.add_argument('--evaluation_samples', type=int, default=1024,
+                        help='Patterns compared between the fp32 and int8 models')
+    parser.add_argument('--prune_amount', type=float, default=0.0,
+                        help='Fraction of hidden channels removed from the model before export')
+    parser.add_argument('--per_channel', action='store_true',
+                        help='Quantize weights per output channel')
+    parser.add_argument('--seed', type=int, default=0,
+                        help='Seed for the calibration and evaluation samples and their noise')
+    return parser.parse_args()
+
+
+class PatternCalibrationReader(CalibrationDataReader):
+    # Feeds noisy training patterns one batch at a time, as the model sees them in training
+    def __init__(self, input_name, batches):
+        self.input_name = input_name
+        self.batches = iter(batches)
+
+    def get_next(self):
+        batch = next(self.batches, None)
+        return None if batch is None else {self.input_name: batch}
+
+
+def sample_inputs(dataset, indices, noise_level, seed, batch_size):
+    injector = BatchNoiseInjector(torch.device("cpu"), noise_level, seed)
+    return [injector(torch.stack([dataset[int(i)] for i in indices[start:start + batch_size]]))[1].numpy()
+            for start in range(0, len(indices), batch_size)]
+
+
+def binarized_outputs(session, batches):
+    # Same binarization as export_onnx.py, with the time spent in the session
+    start = time.perf_counter()
+    outputs = np.concatenate([runSession(session, batch) for batch in batches])
+    return outputs >= 0.5, time.perf_counter() - start
+
+
+def model_bytes(path):
+    # Exports may keep their weights next to the graph, as external data files it references
+    model = onnx.load(path, load_external_data=False)
+    locations = {entry.value for tensor in model.graph.initializer if uses_external_data(tensor)
+                 for entry in tensor.external_data if entry.key == "location"}
+    return os.path.getsize(path) + sum(
+        os.path.getsize(os.path.join(os.path.dirname(path), location)) for location in locations)
+
+
+def get_workspace_path():
+    return os.path.abspath(
+        os.path.join(os.path.dirname(__file__), "..", ".."))
+
+
+def get_dist_path(id):
+    return os.path.join(get_workspace_path(), "dist", id)
+
+
+if __name__ == "__main__":
+    console.print("[bold cyan]DICE Model Quantization - ONNX")
+    args = parse_args()
+    run_path = os.path.join(get_dist_path(args.id), args.id)
+    model_torch, run = loadDiceRun(run_path)
+
+    # Pruned models are exported again with fewer channels, the fp32 reference stays the model of export_onnx.py
+    reference_path = run_path + ".onnx"
+    source_path = reference_path
+    if args.prune_amount > 0:
+        source_path = run_path + ".pruned.onnx"
+        exportDiceModel(pruneDiceModel(model_torch, args.prune_amount),
+                        source_path, len(run["channels"]))
+    if not os.path.exists(reference_path):
+        raise FileNotFoundError(f"No ONNX model at {reference_path}, run export_onnx.py first")
+
+    dataset_id = run.get("dataset") or args.id
+    dataset = PackedPatternDataset(
+        os.path.join(get_dist_path(dataset_id), dataset_id),
+        channels=run["channels"] if len(run["channels"]) > 1 else None)
+    rng = np.random.default_rng(args.seed)
+    indices = rng.permutation(len(dataset))
+    calibration_indices = indices[:args.calibration_samples]
+    evaluation_indices = indices[args.calibration_samples:][:args.evaluation_samples]
+    if len(evaluation_indices) == 0:
+        # Small datasets are evaluated on their calibration patterns
+        evaluation_indices = calibration_indices
+
+    quantized_path = run_path + ".int8.onnx"
+    source_input = ort.InferenceSession(source_path).get_inputs()[0]
+    # Calibration batches match the batch axis of the exported model, fixed to one for the app
+    batch_size = source_input.shape[0] if isinstance(source_input.shape[0], int) else 32
+    if args.mode == "dynamic":
+        quantize_dynamic(source_path, quantized_path, weight_type=QuantType.QInt8,
+                         per_channel=args.per_channel)
+    else:
+        calibration = sample_inputs(dataset, calibration_indices, run["noise_level"], args.seed, batch_size)
+        quantize_static(source_path, quantized_path, PatternCalibrationReader(source_input.name, calibration),
+                        quant_format=QuantFormat.QDQ, activation_type=QuantType.QUInt8,
+                        weight_type=QuantType.QInt8, per_channel=args.per_channel)
+
+    # Compare binarized outputs instead of asserting them equal, int8 rounding flips a few steps
+    evaluation = sample_inputs(dataset, evaluation_indices, run["noise_level"], args.seed + 1, 32)
+    reference, reference_seconds = binarized_outputs(ort.InferenceSession(reference_path), evaluation)
+    quantized, quantized_seconds = binarized_outputs(ort.InferenceSession(quantized_path), evaluation)
+    mismatches = reference != quantized
+    if args.prune_amount > 0:
+        _, pruned_seconds = binarized_outputs(ort.InferenceSession(source_path), evaluation)
+
+    report = {
+        "mode": args.mode,
+        "per_channel": args.per_channel,
+        "prune_amount": args.prune_amount,
+        "calibration_samples": len(calibration_indices),
+        "evaluation_samples": len(evaluation_indices),
+        "mismatch_rate": float(mismatches.mean()),
+        "pattern_mismatch_rate": float(mismatches.reshape(len(mismatches), -1).any(axis=1).mean()),
+        "fp32_ms_per_pattern": 1000 * reference_seconds / len(reference),
+        "int8_ms_per_pattern": 1000 * quantized_seconds / len(quantized),
+        "fp32_bytes": model_bytes(reference_path),
+        "int8_bytes": model_bytes(quantized_path),
+    }
+    if args.prune_amount > 0:
+        report["pruned_fp32_ms_per_pattern"] = 1000 * pruned_seconds / len(reference)
+        report["pruned_fp32_bytes"] = model_bytes(source_path)
+    with open(run_path + ".int8.json", "w") as outfile:
+        json.dump(report, outfile, indent=2)
+
+    table = Table(title=f"Quantization {args.id}")
+    table.add_column("metric")
+    table.add_column("value")
+    for key, value in report.items():
+        table.add_row(key, f"{value:.4g}" if isinstance(value, float) else str(value))
+    console.print(table)
+    console.print(Text(f"Saved at destination {quantized_path}", style="yellow"))
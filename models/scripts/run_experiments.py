@@ -1,11 +1,37 @@
+import argparse
+import hashlib
 import os
 import json
+import subprocess
+import threading
 import time
 
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from dataclasses import dataclass, field
+from typing import List, Optional
+
 EXPERIMENTS_JSON = "experiments.json"
 SUMMARY_JSON = "summary.json"
 DIST_DIR = "dist"
 
+REQUIRED_KEYS = [
+    "id", "architecture", "loss", "augmentation_preset", "augmentation_factor",
+    "noise_level", "batch_size", "epochs", "learning_rate"
+]
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Run DICE experiments")
+    parser.add_argument('--experiments', type=str, default=EXPERIMENTS_JSON,
+                        help='Experiments configuration file')
+    parser.add_argument('--cpu_slots', type=int, default=1,
+                        help='Number of dataset, ONNX and cargo stages running at once')
+    parser.add_argument('--gpu_slots', type=int, default=1,
+                        help='Number of training stages running at once')
+    parser.add_argument('--force', action='store_true',
+                        help='Ignore cached stages and run everything again')
+    return parser.parse_args()
+
 
 def get_workspace_path():
     return os.path.abspath(
@@ -24,76 +50,253 @@ def get_cargo_debug():
     return os.path.join(get_workspace_path(), "app", "target", "debug")
 
 
-def run_command(cmd):
-    print(f"[RUNNING] {cmd}")
-    return os.system(cmd) == 0
-
-
-def run_experiment(exp):
-    required_keys = [
-        "id", "architecture", "loss", "augmentation_preset", "augmentation_factor",
-        "noise_level", "batch_size", "epochs", "learning_rate"
-    ]
-    for key in required_keys:
-        if key not in exp:
-            raise ValueError(
-                f"Missing required key '{key}' in experiment config.")
-
-    dataset_cmd = (
-        f"cd {get_workspace_path()} && "
-        f"cd datasets && "
-        f"python scripts/generate_datasets.py "
-        f"--id {exp['id']} --json ./json "
-        f"--augmentation_factor {exp['augmentation_factor']} "
-        f"--augmentation_preset {exp['augmentation_preset']}"
-    )
-    if not run_command(dataset_cmd):
-        return {"id": exp["id"], "status": "dataset_failed"}
-
-    train_cmd = (
-        f"cd {get_workspace_path()} && "
-        f"cd models && "
-        f"python scripts/train_model.py "
-        f"--id {exp['id']} "
-        f"--augmentation_preset {exp['augmentation_preset']} "
-        f"--architecture {exp['architecture']} "
-        f"--loss {exp['loss']} "
-        f"--noise_level {exp['noise_level']} "
-        f"--batch_size {exp['batch_size']} "
-        f"--epochs {exp['epochs']} "
-        f"--learning_rate {exp['learning_rate']}"
-    )
-    if not run_command(train_cmd):
-        return {"id": exp["id"], "status": "train_failed"}
-
-    onnx_cmd = (
-        f"cd {get_workspace_path()} && "
-        f"cd models && "
-        f"python scripts/export_onnx.py "
-        f"--id {exp['id']} "
-        f"--architecture {exp['architecture']} "
-    )
-    if not run_command(onnx_cmd):
-        return {"id": exp["id"], "status": "onnx_failed"}
-
-    cargo_cmd = (
-        f"cd {get_workspace_path()} && "
-        f"cd app && "
-        f"ONNX_MODEL_PATH=\"../../dist/{exp['id']}/{exp['id']}.onnx\" cargo make dice-m4l && "
-        f"mv {get_cargo_debug()}/dice.zip {get_dist_path(exp['id'])}/{exp['id']}.zip"
+def content_hash(*parts):
+    digest = hashlib.sha256()
+    for part in parts:
+        digest.update(json.dumps(part, sort_keys=True).encode("utf-8"))
+    return digest.hexdigest()
+
+
+def file_hash(path):
+    with open(path, "rb") as file:
+        return hashlib.sha256(file.read()).hexdigest()
+
+
+def json_folder_signature(json_folder):
+    # Names, sizes and modification times identify the dataset sources without reading them
+    if not os.path.isdir(json_folder):
+        return []
+    return sorted(
+        (entry.name, entry.stat().st_size, entry.stat().st_mtime_ns)
+        for entry in os.scandir(json_folder) if entry.name.endswith(".json")
     )
-    if not run_command(cargo_cmd):
-        return {"id": exp["id"], "status": "cargo_failed"}
+
+
+@dataclass
+class Stage:
+    name: str
+    kind: str
+    slot: str
+    key: str
+    output_id: str
+    command: str
+    output_suffix: str
+    deps: List['Stage'] = field(default_factory=list)
+    status: str = "pending"
+    duration: Optional[float] = None
+
+    def marker_path(self):
+        return os.path.join(get_dist_path(self.output_id), f".{self.kind}.stage.json")
+
+    def log_path(self):
+        return os.path.join(get_dist_path(self.output_id), f"{self.kind}.log")
+
+    def output_path(self):
+        return os.path.join(get_dist_path(self.output_id), self.output_id + self.output_suffix)
+
+    def is_cached(self):
+        # A matching marker only counts while the stage output is still there
+        if not os.path.exists(self.marker_path()) or not os.path.exists(self.output_path()):
+            return False
+        with open(self.marker_path()) as f:
+            return json.load(f).get("key") == self.key
+
+    def run(self, slot):
+        # Runs on an executor thread, holding the slot acquired by the scheduler
+        returncode, error = None, None
+        start = time.perf_counter()
+        try:
+            print(f"[RUNNING] {self.name}")
+            os.makedirs(get_dist_path(self.output_id), exist_ok=True)
+            with open(self.log_path(), "w") as log:
+                returncode = subprocess.run(
+                    self.command, shell=True, stdout=log, stderr=subprocess.STDOUT).returncode
+        except (OSError, subprocess.SubprocessError) as e:
+            # A stage that cannot be started fails on its own instead of stopping the scheduler
+            error = e
+        finally:
+            self.duration = round(time.perf_counter() - start, 2)
+            slot.release()
+
+        if error is not None or returncode != 0:
+            self.status = "failed"
+            reason = f"{type(error).__name__}: {error}" if error is not None else f"see {self.log_path()}"
+            print(f"[FAILED] {self.name}, {reason}")
+            return self
+
+        with open(self.marker_path(), "w") as f:
+            json.dump({"key": self.key, "duration": self.duration}, f)
+        self.status = "done"
+        print(f"[DONE] {self.name} in {self.duration}s")
+        return self
+
+
+def build_stages(experiments):
+    """
+    Builds the dataset -> train -> onnx -> cargo DAG. Stages are keyed by a hash of their
+    inputs, so experiments sharing a dataset configuration share a single dataset stage.
+    """
+    json_folder = os.path.join(get_workspace_path(), "datasets", "json")
+    json_signature = json_folder_signature(json_folder)
+
+    dataset_stages = {}
+    pipelines = {}
+    for exp in experiments:
+        for key in REQUIRED_KEYS:
+            if key not in exp:
+                raise ValueError(
+                    f"Missing required key '{key}' in experiment config.")
+
+        # Channels after triggers are stored as dataset planes, single channel keys are unchanged
+        planes = exp.get("channels", ["triggers"])[1:]
+        dataset_key = content_hash(
+            "dataset", file_hash(get_preset_path(exp["augmentation_preset"])),
+            exp["augmentation_factor"], json_signature, *([planes] if planes else []))
+        if dataset_key not in dataset_stages:
+            dataset_id = f"dataset-{dataset_key[:12]}"
+            dataset_stages[dataset_key] = Stage(
+                name=f"dataset {dataset_id}",
+                kind="dataset",
+                slot="cpu",
+                key=dataset_key,
+                output_id=dataset_id,
+                output_suffix=".patterns.npy",
+                command=(
+                    f"cd {get_workspace_path()} && "
+                    f"cd datasets && "
+                    f"python scripts/generate_datasets.py "
+                    f"--id {dataset_id} --json ./json "
+                    f"--augmentation_factor {exp['augmentation_factor']} "
+                    f"--augmentation_preset {exp['augmentation_preset']}"
+                    + (f" --planes {' '.join(planes)}" if planes else "")
+                ))
+        dataset = dataset_stages[dataset_key]
+
+        train_cmd = (
+            f"cd {get_workspace_path()} && "
+            f"cd models && "
+            f"python scripts/train_model.py "
+            f"--id {exp['id']} "
+            f"--dataset {dataset.output_id} "
+            f"--augmentation_preset {exp['augmentation_preset']} "
+            f"--architecture {exp['architecture']} "
+            f"--loss {exp['loss']} "
+            f"--noise_level {exp['noise_level']} "
+            f"--batch_size {exp['batch_size']} "
+            f"--epochs {exp['epochs']} "
+            f"--learning_rate {exp['learning_rate']}"
+        )
+        # Optional performance settings, recorded by train_model.py in the run JSON
+        if "precision" in exp:
+            train_cmd += f" --precision {exp['precision']}"
+        if exp.get("compile"):
+            train_cmd += " --compile"
+        if exp.get("channels_last"):
+            train_cmd += " --channels_last"
+        if "channels" in exp:
+            train_cmd += f" --channels {' '.join(exp['channels'])}"
+
+        train_key = content_hash("train", dataset.key, exp)
+        train = Stage(
+            name=f"train {exp['id']}", kind="train", slot="gpu", key=train_key,
+            output_id=exp["id"], command=train_cmd, output_suffix=".pth", deps=[dataset])
+
+        onnx = Stage(
+            name=f"onnx {exp['id']}", kind="onnx", slot="cpu",
+            key=content_hash("onnx", train_key), output_id=exp["id"], output_suffix=".onnx",
+            command=(
+                f"cd {get_workspace_path()} && "
+                f"cd models && "
+                f"python scripts/export_onnx.py "
+                f"--id {exp['id']} "
+                f"--architecture {exp['architecture']} "
+            ),
+            deps=[train])
+
+        # Cargo builds share the app target folder and run one at a time
+        cargo = Stage(
+            name=f"cargo {exp['id']}", kind="cargo", slot="cargo",
+            key=content_hash("cargo", onnx.key), output_id=exp["id"], output_suffix=".zip",
+            command=(
+                f"cd {get_workspace_path()} && "
+                f"cd app && "
+                f"ONNX_MODEL_PATH=\"../../dist/{exp['id']}/{exp['id']}.onnx\" cargo make dice-m4l && "
+                f"mv {get_cargo_debug()}/dice.zip {get_dist_path(exp['id'])}/{exp['id']}.zip"
+            ),
+            deps=[onnx])
+
+        pipelines[exp["id"]] = [dataset, train, onnx, cargo]
+
+    return pipelines
+
+
+def run_stages(pipelines, cpu_slots, gpu_slots, force=False):
+    stages = list({id(stage): stage for pipeline in pipelines.values()
+                   for stage in pipeline}.values())
+    slots = {
+        "cpu": threading.Semaphore(cpu_slots),
+        "gpu": threading.Semaphore(gpu_slots),
+        "cargo": threading.Semaphore(1),
+    }
+
+    # Stages are only submitted once their slot is acquired, so threads never wait on a slot
+    # and a free GPU slot is not held up behind CPU stages queued in the executor
+    with ThreadPoolExecutor(cpu_slots + gpu_slots + 1) as executor:
+        running = set()
+        while True:
+            progressed = True
+            while progressed:
+                progressed = False
+                for stage in stages:
+                    if stage.status != "pending":
+                        continue
+                    if any(dep.status in ("failed", "skipped") for dep in stage.deps):
+                        stage.status = "skipped"
+                        progressed = True
+                    elif all(dep.status in ("done", "cached") for dep in stage.deps):
+                        if not force and stage.is_cached():
+                            stage.status = "cached"
+                            progressed = True
+                        elif slots[stage.slot].acquire(blocking=False):
+                            stage.status = "running"
+                            running.add(executor.submit(stage.run, slots[stage.slot]))
+
+            if not running:
+                break
+            finished, running = wait(running, return_when=FIRST_COMPLETED)
+            for future in finished:
+                future.result()
+
+
+def summarize(pipelines):
+    summary = []
+    for exp_id, pipeline in pipelines.items():
+        failed = next(
+            (stage for stage in pipeline if stage.status == "failed"), None)
+        summary.append({
+            "id": exp_id,
+            "status": f"{failed.kind}_failed" if failed else "ok",
+            "stages": [
+                {"kind": stage.kind, "output_id": stage.output_id, "key": stage.key,
+                 "status": stage.status, "duration": stage.duration}
+                for stage in pipeline
+            ],
+        })
+    return summary
 
 
 def main():
-    with open(EXPERIMENTS_JSON) as f:
+    args = parse_args()
+    with open(args.experiments) as f:
         experiments = json.load(f)
 
-    results = []
-    for exp in experiments:
-        print(f"[RUN] Experiment: {exp['id']}")
-        results.append(run_experiment(exp))
+    pipelines = build_stages(experiments)
+    run_stages(pipelines, args.cpu_slots, args.gpu_slots, force=args.force)
+
+    results = summarize(pipelines)
+    with open(SUMMARY_JSON, "w") as f:
+        json.dump(results, f, indent=2)
+    print(f"[SUMMARY] {SUMMARY_JSON}")
 
 
 if __name__ == "__main__":
@@ -0,0 +1,77 @@
+import argparse
+import os
+
+from dice_datasets import PackedPatternDataset, select_device
+from dice_models import DiceSampler, createNoiseSchedule, loadDiceRun
+from rich.console import Console
+from rich.table import Table
+
+console = Console()
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description="Measure iterative sampling of a DICE model against its latency")
+    parser.add_argument('--id', type=str, required=True,
+                        help='Model identifier')
+    parser.add_argument('--steps', type=int, nargs='+', default=[1, 2, 4, 8],
+                        help='Refinement step counts to compare')
+    parser.add_argument('--noise_level', type=float, default=None,
+                        help='Noise level of the first step, defaults to the training noise level')
+    parser.add_argument('--final_noise_level', type=float, default=0.0,
+                        help='Noise level of the last step')
+    parser.add_argument('--threshold', type=float, default=0.5,
+                        help='Trigger threshold')
+    parser.add_argument('--seeds', type=int, default=32,
+                        help='Seeds sampled in one batch for each pattern')
+    parser.add_argument('--patterns', type=int, default=16,
+                        help='Dataset patterns to transform')
+    parser.add_argument('--no_early_exit', action='store_true',
+                        help='Always run every step')
+    parser.add_argument('--device', type=str, default=None,
+                        help='cpu, cuda, mps or auto (defaults to DICE_DEVICE, then CPU)')
+    return parser.parse_args()
+
+
+def get_workspace_path():
+    return os.path.abspath(
+        os.path.join(os.path.dirname(__file__), "..", ".."))
+
+
+def get_dist_path(id):
+    return os.path.join(get_workspace_path(), "dist", id)
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    device = select_device(args.device)
+    model, run = loadDiceRun(os.path.join(get_dist_path(args.id), args.id), device)
+
+    dataset_id = run.get("dataset") or args.id
+    dataset = PackedPatternDataset(
+        os.path.join(get_dist_path(dataset_id), dataset_id), channels=run["channels"])
+    noise_level = args.noise_level if args.noise_level is not None else run["noise_level"]
+    seeds = list(range(args.seeds))
+
+    table = Table(title=f"Sampling {args.id} ({args.seeds} seeds per pattern)")
+    for column in ["steps", "steps_run", "ms_per_batch", "changed_steps"]:
+        table.add_column(column)
+
+    for num_steps in args.steps:
+        sampler = DiceSampler(model, createNoiseSchedule(num_steps, noise_level, args.final_noise_level),
+                              args.threshold, early_exit=not args.no_early_exit, device=device)
+        steps_run, seconds, changed = 0, 0.0, 0.0
+        for i in range(min(args.patterns, len(dataset))):
+            pattern = dataset[i].unsqueeze(0)
+            result = sampler(pattern, seeds)
+            steps_run += result.steps
+            seconds += result.seconds
+            # Fraction of trigger steps differing from the source pattern
+            source = pattern.reshape(1, -1, 16, 16)[:, 0].to(device) > 0
+            changed += (result.patterns[:, 0].bool() != source).float().mean().item()
+
+        count = min(args.patterns, len(dataset))
+        table.add_row(str(num_steps), f"{steps_run / count:.2f}",
+                      f"{1000 * seconds / count:.2f}", f"{changed / count:.3f}")
+
+    console.print(table)
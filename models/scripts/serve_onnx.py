@@ -0,0 +1,58 @@
+import argparse
+import os
+
+from dice_models.serving import InferenceService, SessionPool, createInferenceServer
+from rich.console import Console
+from rich.text import Text
+
+console = Console()
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Serve exported DICE models over localhost HTTP")
+    parser.add_argument('--host', type=str, default='127.0.0.1',
+                        help='Address to bind, localhost by default')
+    parser.add_argument('--port', type=int, default=8765,
+                        help='Port to listen on')
+    parser.add_argument('--models', type=str, nargs='*', default=[],
+                        help='Model identifiers to load at startup, others are loaded on first request')
+    parser.add_argument('--pool_size', type=int, default=2,
+                        help='Warmed ONNX Runtime sessions per model')
+    parser.add_argument('--intra_op_threads', type=int, default=1,
+                        help='Threads used within each operator')
+    parser.add_argument('--inter_op_threads', type=int, default=1,
+                        help='Threads used across operators')
+    parser.add_argument('--window_ms', type=float, default=2.0,
+                        help='Latency window in which concurrent requests are batched together')
+    parser.add_argument('--max_batch', type=int, default=64,
+                        help='Largest micro-batch')
+    parser.add_argument('--timeout', type=float, default=10.0,
+                        help='Seconds a request waits for its result before answering 504')
+    return parser.parse_args()
+
+
+def get_workspace_path():
+    return os.path.abspath(
+        os.path.join(os.path.dirname(__file__), "..", ".."))
+
+
+def get_dist_path():
+    return os.path.join(get_workspace_path(), "dist")
+
+
+if __name__ == "__main__":
+    console.print("[bold cyan]DICE Inference Server")
+    args = parse_args()
+
+    pool = SessionPool(get_dist_path(), args.pool_size,
+                       args.intra_op_threads, args.inter_op_threads)
+    service = InferenceService(pool, args.window_ms, args.max_batch, args.timeout)
+    for model_id in args.models:
+        service.batcher(model_id)
+
+    server = createInferenceServer(service, args.host, args.port)
+    console.print(Text(f"Listening on http://{args.host}:{args.port}/models/<id>", style="yellow"))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.shutdown()
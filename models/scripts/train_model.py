@@ -1,19 +1,18 @@
 import argparse
 import json
+import numpy as np
 import os
+import time
 import torch
 import torch.optim as optim
 
-from dice_datasets import Pattern, RandomPatternConfig
-from dice_models import createDiceModel, createDiceLoss
+from dice_datasets import TRIGGERS_CHANNEL, PackedPatternDataset, Pattern, RandomPatternConfig, StreamingPatternDataset, collate_patterns, select_device
+from dice_models import BatchNoiseInjector, DicePrecision, RunningMetrics, createAutocast, createDiceModel, createDiceLoss, createGradScaler, resolvePrecision
 from rich.progress import Progress, Live, BarColumn, TextColumn, TimeElapsedColumn, TaskProgressColumn
 from rich.console import Console
 from rich.text import Text
 from torch.utils.data import DataLoader, random_split
 
-# Enable MacOSX GPU Acceleration
-device = torch.device('mps')
-
 console = Console()
 progress = Progress(
     "[progress.description]{task.description}",
@@ -21,6 +20,8 @@ progress = Progress(
         "[green]Entries: {task.fields[entries_used]}/{task.fields[total_entries]}"),
     TextColumn("[red]Loss: {task.fields[loss]:.4f}"),
     TextColumn("[purple]Validation Loss: {task.fields[validation_loss]:.4f}"),
+    TextColumn(
+        "[blue]{task.fields[samples_per_sec]:.0f} samples/s {task.fields[step_latency_ms]:.1f} ms/step"),
     TimeElapsedColumn(),
 )
 
@@ -31,6 +32,8 @@ def parse_args():
                         help='Model identifier')
     parser.add_argument('--augmentation_preset', type=str,
                         required=True, help='Augmentation preset')
+    parser.add_argument('--dataset', type=str, default=None,
+                        help='Identifier of the generated dataset, defaults to the model identifier')
     parser.add_argument('--architecture', type=str,
                         required=True, help='Model architecture')
     parser.add_argument('--loss', type=str, required=True,
@@ -43,82 +46,192 @@ def parse_args():
                         help='Number of training epochs')
     parser.add_argument('--learning_rate', type=float,
                         default=0.001, help='Learning rate')
-    return parser.parse_args()
-
-
-def prepare_data(dataset_path, split_ratios=(0.75, 0.1, 0.15)):
-    data = torch.load(dataset_path, weights_only=False)
+    parser.add_argument('--device', type=str, default=None,
+                        help='cpu, cuda, mps or auto (defaults to DICE_DEVICE, then CPU)')
+    parser.add_argument('--preload_dataset', action='store_true',
+                        help='Move the whole packed dataset to the device as one tensor')
+    parser.add_argument('--log_every', type=int, default=50,
+                        help='Number of training steps between metric flushes to the progress view')
+    parser.add_argument('--precision', type=str, default='fp32',
+                        choices=[p.value for p in DicePrecision],
+                        help='Autocast precision, fp16 falls back to bf16 outside CUDA')
+    parser.add_argument('--compile', action='store_true',
+                        help='Compile model and loss with torch.compile')
+    parser.add_argument('--channels_last', action='store_true',
+                        help='Use channels_last memory format for the conv stacks')
+    parser.add_argument('--seed', type=int, default=0,
+                        help='Seed for dataset split, shuffling and noise')
+    parser.add_argument('--num_workers', type=int, default=0,
+                        help='Number of DataLoader worker processes')
+    parser.add_argument('--pin_memory', action='store_true',
+                        help='Collate batches into pinned memory for asynchronous device transfers')
+    parser.add_argument('--prefetch_factor', type=int, default=2,
+                        help='Batches prefetched by each DataLoader worker')
+    parser.add_argument('--persistent_workers', action='store_true',
+                        help='Keep DataLoader workers alive between epochs')
+    parser.add_argument('--channels', type=str, nargs='+', default=[TRIGGERS_CHANNEL],
+                        help='Dataset planes fed to the model, triggers first (e.g. triggers velocity)')
+    parser.add_argument('--stream', action='store_true',
+                        help='Augment the training split on the fly in DataLoader workers instead of reading it')
+    parser.add_argument('--stream_batches', type=int, default=None,
+                        help='Training batches per streamed epoch, defaults to the size of the training split')
+    parser.add_argument('--stream_cache', type=str, default=None,
+                        help='Folder caching the streamed batches as packed shards for later epochs and runs')
+    args = parser.parse_args()
+    if args.log_every < 1:
+        parser.error("--log_every must be at least 1")
+    if args.stream and args.channels != [TRIGGERS_CHANNEL]:
+        parser.error("--stream only supports the triggers channel")
+    if args.channels[0] != TRIGGERS_CHANNEL:
+        parser.error("--channels must start with triggers")
+    return args
+
+
+def prepare_data(dataset_path, split_ratios=(0.75, 0.1, 0.15), device=None, seed=0, channels=None):
+    if PackedPatternDataset.exists(dataset_path):
+        data = PackedPatternDataset(dataset_path, channels=channels)
+        if device is not None:
+            data.to(device)
+    elif channels:
+        raise ValueError(f"Multi-channel training needs a packed dataset at {dataset_path}")
+    else:
+        # Legacy pickled PatternDataset
+        data = torch.load(dataset_path + ".pt", weights_only=False)
     train_size = int(split_ratios[0] * len(data))
     val_size = int(split_ratios[1] * len(data))
     test_size = len(data) - train_size - val_size
 
     train_data, val_data, test_data = random_split(
-        data, [train_size, val_size, test_size])
+        data, [train_size, val_size, test_size],
+        generator=torch.Generator().manual_seed(seed))
 
     return train_data, val_data, test_data
 
 
-def train(epochs, dataset_config, dataloaders, model, criterion, optimizer, noise_level):
+def create_stream(train_data, dataset_config, args):
+    # The un-augmented base patterns of the training split are the corpus of the stream,
+    # so augmentations are never stacked on earlier ones
+    indices = np.intersect1d(train_data.indices, train_data.dataset.get_base_indices())
+    if not len(indices):
+        raise ValueError("The training split holds no base patterns to stream from")
+    bases = train_data.dataset.get_triggers(indices)
+    num_batches = args.stream_batches or max(len(train_data) // args.batch_size, 1)
+    return StreamingPatternDataset(bases, dataset_config, num_batches=num_batches,
+                                   batch_size=args.batch_size, seed=args.seed,
+                                   cache_dir=args.stream_cache)
+
+
+def create_stream_dataloader(stream, args):
+    # Batches are generated whole by the workers, which read the epoch from shared memory
+    return DataLoader(
+        stream,
+        batch_size=None,
+        num_workers=args.num_workers,
+        pin_memory=args.pin_memory,
+        prefetch_factor=args.prefetch_factor if args.num_workers > 0 else None,
+        persistent_workers=args.persistent_workers and args.num_workers > 0,
+    )
+
+
+def create_dataloader(data, args, shuffle, preloaded):
+    # Worker processes and pinned memory only apply to batches decoded on the host
+    num_workers = 0 if preloaded else args.num_workers
+    return DataLoader(
+        data,
+        batch_size=args.batch_size,
+        shuffle=shuffle,
+        collate_fn=collate_patterns,
+        num_workers=num_workers,
+        pin_memory=args.pin_memory and not preloaded,
+        prefetch_factor=args.prefetch_factor if num_workers > 0 else None,
+        persistent_workers=args.persistent_workers and num_workers > 0,
+        generator=torch.Generator().manual_seed(args.seed),
+    )
+
+
+def train(epochs, dataset_config, dataloaders, model, criterion, optimizer, noise_level, device, log_every=50,
+          precision=DicePrecision.FP32, channels_last=False, seed=0):
     train_loader, val_loader, test_loader = dataloaders
+    scaler = createGradScaler(precision, device)
+    memory_format = torch.channels_last if channels_last else torch.contiguous_format
+    prepare_batch = BatchNoiseInjector(
+        device, noise_level, seed=seed, memory_format=memory_format)
+    train_samples = 0
+    train_time = 0.0
 
     with Live(progress, refresh_per_second=10):
         for epoch in range(epochs):
+            if isinstance(train_loader.dataset, StreamingPatternDataset):
+                train_loader.dataset.set_epoch(epoch)
+            batch_size = train_loader.batch_size or train_loader.dataset.batch_size
+
             task_id = progress.add_task(
                 f"[cyan]Epoch {epoch + 1}/{epochs} -",
                 total=len(train_loader),
-                total_entries=len(train_loader)*train_loader.batch_size,
+                total_entries=len(train_loader)*batch_size,
                 entries_used=0,
                 loss=1.0,
                 validation_loss=1.0,
+                samples_per_sec=0.0,
+                step_latency_ms=0.0,
             )
 
-            def add_channel_dimension(pattern_tensor):
-                return pattern_tensor.unsqueeze(1)
-
-            def add_noise(pattern_tensor):
-                noise_tensor = torch.randn_like(pattern_tensor)
-                return pattern_tensor + noise_tensor * noise_level
-
-            # Training Loop
+            # Training Loop, metrics stay on device until flushed every log_every steps
             model.train()
+            train_metrics = RunningMetrics(device)
+            entries_used = 0
+            epoch_start = time.perf_counter()
             for i, pattern_tensor in enumerate(train_loader, start=1):
-                pattern_tensor = add_channel_dimension(pattern_tensor)
+                pattern_tensor, noisy_tensor = prepare_batch(pattern_tensor)
                 optimizer.zero_grad()
-                outputs = model(add_noise(pattern_tensor))
-                loss = criterion(outputs, pattern_tensor)
-                loss.backward()
-                optimizer.step()
-                progress.update(task_id, entries_used=i *
-                                train_loader.batch_size, loss=loss)
-
-            # Validation Loop
+                with createAutocast(precision, device):
+                    outputs = model(noisy_tensor)
+                    loss = criterion(outputs, pattern_tensor)
+                scaler.scale(loss).backward()
+                scaler.step(optimizer)
+                scaler.update()
+
+                train_metrics.update(loss, pattern_tensor.shape[0])
+                entries_used += pattern_tensor.shape[0]
+                if i % log_every == 0 or i == len(train_loader):
+                    metrics = train_metrics.flush()
+                    progress.update(task_id, completed=i, entries_used=entries_used,
+                                    loss=metrics["loss"],
+                                    samples_per_sec=metrics["samples_per_sec"],
+                                    step_latency_ms=metrics["step_latency_ms"])
+
+            train_time += time.perf_counter() - epoch_start
+            train_samples += entries_used
+
+            # Validation Loop, flushed once at epoch end
             model.eval()
-            validation_loss = 0
-            with torch.no_grad():
+            validation_metrics = RunningMetrics(device)
+            with torch.no_grad(), createAutocast(precision, device):
                 for pattern_tensor in val_loader:
-                    pattern_tensor = add_channel_dimension(pattern_tensor)
-                    outputs = model(add_noise(pattern_tensor))
-                    validation_loss += criterion(outputs,
-                                                 pattern_tensor) / len(val_loader)
-                    progress.update(task_id, validation_loss=validation_loss)
+                    pattern_tensor, noisy_tensor = prepare_batch(pattern_tensor)
+                    outputs = model(noisy_tensor)
+                    validation_metrics.update(criterion(outputs, pattern_tensor),
+                                              pattern_tensor.shape[0])
+            progress.update(task_id,
+                            validation_loss=validation_metrics.flush()["loss"])
 
             progress.stop_task(task_id)  # Stop timer for the current epoch
 
     model.eval()
-    accuracy = 0
-    with torch.no_grad():
+    valid_patterns = torch.zeros((), device=device)
+    total_patterns = 0
+    with torch.no_grad(), createAutocast(precision, device):
         for pattern_tensor in test_loader:
-            pattern_tensor = add_channel_dimension(pattern_tensor)
-            outputs = model(add_noise(pattern_tensor))
-            outputs[outputs < 0.5] = 0
-            outputs[outputs >= 0.5] = 1
-            outputs = outputs.squeeze(1)
+            _, noisy_tensor = prepare_batch(pattern_tensor)
+            outputs = model(noisy_tensor)
+            outputs = (outputs[:, 0] >= 0.5).float()
 
-            for output in outputs:
-                if Pattern.tensor_valid_polyphony_requirements(
-                        output, dataset_config.max_polyphony, dataset_config.max_num_events_with_full_polyphony):
-                    accuracy += 1 / (test_loader.batch_size * len(test_loader))
-    return accuracy
+            valid_patterns += Pattern.tensor_valid_polyphony_mask(
+                outputs, dataset_config.max_polyphony, dataset_config.max_num_events_with_full_polyphony).sum()
+            total_patterns += outputs.shape[0]
+    accuracy = valid_patterns.item() / max(total_patterns, 1)
+    samples_per_sec = train_samples / train_time if train_time > 0 else 0.0
+    return accuracy, samples_per_sec
 
 
 def get_workspace_path():
@@ -141,27 +254,63 @@ if __name__ == "__main__":
     dataset_config = RandomPatternConfig.from_json(
         get_preset_path(args.augmentation_preset))
 
-    compiled_dataset_path = os.path.join(
-        get_dist_path(args.id), args.id + ".pt")
-
-    train_data, val_data, test_data = prepare_data(compiled_dataset_path)
-    model = createDiceModel(args.architecture).to(device)
-    accuracy = train(
+    dataset_id = args.dataset or args.id
+    compiled_dataset_path = os.path.join(get_dist_path(dataset_id), dataset_id)
+
+    device = select_device(args.device)
+    console.print(Text(f"Using device {device}", style="yellow"))
+
+    # A single triggers channel keeps the [B, 16, 16] batches of the original datasets
+    channels = args.channels if args.channels != [TRIGGERS_CHANNEL] else None
+    train_data, val_data, test_data = prepare_data(
+        compiled_dataset_path, device=device if args.preload_dataset else None, seed=args.seed,
+        channels=channels)
+    precision = resolvePrecision(args.precision, device)
+    if precision.value != args.precision:
+        console.print(Text(f"Precision {args.precision} not supported on {device}, using {precision.value}",
+                           style="yellow"))
+    args.precision = precision.value
+
+    torch.manual_seed(args.seed)
+    model = createDiceModel(
+        args.architecture, num_channels=len(args.channels)).to(device)
+    if args.channels_last:
+        model = model.to(memory_format=torch.channels_last)
+
+    criterion = createDiceLoss(args.loss, config=dataset_config)
+    optimizer = optim.Adam(model.parameters(), lr=args.learning_rate)
+
+    # Compiled wrappers share parameters with the eager model, which is the one saved
+    train_model = torch.compile(model) if args.compile else model
+    train_criterion = torch.compile(criterion) if args.compile else criterion
+
+    accuracy, samples_per_sec = train(
         epochs=args.epochs,
         dataset_config=dataset_config,
         dataloaders=[
-            DataLoader(train_data, batch_size=args.batch_size, shuffle=True),
-            DataLoader(val_data, batch_size=args.batch_size, shuffle=False),
-            DataLoader(test_data, batch_size=args.batch_size, shuffle=False)
+            create_stream_dataloader(create_stream(train_data, dataset_config, args), args)
+            if args.stream else
+            create_dataloader(train_data, args, shuffle=True,
+                              preloaded=args.preload_dataset),
+            create_dataloader(val_data, args, shuffle=False,
+                              preloaded=args.preload_dataset),
+            create_dataloader(test_data, args, shuffle=False,
+                              preloaded=args.preload_dataset)
         ],
-        model=model,
-        criterion=createDiceLoss(args.loss, config=dataset_config),
-        optimizer=optim.Adam(model.parameters(), lr=args.learning_rate),
-        noise_level=args.noise_level
+        model=train_model,
+        criterion=train_criterion,
+        optimizer=optimizer,
+        noise_level=args.noise_level,
+        device=device,
+        log_every=args.log_every,
+        precision=precision,
+        channels_last=args.channels_last,
+        seed=args.seed
     )
 
     console.print(Text(f"Final Accuracy: {accuracy:.2f}", style="bold green"))
     args.accuracy = round(accuracy, 4)
+    args.samples_per_sec = round(samples_per_sec, 1)
 
     destination_path = os.path.join(get_dist_path(args.id), args.id)
     torch.save(model.state_dict(), destination_path + ".pth")
@@ -1,6 +1,17 @@
 from .architectures import DiceArchitecture
+from .export import FusedDiceTransform, exportDiceModel
 from .loss_functions import DiceLoss
-from .utils import createDiceModel, createDiceLoss
+from .metrics import RunningMetrics
+from .noise import BatchNoiseInjector
+from .precision import DicePrecision, createAutocast, createGradScaler, resolvePrecision
+from .pruning import pruneDiceModel
+from .sampling import DiceSampler, SamplingResult, createNoiseSchedule
+from .utils import createDiceModel, createDiceLoss, loadDiceModel, loadDiceRun
+from .variations import VariationSet, collectVariations, createVariationBatch, generateVariations
 
 
-__all__ = ["DiceArchitecture", "createDiceModel", "DiceLoss", "createDiceLoss"]
+__all__ = ["DiceArchitecture", "createDiceModel", "DiceLoss", "createDiceLoss", "RunningMetrics", "BatchNoiseInjector",
+           "DicePrecision", "createAutocast", "createGradScaler", "resolvePrecision", "loadDiceModel", "loadDiceRun",
+           "DiceSampler", "SamplingResult", "createNoiseSchedule", "VariationSet", "collectVariations",
+           "createVariationBatch", "generateVariations", "FusedDiceTransform", "exportDiceModel",
+           "pruneDiceModel"]
@@ -0,0 +1,53 @@
+import torch
+
+from torch import Tensor
+
+
+class FusedDiceTransform(torch.nn.Module):
+    """
+    Whole app transform as one graph: flip horizontally, add noise scaled by noise_level,
+    run the model, threshold the triggers with a strict comparison and flip back. Noise is
+    a graph input, uniform in [-1, 1], so callers keep control of seeds. noise_level and
+    threshold hold one value per pattern. Output is the [B, 1, 16, 16] uint8 trigger pattern.
+    """
+
+    def __init__(self, model: torch.nn.Module):
+        super().__init__()
+        self.model = model
+
+    def forward(self, input: Tensor, noise: Tensor, noise_level: Tensor, threshold: Tensor) -> Tensor:
+        noisy = torch.flip(input, dims=[-1]) + noise * noise_level.reshape(-1, 1, 1, 1)
+        triggers = self.model(noisy)[:, :1] > threshold.reshape(-1, 1, 1, 1)
+        return torch.flip(triggers, dims=[-1]).to(torch.uint8)
+
+
+def exportDiceModel(model: torch.nn.Module, path: str, num_channels: int = 1,
+                    dynamic_batch: bool = False, fused: bool = False, opset_version: int = 11):
+    """
+    Exports the model to ONNX with inputs [B, C, 16, 16]. dynamic_batch leaves B free,
+    otherwise it is fixed to one as the app expects. fused exports FusedDiceTransform, with
+    the noise, noise_level and threshold inputs next to the pattern.
+    """
+    model = model.eval()
+    dummy_input = torch.zeros(1, num_channels, 16, 16)
+    input_names = ['input']
+    args = (dummy_input,)
+    if fused:
+        model = FusedDiceTransform(model).eval()
+        input_names += ['noise', 'noise_level', 'threshold']
+        args = (dummy_input, torch.zeros_like(dummy_input), torch.zeros(1), torch.full((1,), 0.5))
+
+    dynamic_axes = {name: {0: 'batch'} for name in input_names + ['output']} \
+        if dynamic_batch else None
+
+    torch.onnx.export(
+        model,
+        args,
+        path,
+        export_params=True,
+        opset_version=opset_version,
+        do_constant_folding=True,
+        input_names=input_names,
+        output_names=['output'],
+        dynamic_axes=dynamic_axes
+    )
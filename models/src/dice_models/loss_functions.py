@@ -1,3 +1,4 @@
+import torch
 import torch.nn as nn
 import torch.nn.functional as F
 
@@ -11,6 +12,20 @@ class DiceLoss(Enum):
     L1_POLYPHONY_PENALTY = "l1_poly_penalty"
 
 
+def apply_polyphony_penalty(loss: Tensor, target: Tensor, config: RandomPatternConfig, penalty_factor: int):
+    # Scales the element-wise loss of each sample whose target breaks the polyphony requirements
+    if target.dim() == 4:
+        # Multi-channel batches carry the triggers in the first channel
+        target = target[:, :1]
+    is_valid = Pattern.tensor_valid_polyphony_mask(
+        pattern_tensor=target,
+        max_polyphony=config.max_polyphony,
+        max_num_events_with_full_polyphony=config.max_num_events_with_full_polyphony
+    )
+    penalty = torch.where(is_valid, 1.0, float(penalty_factor))
+    return loss * penalty[..., None, None]
+
+
 class MSELossWithPolyphonyRequirementsPenalty(nn.Module):
     def __init__(self, config: RandomPatternConfig):
         super(MSELossWithPolyphonyRequirementsPenalty, self).__init__()
@@ -18,16 +33,7 @@ class MSELossWithPolyphonyRequirementsPenalty(nn.Module):
 
     def forward(self, input: Tensor, target: Tensor, penalty_factor: int = 10):
         mse_loss = F.mse_loss(input, target, reduction='none')
-        is_valid = Pattern.tensor_valid_polyphony_requirements(
-            pattern_tensor=target,
-            max_polyphony=self.config.max_polyphony,
-            max_num_events_with_full_polyphony=self.config.max_num_events_with_full_polyphony
-        )
-
-        if not is_valid:
-            mse_loss *= penalty_factor
-
-        return mse_loss.mean()
+        return apply_polyphony_penalty(mse_loss, target, self.config, penalty_factor).mean()
 
 
 class L1LossWithPolyphonyRequirementsPenalty(nn.Module):
@@ -36,14 +42,5 @@ class L1LossWithPolyphonyRequirementsPenalty(nn.Module):
         self.config = config
 
     def forward(self, input: Tensor, target: Tensor, penalty_factor: int = 10):
-        mse_loss = F.l1_loss(input, target)
-        is_valid = Pattern.tensor_valid_polyphony_requirements(
-            pattern_tensor=target,
-            max_polyphony=self.config.max_polyphony,
-            max_num_events_with_full_polyphony=self.config.max_num_events_with_full_polyphony
-        )
-
-        if not is_valid:
-            mse_loss *= penalty_factor
-
-        return mse_loss.mean()
+        l1_loss = F.l1_loss(input, target, reduction='none')
+        return apply_polyphony_penalty(l1_loss, target, self.config, penalty_factor).mean()
@@ -0,0 +1,42 @@
+import time
+import torch
+
+from torch import Tensor
+
+
+class RunningMetrics:
+    """
+    Accumulates loss values on the device they are computed on, so that the training
+    loop never waits for the device. Values reach the host only when flushed, together
+    with throughput and step latency measured since the previous flush.
+    """
+
+    def __init__(self, device: torch.device):
+        self.device = device
+        self.reset()
+
+    def reset(self):
+        self.loss_sum = torch.zeros((), device=self.device)
+        self.steps = 0
+        self.samples = 0
+        self.start_time = time.perf_counter()
+
+    def update(self, loss: Tensor, batch_size: int):
+        self.loss_sum += loss.detach() * batch_size
+        self.steps += 1
+        self.samples += batch_size
+
+    def flush(self) -> dict:
+        # Single host synchronization for all the steps since the last flush
+        loss_sum = self.loss_sum.item()
+        elapsed = time.perf_counter() - self.start_time
+
+        metrics = {
+            "loss": loss_sum / max(self.samples, 1),
+            "steps": self.steps,
+            "samples": self.samples,
+            "samples_per_sec": self.samples / elapsed if elapsed > 0 else 0.0,
+            "step_latency_ms": 1000 * elapsed / max(self.steps, 1),
+        }
+        self.reset()
+        return metrics
@@ -0,0 +1,30 @@
+import torch
+
+from torch import Tensor
+from typing import Tuple
+
+
+class BatchNoiseInjector:
+    """
+    Moves collated pattern batches to the device, adds the channel dimension and draws the
+    gaussian noise there in one step. Noise comes from a dedicated generator, so a given
+    seed reproduces the same noisy batches regardless of data loading workers.
+    """
+
+    def __init__(self, device: torch.device, noise_level: float, seed: int = 0,
+                 memory_format: torch.memory_format = torch.contiguous_format):
+        self.device = device
+        self.noise_level = noise_level
+        self.memory_format = memory_format
+        self.generator = torch.Generator(device=device)
+        self.generator.manual_seed(seed)
+
+    def __call__(self, pattern_tensor: Tensor) -> Tuple[Tensor, Tensor]:
+        # Returns the clean target and the noisy model input, both shaped [B, C, H, W]
+        clean = pattern_tensor.to(self.device, non_blocking=True)
+        if clean.dim() == 3:
+            clean = clean.unsqueeze(1)
+        clean = clean.contiguous(memory_format=self.memory_format)
+        noise = torch.randn(clean.shape, generator=self.generator,
+                            device=self.device, dtype=clean.dtype)
+        return clean, torch.add(clean, noise, alpha=self.noise_level)
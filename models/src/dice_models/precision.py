@@ -0,0 +1,32 @@
+import torch
+
+from enum import Enum
+
+
+class DicePrecision(Enum):
+    FP32 = "fp32"
+    BF16 = "bf16"
+    FP16 = "fp16"
+
+
+def resolvePrecision(precision: DicePrecision, device: torch.device) -> DicePrecision:
+    # Half precision autocast is only worth it on CUDA, other devices use bfloat16
+    precision = DicePrecision(precision)
+    if precision == DicePrecision.FP16 and device.type != "cuda":
+        return DicePrecision.BF16
+    return precision
+
+
+def createAutocast(precision: DicePrecision, device: torch.device):
+    match DicePrecision(precision):
+        case DicePrecision.FP32:
+            return torch.autocast(device.type, enabled=False)
+        case DicePrecision.BF16:
+            return torch.autocast(device.type, dtype=torch.bfloat16)
+        case DicePrecision.FP16:
+            return torch.autocast(device.type, dtype=torch.float16)
+
+
+def createGradScaler(precision: DicePrecision, device: torch.device):
+    # Gradient scaling is only needed by float16, bfloat16 keeps the float32 range
+    return torch.amp.GradScaler(device.type, enabled=DicePrecision(precision) == DicePrecision.FP16)
@@ -0,0 +1,96 @@
+import torch
+
+from .architectures import AttentionUNet, ConvAutoencoder
+from .architectures.unet import AttentionBlock, ConvBlock
+from typing import List, Optional, Tuple
+
+
+# Convolutions producing a channel group with their batch norms, and the convolutions reading it
+PruningGroup = Tuple[List[Tuple[torch.nn.Module, Optional[torch.nn.BatchNorm2d]]], List[torch.nn.Module]]
+
+
+def pruneDiceModel(model: torch.nn.Module, amount: float, n: int = 2) -> torch.nn.Module:
+    """
+    Structured channel pruning: removes the fraction amount of channels with the lowest Ln
+    norm from every hidden channel group, rebuilding the producing convolutions, their batch
+    norms and the convolutions reading them with the surviving channels only, so the pruned
+    model runs fewer FLOPs. Groups are the hidden layers of the autoencoder, the inner
+    channels of each U-Net ConvBlock and the attention features. Block outputs feeding skip
+    connections and concatenations keep their width. The pruned model no longer matches the
+    architecture constructors, export it from the returned module.
+    """
+    if not 0 <= amount < 1:
+        raise ValueError("Pruning amount must lie in [0, 1)")
+
+    for producers, consumers in _pruning_groups(model):
+        conv = producers[0][0]
+        width = _out_dim_size(conv)
+        num_kept = max(1, width - round(amount * width))
+        if num_kept == width:
+            continue
+
+        # Channels ranked by the norm of their weights, summed over producers adding up
+        norms = sum(_channel_norms(conv, n) for conv, _ in producers)
+        kept = torch.sort(torch.topk(norms, num_kept).indices).values
+        for conv, norm in producers:
+            _slice_conv(conv, kept, output=True)
+            if norm is not None:
+                _slice_batch_norm(norm, kept)
+        for conv in consumers:
+            _slice_conv(conv, kept, output=False)
+
+    return model
+
+
+def _pruning_groups(model: torch.nn.Module) -> List[PruningGroup]:
+    groups = []
+    if isinstance(model, ConvAutoencoder):
+        layers = [module for module in (*model.encoder, *model.decoder)
+                  if isinstance(module, torch.nn.Conv2d | torch.nn.ConvTranspose2d)]
+        groups += [([(layer, None)], [following]) for layer, following in zip(layers, layers[1:])]
+    elif isinstance(model, AttentionUNet):
+        for module in model.modules():
+            if isinstance(module, ConvBlock):
+                groups.append(([(module.conv1, module.bn1)], [module.conv2]))
+            elif isinstance(module, AttentionBlock):
+                # Gate and skip features are added before psi, they share their channels
+                groups.append(([(module.W_g[0], module.W_g[1]), (module.W_x[0], module.W_x[1])],
+                               [module.psi[0]]))
+    else:
+        raise ValueError(f"No pruning groups known for {type(model).__name__}")
+    return groups
+
+
+def _out_dim(conv: torch.nn.Module) -> int:
+    # Transposed convolutions store weights as [in, out, kH, kW]
+    return 1 if isinstance(conv, torch.nn.ConvTranspose2d) else 0
+
+
+def _out_dim_size(conv: torch.nn.Module) -> int:
+    return conv.weight.shape[_out_dim(conv)]
+
+
+def _channel_norms(conv: torch.nn.Module, n: int) -> torch.Tensor:
+    weight = conv.weight.detach().transpose(0, _out_dim(conv))
+    return weight.flatten(1).norm(p=n, dim=1)
+
+
+def _slice_conv(conv: torch.nn.Module, kept: torch.Tensor, output: bool):
+    dim = _out_dim(conv) if output else 1 - _out_dim(conv)
+    with torch.no_grad():
+        conv.weight = torch.nn.Parameter(conv.weight.index_select(dim, kept).clone())
+        if output and conv.bias is not None:
+            conv.bias = torch.nn.Parameter(conv.bias[kept].clone())
+    if output:
+        conv.out_channels = len(kept)
+    else:
+        conv.in_channels = len(kept)
+
+
+def _slice_batch_norm(norm: torch.nn.BatchNorm2d, kept: torch.Tensor):
+    with torch.no_grad():
+        norm.weight = torch.nn.Parameter(norm.weight[kept].clone())
+        norm.bias = torch.nn.Parameter(norm.bias[kept].clone())
+    norm.running_mean = norm.running_mean[kept].clone()
+    norm.running_var = norm.running_var[kept].clone()
+    norm.num_features = len(kept)
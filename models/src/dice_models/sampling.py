@@ -0,0 +1,93 @@
+import time
+import torch
+
+from dataclasses import dataclass
+from torch import Tensor
+from typing import Sequence
+
+
+def createNoiseSchedule(num_steps: int, noise_level: float, final_noise_level: float = 0.0) -> Tensor:
+    # Noise levels decreasing linearly from noise_level to final_noise_level
+    if num_steps < 1:
+        raise ValueError("The sampler needs at least one step")
+    return torch.linspace(noise_level, final_noise_level, num_steps)
+
+
+@dataclass
+class SamplingResult:
+    patterns: Tensor    # [B, C, H, W], triggers binarized with the threshold, planes as predicted
+    steps: int          # refinement steps run before the patterns stopped changing
+    seconds: float
+
+
+class DiceSampler:
+    """
+    Iterative counterpart of the single denoising pass of the app: each step adds uniform
+    noise of the scheduled level, runs the model and thresholds the triggers, then feeds
+    the binarized pattern to the next step. Many seeds are sampled as one batch, each
+    drawing its noise from its own generator, so a seed gives the same pattern whatever
+    the batch. Buffers are allocated once per batch shape and reused across steps and calls.
+    """
+
+    def __init__(self, model: torch.nn.Module, schedule: Tensor, threshold: float = 0.5,
+                 early_exit: bool = True, device: torch.device = torch.device("cpu")):
+        self.model = model.to(device).eval()
+        self.schedule = [float(level) for level in schedule]
+        self.threshold = threshold
+        self.early_exit = early_exit
+        self.device = device
+        self.shape = None
+
+    def _allocate(self, shape: torch.Size):
+        if self.shape == shape:
+            return
+        self.shape = shape
+        self.noise = torch.empty((len(self.schedule), *shape), device=self.device)
+        self.current = torch.empty(shape, device=self.device)
+        self.noisy = torch.empty(shape, device=self.device)
+        self.binary = torch.empty(shape[:1] + shape[2:], dtype=torch.bool, device=self.device)
+        self.previous = torch.empty_like(self.binary)
+
+    def _draw_noise(self, seeds: Sequence[int]):
+        # Uniform noise in [-1, 1] for every step, one generator per seed
+        generator = torch.Generator()
+        for i, seed in enumerate(seeds):
+            generator.manual_seed(int(seed))
+            noise = torch.rand((len(self.schedule), *self.shape[1:]), generator=generator)
+            self.noise[:, i].copy_(noise.mul_(2).sub_(1))
+
+    def __call__(self, patterns: Tensor, seeds: Sequence[int]) -> SamplingResult:
+        """
+        Refines patterns [B, H, W] or [B, C, H, W] with the trigger channel first. A single
+        pattern is repeated for every seed, otherwise there is one seed per pattern.
+        """
+        start = time.perf_counter()
+        patterns = patterns.to(self.device, torch.float32)
+        if patterns.dim() == 3:
+            patterns = patterns.unsqueeze(1)
+        if patterns.shape[0] == 1:
+            patterns = patterns.expand(len(seeds), *patterns.shape[1:])
+        if patterns.shape[0] != len(seeds):
+            raise ValueError(f"Expected {patterns.shape[0]} seeds, got {len(seeds)}")
+
+        self._allocate(patterns.shape)
+        self._draw_noise(seeds)
+        self.current.copy_(patterns)
+
+        steps = 0
+        with torch.inference_mode():
+            for step, level in enumerate(self.schedule):
+                torch.add(self.current, self.noise[step], alpha=level, out=self.noisy)
+                outputs = self.model(self.noisy)
+                torch.gt(outputs[:, 0], self.threshold, out=self.binary)
+                steps += 1
+
+                # Planes are fed back as predicted, triggers binarized
+                self.current.copy_(outputs)
+                self.current[:, 0].copy_(self.binary)
+
+                if self.early_exit and step > 0 and torch.equal(self.binary, self.previous):
+                    break
+                self.previous.copy_(self.binary)
+
+        return SamplingResult(self.current.clone(), steps, time.perf_counter() - start)
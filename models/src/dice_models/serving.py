@@ -0,0 +1,249 @@
+import json
+import numpy as np
+import onnxruntime as ort
+import os
+import queue
+import threading
+import time
+
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+from contextlib import contextmanager
+from dataclasses import dataclass
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Sequence
+
+from .variations import collectVariations, createVariationBatch
+
+
+def cooToMatrix(coo: Sequence[int], rows: int = 16, cols: int = 16) -> np.ndarray:
+    # Flat (row, col) pairs, 1-based as in the Max external, to a [rows, cols] matrix
+    coo = np.asarray(coo, dtype=np.int64)
+    if len(coo) % 2 != 0:
+        raise ValueError("COO list must have an even number of elements")
+    coo = coo.reshape(-1, 2) - 1
+    if np.any(coo < 0) or np.any(coo >= (rows, cols)):
+        raise ValueError(f"COO coordinates must lie in [1, {rows}] x [1, {cols}]")
+    matrix = np.zeros((rows, cols), dtype=np.uint8)
+    matrix[coo[:, 0], coo[:, 1]] = 1
+    return matrix
+
+
+def matrixToCoo(matrix: np.ndarray) -> List[int]:
+    # Row-major (row, col) pairs of the onsets, 1-based
+    return (np.argwhere(np.asarray(matrix) > 0) + 1).ravel().tolist()
+
+
+def createSessionOptions(intra_op_threads: int = 1, inter_op_threads: int = 1) -> ort.SessionOptions:
+    options = ort.SessionOptions()
+    options.intra_op_num_threads = intra_op_threads
+    options.inter_op_num_threads = inter_op_threads
+    options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+    return options
+
+
+class SessionPool:
+    """
+    Keeps pool_size warmed ONNX Runtime sessions per model id, loaded on first use from
+    <dist>/<id>/<id>.batch.onnx when exported, <dist>/<id>/<id>.onnx otherwise. Sessions are
+    checked out one caller at a time, so a model serves up to pool_size concurrent batches
+    without creating a session per request.
+    """
+
+    def __init__(self, dist_path: str, pool_size: int = 2, intra_op_threads: int = 1, inter_op_threads: int = 1):
+        self.dist_path = dist_path
+        self.pool_size = pool_size
+        self.options = createSessionOptions(intra_op_threads, inter_op_threads)
+        self.sessions: Dict[str, queue.Queue] = {}
+        self.lock = threading.Lock()
+
+    def model_path(self, model_id: str) -> str:
+        # Ids are single folder names under dist/
+        if os.path.basename(model_id) != model_id or model_id in ("", ".", ".."):
+            raise ValueError(f"Invalid model id '{model_id}'")
+        # Dynamic batch exports run micro-batches in one call, the app export row by row
+        batch_path = os.path.join(self.dist_path, model_id, model_id + ".batch.onnx")
+        if os.path.exists(batch_path):
+            return batch_path
+        return os.path.join(self.dist_path, model_id, model_id + ".onnx")
+
+    def _create_session(self, path: str) -> ort.InferenceSession:
+        session = ort.InferenceSession(path, self.options, providers=["CPUExecutionProvider"])
+        # Warm up with an empty pattern, so the first request does not pay for allocations
+        session.run(None, {session.get_inputs()[0].name: np.zeros((1, 1, 16, 16), dtype=np.float32)})
+        return session
+
+    def load(self, model_id: str) -> queue.Queue:
+        with self.lock:
+            if model_id not in self.sessions:
+                path = self.model_path(model_id)
+                if not os.path.exists(path):
+                    raise FileNotFoundError(f"No ONNX model at {path}")
+                sessions = queue.Queue()
+                for _ in range(self.pool_size):
+                    sessions.put(self._create_session(path))
+                self.sessions[model_id] = sessions
+            return self.sessions[model_id]
+
+    @contextmanager
+    def acquire(self, model_id: str):
+        sessions = self.load(model_id)
+        session = sessions.get()
+        try:
+            yield session
+        finally:
+            sessions.put(session)
+
+
+def runSession(session: ort.InferenceSession, batch: np.ndarray) -> np.ndarray:
+    # Models exported with a fixed batch of one run row by row
+    model_input = session.get_inputs()[0]
+    if model_input.shape[0] == 1 and len(batch) != 1:
+        return np.concatenate([runSession(session, row[None]) for row in batch])
+    return session.run(None, {model_input.name: batch})[0]
+
+
+@dataclass
+class InferenceRequest:
+    matrix: np.ndarray
+    noise_level: float
+    noise_seed: int
+    threshold: float
+    future: Future
+
+
+class MicroBatcher:
+    """
+    Groups the requests for one model that arrive within window_ms of each other, up to
+    max_batch, and runs them as one batch on a pooled session. Each request keeps its own
+    noise level, noise seed and threshold.
+    """
+
+    def __init__(self, pool: SessionPool, model_id: str, window_ms: float = 2.0, max_batch: int = 64):
+        self.pool = pool
+        self.model_id = model_id
+        self.window = window_ms / 1000
+        self.max_batch = max_batch
+        self.requests: queue.Queue = queue.Queue()
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def submit(self, matrix: np.ndarray, noise_level: float, noise_seed: int, threshold: float) -> Future:
+        future = Future()
+        self.requests.put(InferenceRequest(matrix, noise_level, noise_seed, threshold, future))
+        return future
+
+    def _collect(self) -> List[InferenceRequest]:
+        batch = [self.requests.get()]
+        deadline = time.perf_counter() + self.window
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self.requests.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            try:
+                inputs = np.concatenate([
+                    createVariationBatch(request.matrix, [request.noise_seed], [request.noise_level])
+                    for request in batch
+                ])
+                with self.pool.acquire(self.model_id) as session:
+                    outputs = runSession(session, inputs)
+                for request, output in zip(batch, outputs):
+                    variation = collectVariations(
+                        output[None], [request.noise_seed], [request.noise_level], [request.threshold])[0]
+                    request.future.set_result(variation.patterns[0])
+            except Exception as error:
+                for request in batch:
+                    if not request.future.done():
+                        request.future.set_exception(error)
+
+
+class InferenceService:
+    """
+    Session pool with one micro-batcher per model id, created on first request.
+    """
+
+    def __init__(self, pool: SessionPool, window_ms: float = 2.0, max_batch: int = 64, timeout: float = 10.0):
+        self.pool = pool
+        self.window_ms = window_ms
+        self.max_batch = max_batch
+        self.timeout = timeout
+        self.batchers: Dict[str, MicroBatcher] = {}
+        self.lock = threading.Lock()
+
+    def batcher(self, model_id: str) -> MicroBatcher:
+        with self.lock:
+            if model_id not in self.batchers:
+                # Fails here for unknown models, before any request is queued
+                self.pool.load(model_id)
+                self.batchers[model_id] = MicroBatcher(
+                    self.pool, model_id, self.window_ms, self.max_batch)
+            return self.batchers[model_id]
+
+    def transform(self, model_id: str, coo: Sequence[int], noise_level: float = 0.0,
+                  noise_seed: int = 0, threshold: float = 0.5) -> List[int]:
+        # COO in, COO out, as the list method of the Max external
+        future = self.batcher(model_id).submit(cooToMatrix(coo), noise_level, noise_seed, threshold)
+        return matrixToCoo(future.result(self.timeout))
+
+
+class InferenceRequestHandler(BaseHTTPRequestHandler):
+    """
+    POST /models/<id> with {"coo": [...], "noiseLevel": 0.2, "noiseSeed": 0, "threshold": 0.5}
+    answers {"coo": [...]}. GET /models lists the loaded model ids.
+    """
+    service: InferenceService = None
+
+    def _send_json(self, status: int, body: dict):
+        data = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        if self.path.rstrip("/") != "/models":
+            return self._send_json(404, {"error": "Not found"})
+        self._send_json(200, {"models": sorted(self.service.batchers)})
+
+    def do_POST(self):
+        prefix = "/models/"
+        if not self.path.startswith(prefix):
+            return self._send_json(404, {"error": "Not found"})
+        try:
+            length = int(self.headers.get("Content-Length", 0))
+            body = json.loads(self.rfile.read(length) or b"{}")
+            coo = self.service.transform(
+                self.path[len(prefix):], body.get("coo", []),
+                noise_level=float(body.get("noiseLevel", 0.0)),
+                noise_seed=int(body.get("noiseSeed", 0)),
+                threshold=float(body.get("threshold", 0.5)))
+        except FileNotFoundError as error:
+            return self._send_json(404, {"error": str(error)})
+        except (ValueError, TypeError) as error:
+            return self._send_json(400, {"error": str(error)})
+        except FutureTimeoutError:
+            return self._send_json(504, {"error": f"No result within {self.service.timeout}s"})
+        except Exception as error:
+            # Session and runtime failures forwarded by the batcher
+            return self._send_json(500, {"error": f"{type(error).__name__}: {error}"})
+        self._send_json(200, {"coo": coo})
+
+    def log_message(self, format, *args):
+        # Requests are too frequent to log one line each
+        pass
+
+
+def createInferenceServer(service: InferenceService, host: str = "127.0.0.1", port: int = 8765) -> ThreadingHTTPServer:
+    handler = type("BoundInferenceRequestHandler", (InferenceRequestHandler,), {"service": service})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    return server
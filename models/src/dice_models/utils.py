@@ -1,7 +1,11 @@
 from .architectures import DiceArchitecture, ConvAutoencoder, AttentionUNet
 from .loss_functions import DiceLoss, MSELossWithPolyphonyRequirementsPenalty, L1LossWithPolyphonyRequirementsPenalty
 
-from dice_datasets import RandomPatternConfig
+import json
+import torch
+
+from dice_datasets import TRIGGERS_CHANNEL, RandomPatternConfig
+from typing import Tuple
 
 
 def createDiceModel(architecture: DiceArchitecture, num_channels: int = 1):
@@ -12,6 +16,27 @@ def createDiceModel(architecture: DiceArchitecture, num_channels: int = 1):
             return AttentionUNet(num_channels)
 
 
+def loadDiceModel(model_torch_path, architecture: DiceArchitecture, num_channels: int = 1,
+                  device: torch.device = torch.device("cpu")):
+    state_dict = torch.load(model_torch_path, map_location=device, weights_only=False)
+    model = createDiceModel(architecture, num_channels)
+    model.load_state_dict(state_dict)
+    return model.to(device).eval()
+
+
+def loadDiceRun(run_path: str, device: torch.device = torch.device("cpu")) -> Tuple[torch.nn.Module, dict]:
+    """
+    Loads the model saved by train_model.py at <run_path>.pth, built from the architecture
+    and channels recorded in <run_path>.json. Returns the model and the run arguments.
+    """
+    with open(run_path + ".json") as file:
+        run = json.load(file)
+    # Runs trained before multi-channel datasets only have triggers
+    run["channels"] = run.get("channels") or [TRIGGERS_CHANNEL]
+    model = loadDiceModel(run_path + ".pth", run["architecture"], len(run["channels"]), device)
+    return model, run
+
+
 def createDiceLoss(loss_function: DiceLoss, config: RandomPatternConfig):
     match DiceLoss(loss_function):
         case DiceLoss.MSE_POLYPHONY_PENALTY:
@@ -0,0 +1,87 @@
+"""
+Variation grids of DICE models. Noise follows the distribution of app/src/matrix.rs but is
+drawn with numpy from each noise seed, while the app uses the Rust StdRng: a noise seed only
+reproduces variations within Python, not the app's variation for the same seed.
+"""
+import numpy as np
+import torch
+
+from dataclasses import dataclass
+from typing import List, Sequence
+
+
+@dataclass
+class VariationSet:
+    patterns: np.ndarray    # [V, 16, 16] uint8, distinct variations of one input
+    parameters: np.ndarray  # [noise_seeds * noise_levels * thresholds, 3] (noise_seed, noise_level, threshold)
+    index: np.ndarray       # [noise_seeds * noise_levels * thresholds] variation produced by each parameter row
+
+    def parameters_of(self, i: int) -> np.ndarray:
+        # Parameter rows producing variation i
+        return self.parameters[self.index == i]
+
+
+def createVariationBatch(inputs: np.ndarray, noise_seeds: Sequence[int],
+                         noise_levels: Sequence[float]) -> np.ndarray:
+    """
+    Builds the model input for every input x noise seed x noise level combination, shape
+    [inputs * noise_seeds * noise_levels, 1, 16, 16]. As in app/src/matrix.rs, inputs are
+    flipped horizontally and get uniform noise in [-noise_level, noise_level]. Each noise seed
+    draws one numpy noise matrix, scaled by every level.
+    """
+    inputs = np.asarray(inputs, dtype=np.float32)
+    if inputs.ndim == 2:
+        inputs = inputs[None]
+    flipped = inputs[..., ::-1]
+
+    noise = np.stack([
+        np.random.default_rng(int(noise_seed)).random(inputs.shape[1:], dtype=np.float32) * 2 - 1
+        for noise_seed in noise_seeds
+    ])
+    levels = np.asarray(noise_levels, dtype=np.float32)[None, None, :, None, None]
+    batch = flipped[:, None, None] + levels * noise[None, :, None]
+    return batch.reshape(-1, 1, *inputs.shape[1:])
+
+
+def collectVariations(outputs: np.ndarray, noise_seeds: Sequence[int], noise_levels: Sequence[float],
+                      thresholds: Sequence[float]) -> List[VariationSet]:
+    """
+    Thresholds the model outputs of createVariationBatch at every requested level, flips
+    them back and returns the distinct variations of each input.
+    """
+    shape = outputs.shape[-2:]
+    outputs = np.asarray(outputs).reshape(-1, len(noise_seeds), len(noise_levels), *shape)
+    # [inputs, noise_seeds, noise_levels, thresholds, 16, 16], strict comparison as in the app
+    levels = np.asarray(thresholds, dtype=np.float32)[:, None, None]
+    binary = outputs[:, :, :, None] > levels
+    binary = binary[..., ::-1].reshape(len(outputs), -1, shape[0] * shape[1])
+
+    grid = np.meshgrid(np.asarray(noise_seeds, dtype=np.float64), np.asarray(noise_levels, dtype=np.float64),
+                       np.asarray(thresholds, dtype=np.float64), indexing="ij")
+    parameters = np.stack([axis.ravel() for axis in grid], axis=1)
+
+    variations = []
+    for patterns in binary:
+        # Rows compared by their packed bits
+        packed = np.packbits(patterns, axis=1)
+        _, first, index = np.unique(packed, axis=0, return_index=True, return_inverse=True)
+        # Variations numbered in order of first appearance in the grid
+        order = np.argsort(first)
+        rank = np.empty_like(order)
+        rank[order] = np.arange(len(order))
+        unique = patterns[first[order]].reshape(-1, *shape).astype(np.uint8)
+        variations.append(VariationSet(unique, parameters, rank[index.ravel()]))
+    return variations
+
+
+def generateVariations(model: torch.nn.Module, inputs: np.ndarray, noise_seeds: Sequence[int],
+                       noise_levels: Sequence[float], thresholds: Sequence[float],
+                       device: torch.device = torch.device("cpu")) -> List[VariationSet]:
+    """
+    Generates the variations of one [16, 16] input or a [N, 16, 16] stack over the whole
+    noise seed x noise level x threshold grid with a single forward pass.
+    """
+    batch = torch.from_numpy(createVariationBatch(inputs, noise_seeds, noise_levels)).to(device)
+    with torch.inference_mode():
+        outputs = model.eval()(batch)
+    return collectVariations(outputs.float().cpu().numpy(), noise_seeds, noise_levels, thresholds)
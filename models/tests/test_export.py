@@ -0,0 +1,55 @@
+import numpy as np
+import onnxruntime as ort
+import pytest
+import torch
+
+from dice_models import FusedDiceTransform, collectVariations, createDiceModel, exportDiceModel
+
+
+@pytest.fixture
+def autoencoder():
+    torch.manual_seed(0)
+    return createDiceModel("conv_auto_enc", num_channels=1).eval()
+
+
+def test_fused_transform_matches_variations(autoencoder):
+    pattern = (torch.rand(2, 1, 16, 16) > 0.8).float()
+    noise = torch.rand(2, 1, 16, 16) * 2 - 1
+    noise_level = torch.tensor([0.0, 0.3])
+    threshold = torch.tensor([0.5, 0.4])
+
+    with torch.no_grad():
+        fused = FusedDiceTransform(autoencoder)(pattern, noise, noise_level, threshold)
+        outputs = autoencoder(torch.flip(pattern, dims=[-1]) + noise * noise_level.reshape(-1, 1, 1, 1))
+
+    assert fused.dtype == torch.uint8
+    for i in range(2):
+        expected = collectVariations(outputs[i:i + 1].numpy(), [0], [0.0], [float(threshold[i])])[0]
+        assert np.array_equal(fused[i, 0].numpy(), expected.patterns[0])
+
+
+@pytest.mark.parametrize("fused", [False, True])
+def test_dynamic_batch_export(tmp_path, autoencoder, fused):
+    path = str(tmp_path / "model.onnx")
+    exportDiceModel(autoencoder, path, dynamic_batch=True, fused=fused)
+
+    session = ort.InferenceSession(path)
+    pattern = (torch.rand(5, 1, 16, 16) > 0.8).float()
+    if fused:
+        inputs = (pattern, torch.rand(5, 1, 16, 16) * 2 - 1, torch.full((5,), 0.2), torch.full((5,), 0.5))
+        with torch.no_grad():
+            expected = FusedDiceTransform(autoencoder)(*inputs).numpy()
+    else:
+        inputs = (pattern,)
+        with torch.no_grad():
+            expected = autoencoder(pattern).numpy()
+
+    names = [model_input.name for model_input in session.get_inputs()]
+    outputs = session.run(None, {name: tensor.numpy() for name, tensor in zip(names, inputs)})[0]
+
+    assert outputs.shape == (5, 1, 16, 16)
+    if fused:
+        assert outputs.dtype == np.uint8
+        assert np.array_equal(outputs, expected)
+    else:
+        np.testing.assert_allclose(outputs, expected, atol=1e-5)
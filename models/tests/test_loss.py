@@ -75,3 +75,30 @@ def test_L1_invalid_target_with_penalty(ones_and_zeros_random_pattern_config):
     loss = mse_loss(tensor, tensor, penalty_factor=10)
 
     assert loss == 0
+
+
+def test_MSE_penalty_applied_per_sample(ones_and_zeros_random_pattern_config):
+    target = torch.zeros(2, 1, 4, 16, dtype=torch.float32)
+    target[1] = 1  # polyphony of 4 exceeds the limit of 2
+    input = target + 0.5
+
+    mse_loss = MSELossWithPolyphonyRequirementsPenalty(
+        config=ones_and_zeros_random_pattern_config
+    )
+    loss = mse_loss(input, target, penalty_factor=10)
+
+    # valid sample contributes 0.25, invalid one 0.25 * 10
+    assert loss.item() == pytest.approx((0.25 + 2.5) / 2)
+
+
+def test_MSE_penalty_uses_trigger_channel(ones_and_zeros_random_pattern_config):
+    target = torch.zeros(1, 2, 4, 16, dtype=torch.float32)
+    target[:, 1] = 1  # dense velocity plane does not count as polyphony
+    input = target + 0.5
+
+    mse_loss = MSELossWithPolyphonyRequirementsPenalty(
+        config=ones_and_zeros_random_pattern_config
+    )
+    loss = mse_loss(input, target, penalty_factor=10)
+
+    assert loss.item() == pytest.approx(0.25)
@@ -0,0 +1,29 @@
+import pytest
+import torch
+
+from dice_models import RunningMetrics
+
+
+def test_running_metrics_average_by_samples():
+    metrics = RunningMetrics(torch.device("cpu"))
+    metrics.update(torch.tensor(1.0), batch_size=2)
+    metrics.update(torch.tensor(4.0), batch_size=1)
+
+    flushed = metrics.flush()
+
+    assert flushed["loss"] == pytest.approx(2.0)
+    assert flushed["steps"] == 2
+    assert flushed["samples"] == 3
+    assert flushed["samples_per_sec"] > 0
+    assert flushed["step_latency_ms"] >= 0
+
+
+def test_running_metrics_reset_after_flush():
+    metrics = RunningMetrics(torch.device("cpu"))
+    metrics.update(torch.tensor(1.0), batch_size=4)
+    metrics.flush()
+
+    flushed = metrics.flush()
+
+    assert flushed["loss"] == 0
+    assert flushed["samples"] == 0
@@ -0,0 +1,30 @@
+import torch
+
+from dice_models import BatchNoiseInjector
+
+
+def test_noise_injector_shapes():
+    injector = BatchNoiseInjector(torch.device("cpu"), noise_level=0.5, seed=0)
+    clean, noisy = injector(torch.ones(4, 16, 16))
+
+    assert clean.shape == (4, 1, 16, 16)
+    assert noisy.shape == (4, 1, 16, 16)
+    assert torch.equal(clean, torch.ones(4, 1, 16, 16))
+    assert not torch.equal(clean, noisy)
+
+
+def test_noise_injector_is_deterministic():
+    batches = [torch.zeros(4, 16, 16), torch.ones(2, 16, 16)]
+    first = BatchNoiseInjector(torch.device("cpu"), noise_level=0.2, seed=7)
+    second = BatchNoiseInjector(torch.device("cpu"), noise_level=0.2, seed=7)
+
+    for batch in batches:
+        assert torch.equal(first(batch)[1], second(batch)[1])
+
+
+def test_noise_injector_keeps_channels():
+    injector = BatchNoiseInjector(torch.device("cpu"), noise_level=0.5, seed=0)
+    clean, noisy = injector(torch.ones(4, 3, 16, 16))
+
+    assert clean.shape == (4, 3, 16, 16)
+    assert noisy.shape == (4, 3, 16, 16)
@@ -0,0 +1,39 @@
+import pytest
+import torch
+
+from dice_models import DicePrecision, createAutocast, createGradScaler, resolvePrecision
+
+
+def test_half_precision_falls_back_to_bf16_outside_cuda():
+    cpu = torch.device("cpu")
+
+    assert resolvePrecision("fp16", cpu) == DicePrecision.BF16
+    assert resolvePrecision("bf16", cpu) == DicePrecision.BF16
+    assert resolvePrecision("fp32", cpu) == DicePrecision.FP32
+    assert resolvePrecision("fp16", torch.device("cuda")) == DicePrecision.FP16
+
+
+def test_autocast_selects_dtype():
+    layer = torch.nn.Linear(4, 4)
+    inputs = torch.ones(2, 4)
+
+    with createAutocast("bf16", torch.device("cpu")):
+        assert layer(inputs).dtype == torch.bfloat16
+    with createAutocast(DicePrecision.FP32, torch.device("cpu")):
+        assert layer(inputs).dtype == torch.float32
+
+
+def test_grad_scaler_only_enabled_for_fp16():
+    cpu = torch.device("cpu")
+
+    assert not createGradScaler("bf16", cpu).is_enabled()
+    assert not createGradScaler("fp32", cpu).is_enabled()
+
+
+def test_unknown_precision_raises():
+    with pytest.raises(ValueError):
+        resolvePrecision("int4", torch.device("cpu"))
+    with pytest.raises(ValueError):
+        createAutocast("int4", torch.device("cpu"))
+    with pytest.raises(ValueError):
+        createGradScaler("int4", torch.device("cpu"))
@@ -0,0 +1,51 @@
+import pytest
+import torch
+
+from dice_models import createDiceModel, pruneDiceModel
+
+
+def count_parameters(model):
+    return sum(parameter.numel() for parameter in model.parameters())
+
+
+@pytest.mark.parametrize("architecture", ["conv_auto_enc", "att_unet"])
+def test_pruning_removes_hidden_channels(architecture):
+    torch.manual_seed(0)
+    model = createDiceModel(architecture, num_channels=1).eval()
+    parameters = count_parameters(model)
+
+    pruned = pruneDiceModel(model, amount=0.25)
+
+    assert count_parameters(pruned) < 0.8 * parameters
+    for module in pruned.modules():
+        if isinstance(module, torch.nn.BatchNorm2d):
+            assert module.running_mean.shape == (module.num_features,)
+    with torch.no_grad():
+        assert pruned(torch.rand(2, 1, 16, 16)).shape == (2, 1, 16, 16)
+
+
+def test_pruning_keeps_block_outputs():
+    torch.manual_seed(0)
+    model = pruneDiceModel(createDiceModel("att_unet", num_channels=1).eval(), amount=0.5)
+
+    assert model.bridge.conv1.out_channels == 128
+    assert model.bridge.conv2.in_channels == 128
+    assert model.bridge.conv2.out_channels == 256
+    assert model.decoder1.attention.W_g[0].out_channels == 64
+    assert model.decoder1.attention.W_x[0].out_channels == 64
+    assert model.decoder1.attention.psi[0].in_channels == 64
+    assert model.final_conv.in_channels == 64
+
+
+def test_pruning_nothing_keeps_outputs():
+    torch.manual_seed(0)
+    model = createDiceModel("conv_auto_enc", num_channels=1).eval()
+    tensor = torch.rand(2, 1, 16, 16)
+    with torch.no_grad():
+        expected = model(tensor)
+        assert torch.equal(pruneDiceModel(model, amount=0.0)(tensor), expected)
+
+
+def test_pruning_amount_is_checked():
+    with pytest.raises(ValueError):
+        pruneDiceModel(createDiceModel("conv_auto_enc"), amount=1.0)
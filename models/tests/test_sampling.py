@@ -0,0 +1,62 @@
+import json
+import pytest
+import torch
+
+from dice_models import DiceSampler, createDiceModel, createNoiseSchedule, loadDiceRun
+
+
+@pytest.fixture
+def autoencoder():
+    torch.manual_seed(0)
+    return createDiceModel("conv_auto_enc", num_channels=1)
+
+
+def test_noise_schedule_decreases():
+    schedule = createNoiseSchedule(4, 0.6, 0.0)
+
+    assert schedule.tolist() == pytest.approx([0.6, 0.4, 0.2, 0.0])
+    with pytest.raises(ValueError):
+        createNoiseSchedule(0, 0.5)
+
+
+def test_sampler_seeds_do_not_depend_on_batch(autoencoder):
+    sampler = DiceSampler(autoencoder, createNoiseSchedule(3, 0.5), early_exit=False)
+    pattern = (torch.rand(1, 16, 16) > 0.7).float()
+
+    batch = sampler(pattern, [1, 2, 3])
+    single = sampler(pattern, [2])
+
+    assert batch.patterns.shape == (3, 1, 16, 16)
+    assert batch.steps == 3
+    assert torch.equal(batch.patterns[1], single.patterns[0])
+    assert set(batch.patterns.unique().tolist()) <= {0.0, 1.0}
+
+
+def test_sampler_exits_when_pattern_is_stable():
+    # Constant outputs binarize to the same pattern from the second step
+    model = torch.nn.Conv2d(1, 1, kernel_size=1)
+    torch.nn.init.zeros_(model.weight)
+    torch.nn.init.ones_(model.bias)
+
+    early = DiceSampler(model, createNoiseSchedule(5, 0.5))
+    full = DiceSampler(model, createNoiseSchedule(5, 0.5), early_exit=False)
+    pattern = torch.zeros(4, 16, 16)
+
+    assert early(pattern, range(4)).steps == 2
+    assert full(pattern, range(4)).steps == 5
+    assert torch.equal(early(pattern, range(4)).patterns, full(pattern, range(4)).patterns)
+
+
+def test_load_dice_run(tmp_path, autoencoder):
+    run_path = str(tmp_path / "run")
+    torch.save(autoencoder.state_dict(), run_path + ".pth")
+    with open(run_path + ".json", "w") as file:
+        json.dump({"architecture": "conv_auto_enc"}, file)
+
+    model, run = loadDiceRun(run_path)
+
+    assert run["channels"] == ["triggers"]
+    assert not model.training
+    tensor = torch.rand(2, 1, 16, 16)
+    with torch.no_grad():
+        assert torch.equal(model(tensor), autoencoder.eval()(tensor))
@@ -0,0 +1,117 @@
+import json
+import numpy as np
+import onnx
+import pytest
+import threading
+import time
+import urllib.error
+import urllib.request
+
+import dice_models.serving as serving
+
+from onnx import TensorProto, helper
+from dice_models.serving import InferenceService, SessionPool, cooToMatrix, createInferenceServer, matrixToCoo
+
+
+@pytest.fixture
+def dist_path(tmp_path):
+    # Identity model with a dynamic batch axis, saved as dist/identity/identity.onnx
+    graph = helper.make_graph(
+        [helper.make_node("Identity", ["input"], ["output"])], "identity",
+        [helper.make_tensor_value_info("input", TensorProto.FLOAT, ["batch", 1, 16, 16])],
+        [helper.make_tensor_value_info("output", TensorProto.FLOAT, ["batch", 1, 16, 16])])
+    model = helper.make_model(graph, opset_imports=[helper.make_opsetid("", 11)])
+    model.ir_version = 8
+    (tmp_path / "identity").mkdir()
+    onnx.save(model, str(tmp_path / "identity" / "identity.onnx"))
+    return str(tmp_path)
+
+
+def test_coo_round_trip():
+    matrix = cooToMatrix([1, 1, 16, 3, 2, 16])
+
+    assert matrix.sum() == 3 and matrix[15, 2] == 1
+    assert matrixToCoo(matrix) == [1, 1, 2, 16, 16, 3]
+    with pytest.raises(ValueError):
+        cooToMatrix([0, 1])
+    with pytest.raises(ValueError):
+        cooToMatrix([1, 2, 3])
+
+
+def test_session_pool_reuses_sessions(dist_path):
+    pool = SessionPool(dist_path, pool_size=2)
+
+    with pool.acquire("identity") as first:
+        with pool.acquire("identity") as second:
+            assert first is not second
+    with pool.acquire("identity") as again:
+        assert again in (first, second)
+    with pytest.raises(FileNotFoundError):
+        pool.load("missing")
+    with pytest.raises(ValueError):
+        pool.load("../identity")
+
+
+def test_concurrent_requests_are_batched(dist_path):
+    service = InferenceService(SessionPool(dist_path), window_ms=50, max_batch=8)
+    batcher = service.batcher("identity")
+    matrices = [cooToMatrix([i + 1, i + 1]) for i in range(5)]
+
+    futures = [batcher.submit(matrix, 0.0, i, 0.5) for i, matrix in enumerate(matrices)]
+
+    for future, matrix in zip(futures, matrices):
+        assert np.array_equal(future.result(timeout=5), matrix)
+
+
+def test_http_endpoint(dist_path):
+    service = InferenceService(SessionPool(dist_path), window_ms=1)
+    server = createInferenceServer(service, port=0)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f"http://127.0.0.1:{server.server_address[1]}/models/identity"
+
+    try:
+        body = json.dumps({"coo": [1, 2, 4, 8], "noiseLevel": 0.3, "noiseSeed": 1, "threshold": 0.5})
+        with urllib.request.urlopen(urllib.request.Request(url, body.encode())) as response:
+            # Noise below the threshold margin keeps the identity pattern
+            assert json.load(response) == {"coo": [1, 2, 4, 8]}
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def post_error(service, model_id="identity"):
+    server = createInferenceServer(service, port=0)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f"http://127.0.0.1:{server.server_address[1]}/models/{model_id}"
+    try:
+        with pytest.raises(urllib.error.HTTPError) as error:
+            urllib.request.urlopen(urllib.request.Request(url, json.dumps({"coo": [1, 1]}).encode()))
+        return error.value.code, json.load(error.value)
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def test_http_endpoint_reports_runtime_errors(dist_path, monkeypatch):
+    def fail(session, batch):
+        raise RuntimeError("session failed")
+    monkeypatch.setattr(serving, "runSession", fail)
+
+    status, body = post_error(InferenceService(SessionPool(dist_path), window_ms=1))
+
+    assert status == 500
+    assert "session failed" in body["error"]
+
+
+def test_http_endpoint_reports_timeouts(dist_path, monkeypatch):
+    run_session = serving.runSession
+
+    def slow(session, batch):
+        time.sleep(0.5)
+        return run_session(session, batch)
+    monkeypatch.setattr(serving, "runSession", slow)
+
+    status, body = post_error(InferenceService(SessionPool(dist_path), window_ms=1, timeout=0.05))
+
+    assert status == 504
+    assert "error" in body
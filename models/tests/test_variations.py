@@ -0,0 +1,45 @@
+import numpy as np
+import torch
+
+from dice_models import collectVariations, createVariationBatch, generateVariations
+
+
+def test_variation_batch_flips_and_scales_noise():
+    pattern = np.zeros((16, 16), dtype=np.uint8)
+    pattern[0, 0] = 1
+
+    batch = createVariationBatch(pattern, noise_seeds=[3, 4], noise_levels=[0.0, 0.5, 1.0])
+
+    assert batch.shape == (6, 1, 16, 16)
+    # No noise leaves the flipped pattern
+    assert batch[0, 0, 0, 15] == 1 and batch[0, 0].sum() == 1
+    # Levels scale the same noise matrix of a noise seed
+    np.testing.assert_allclose(batch[2] - batch[0], 2 * (batch[1] - batch[0]), atol=1e-6)
+    assert np.abs(batch[2] - batch[0]).max() <= 1
+    assert not np.array_equal(batch[2], batch[5])
+
+
+def test_variations_thresholded_from_one_output():
+    outputs = np.tile(np.linspace(0, 1, 16, dtype=np.float32), (16, 1))[None, None]
+
+    variations = collectVariations(outputs, noise_seeds=[0], noise_levels=[0.1],
+                                   thresholds=[0.5, 0.52, 0.9])[0]
+
+    # 0.5 and 0.52 keep the same steps, outputs are flipped back
+    assert len(variations.patterns) == 2
+    assert variations.index.tolist() == [0, 0, 1]
+    assert variations.patterns[0, 0].tolist() == [1] * 8 + [0] * 8
+    assert variations.parameters_of(1).tolist() == [[0, 0.1, 0.9]]
+
+
+def test_generate_variations_matches_single_inputs():
+    model = torch.nn.Conv2d(1, 1, kernel_size=3, padding=1)
+    inputs = (np.random.default_rng(0).random((2, 16, 16)) > 0.8).astype(np.uint8)
+    grid = dict(noise_seeds=[1, 2], noise_levels=[0.1, 0.4], thresholds=[0.2, 0.5])
+
+    both = generateVariations(model, inputs, **grid)
+    second = generateVariations(model, inputs[1], **grid)[0]
+
+    assert len(both) == 2
+    assert np.array_equal(both[1].patterns, second.patterns)
+    assert both[1].index.shape == (8,)